@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import click
+import json
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from mock_api import MockTwitterAPI, SyntheticData, BASE_USER_ID, BASE_TWEET_ID, write_credentials
+from twesearch.lib.neo4j_importer import build_tweet_stages, build_user_stages
+from twesearch.lib.tweet_util import extract_expansions_and_tweets
+from twesearch.lib.util import format_tweets_for_neo4j
+
+logging.disable(logging.WARNING)
+
+# Far above what the mock will see, so the rate limiter never paces a run
+MOCK_RATE_LIMITS = {api: (1000000, 900) for api in ('search', 'timeline', 'tweets', 'users', 'users_by_name',
+                                                   'followers', 'following', 'retweeted_by')}
+
+
+def fetch_messages(base_url, path, params, pages, pagination_param):
+    """
+    Pages straight from the mock, in the message format searchtweets yields: data, includes, meta
+    """
+    results = []
+    params = dict(params)
+    for _ in range(pages):
+        with urlopen(f'{base_url}{path}?{urlencode(params)}') as response:
+            body = json.load(response)
+        results += body.get('data', []) + ([body['includes']] if 'includes' in body else []) + [body['meta']]
+        if 'next_token' not in body['meta']:
+            break
+        params[pagination_param] = body['meta']['next_token']
+    return results
+
+def timed(name, run, count_records, server, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        requests_before, bytes_before = sum(server.request_counts.values()), server.bytes_sent
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    records = count_records(result)
+    requests = sum(server.request_counts.values()) - requests_before
+    mb = (server.bytes_sent - bytes_before) / 2 ** 20
+    print(f"{name:<40} {records:>9} {best:>9.3f} {records / best:>12.0f} {requests:>9} {mb:>8.1f}")
+    return result
+
+def count_stage_rows(stages):
+    return sum(len(stage[2]) for stage in stages)
+
+def tweets_and_users(result):
+    return len(result['tweets']) + len(result['users'])
+
+def twesearch_benchmarks(server, tweets, followers, users, repeat, compact):
+    from twesearch.twesearch import Twesearch
+    search = Twesearch(rate_limits=MOCK_RATE_LIMITS, compact=compact)
+    user_id = str(BASE_USER_ID + 1)
+    user_ids = [str(BASE_USER_ID + i) for i in range(users)]
+    tweet_ids = [str(BASE_TWEET_ID + i) for i in range(0, min(tweets, server.data.total), 1)]
+
+    timed('Twesearch.search_tweets', lambda: search.search_tweets('mock', max_results=tweets),
+          tweets_and_users, server, repeat)
+    timed('Twesearch.get_users_timeline_tweets', lambda: search.get_users_timeline_tweets(user_id, max_results=tweets),
+          tweets_and_users, server, repeat)
+    timed('Twesearch.iter_followers', lambda: [p for p in search.iter_followers(user_id, max_results=followers)],
+          lambda pages: sum(len(p['users']) for p in pages), server, repeat)
+    timed('Twesearch.get_users', lambda: search.get_users(user_ids), tweets_and_users, server, repeat)
+    timed('Twesearch.get_tweets_by_ids', lambda: search.get_tweets_by_ids(tweet_ids), tweets_and_users, server, repeat)
+
+@click.command()
+@click.option('-t', '--tweets', default=10000, help='Tweets per search, timeline and lookup')
+@click.option('-f', '--followers', default=50000, help='Followers fetched per user')
+@click.option('-u', '--users', default=5000, help='Users looked up by id')
+@click.option('-r', '--repeat', default=3, help='Runs per measurement, the fastest is reported')
+@click.option('-l', '--latency', default=0.0, help='Seconds the mock waits before every response')
+@click.option('-c', '--compact', is_flag=True, help='Keep tweets and users as compact records')
+@click.option('--offline-only', is_flag=True, help="Skip the Twesearch benchmarks, which need twesearch's searchtweets fork")
+def main(tweets, followers, users, repeat, latency, compact, offline_only):
+    data = SyntheticData(total=max(tweets * 2, 1000), authors=max(tweets // 5, 100), followers=followers)
+    server = MockTwitterAPI(data=data, latency=latency).start()
+    home = tempfile.mkdtemp()
+    write_credentials(home, server.base_url)
+    os.environ['HOME'] = home
+    print(f"Mock Twitter API on {server.base_url}, credentials in {home}")
+    print(f"{'benchmark':<40} {'records':>9} {'best (s)':>9} {'records/s':>12} {'requests':>9} {'MB':>8}")
+
+    if not offline_only:
+        twesearch_benchmarks(server, tweets, followers, users, repeat, compact)
+
+    pages = -(-tweets // 100)
+    results = timed('fetch raw search pages', lambda: fetch_messages(server.base_url, '/2/tweets/search/recent',
+                                                                      {'query': 'mock', 'max_results': 100}, pages, 'next_token'),
+                    len, server, 1)
+    extracted = timed('extract_expansions_and_tweets', lambda: extract_expansions_and_tweets(results, compact=compact),
+                      tweets_and_users, server, repeat)
+    formatted = timed('format_tweets_for_neo4j', lambda: format_tweets_for_neo4j(extracted['tweets'], extracted['users']),
+                      len, server, repeat)
+    timed('build_tweet_stages', lambda: build_tweet_stages(formatted),
+          count_stage_rows, server, repeat)
+    timed('build_user_stages', lambda: build_user_stages(extracted['users']),
+          count_stage_rows, server, repeat)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import click
+import logging
+import time
+
+from twesearch.lib.util import format_tweets_for_neo4j, index_by_id
+
+logging.disable(logging.WARNING)
+
+
+def make_result_set(size):
+    users = [{'id': str(i), 'username': f'user{i}', 'public_metrics': {'followers_count': i}}
+             for i in range(size)]
+    tweets = [{'id': str(10 ** 12 + i), 'author_id': str((i * 7919) % size), 'text': f'tweet {i}'}
+              for i in range(size)]
+    return tweets, users
+
+def linear_join(tweets, users):
+    return [[u for u in users if u['id'] == t['author_id']][0] for t in tweets]
+
+def indexed_join(tweets, users):
+    users_by_id = index_by_id(users)
+    return [users_by_id[t['author_id']] for t in tweets]
+
+@click.command()
+@click.option('-s', '--sizes', default='10000,100000,1000000')
+@click.option('-l', '--linear-sample', default=200, help='Tweets joined with the linear scan; the full cost is extrapolated from the sample')
+def main(sizes, linear_sample):
+    print(f"{'records':>10} {'linear scan (s)':>16} {'indexed (s)':>12} {'format (s)':>11} {'speedup':>10}")
+    for size in [int(s) for s in sizes.split(',')]:
+        tweets, users = make_result_set(size)
+
+        sample = tweets[:min(linear_sample, size)]
+        start = time.perf_counter()
+        linear_join(sample, users)
+        linear_seconds = (time.perf_counter() - start) * size / len(sample)
+
+        start = time.perf_counter()
+        indexed_join(tweets, users)
+        indexed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        format_tweets_for_neo4j(tweets, users)
+        format_seconds = time.perf_counter() - start
+
+        print(f"{size:>10} {linear_seconds:>16.2f} {indexed_seconds:>12.4f} {format_seconds:>11.2f} {linear_seconds / indexed_seconds:>9.0f}x")
+
+if __name__ == '__main__':
+    main()
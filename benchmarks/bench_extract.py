@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+import click
+import logging
+import time
+
+from twesearch.lib.tweet_util import ResultNormalizer, add_timestamp_to_list_items, dedupe_tweets
+
+logging.disable(logging.WARNING)
+
+
+def make_pages(pages, page_size):
+    """
+    Message-format search results: data tweets, then the includes object, then meta, per page.
+    Referenced tweets and authors repeat across pages the way they do in real searches.
+    """
+    results = []
+    for p in range(pages):
+        start = p * page_size
+        tweets = [{'id': str(10 ** 12 + i), 'author_id': str(i % 500), 'text': f'tweet {i}'}
+                  for i in range(start, start + page_size)]
+        includes = {'users': [{'id': str(i % 500), 'username': f'user{i % 500}'} for i in range(start, start + page_size)],
+                    'tweets': [{'id': str(10 ** 11 + i % 1000), 'text': f'referenced {i % 1000}'} for i in range(start, start + page_size // 4)],
+                    'places': [{'id': f'place{p % 20}', 'full_name': f'Place {p % 20}'}]}
+        meta = {'result_count': page_size, 'newest_id': tweets[-1]['id'], 'oldest_id': tweets[0]['id']}
+        results += tweets + [includes, meta]
+    return results
+
+def legacy_extract(results):
+    """
+    The multi-pass implementation ResultNormalizer replaced, kept here for comparison
+    """
+    tweets = [i for i in results if 'text' in i.keys()]
+    expanded_tweets = [t for i in [e['tweets'] for e in results if 'tweets' in e.keys()] for t in i if 'text' in t.keys()]
+    users = [i for i in results if 'username' in i.keys()]
+    expanded_users = [t for i in [e['users'] for e in results if 'users' in e.keys()] for t in i]
+    tweets = tweets + expanded_tweets
+    total = sum([x['result_count'] for x in results if 'result_count' in x.keys()])
+    tweets = dedupe_tweets(add_timestamp_to_list_items(tweets))
+    users = add_timestamp_to_list_items(users + expanded_users)
+    return {'tweets': tweets, 'users': users, 'counts': {'total_tweets_count': total, 'dedupe_tweets_count': len(tweets)}}
+
+def normalizer_extract(results, page_items):
+    normalizer = ResultNormalizer()
+    for i in range(0, len(results), page_items):
+        normalizer.add(results[i:i + page_items])
+    return normalizer.result()
+
+@click.command()
+@click.option('-p', '--pages', default='10,100,1000', help='Comma separated numbers of pages to normalize')
+@click.option('-s', '--page-size', default=100)
+@click.option('-r', '--repeat', default=3, help='Runs per measurement, the fastest is reported')
+def main(pages, page_size, repeat):
+    print(f"{'pages':>7} {'items':>9} {'legacy (s)':>11} {'single pass (s)':>16} {'speedup':>8} {'users legacy/deduped':>21}")
+    for page_count in [int(p) for p in pages.split(',')]:
+        results = make_pages(page_count, page_size)
+        page_items = page_size + 2
+
+        legacy_seconds = single_seconds = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            legacy = legacy_extract(results)
+            legacy_seconds = min(legacy_seconds, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            single = normalizer_extract(results, page_items)
+            single_seconds = min(single_seconds, time.perf_counter() - start)
+
+        assert {t['id'] for t in legacy['tweets']} == {t['id'] for t in single['tweets']}
+        assert legacy['counts'] == single['counts']
+        users = f"{len(legacy['users'])}/{len(single['users'])}"
+        print(f"{page_count:>7} {len(results):>9} {legacy_seconds:>11.4f} {single_seconds:>16.4f} {legacy_seconds / single_seconds:>7.1f}x {users:>21}")
+
+if __name__ == '__main__':
+    main()
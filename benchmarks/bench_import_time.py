@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import click
+import json
+import os
+import subprocess
+import sys
+
+# Module: import time budget in milliseconds, on a warm bytecode cache
+BUDGETS = {
+    'twesearch': 5,
+    'twesearch.lib.records': 10,
+    'twesearch.lib.util': 15,
+    'twesearch.lib.tweet_util': 30,
+    'twesearch.lib.neo4j_importer': 30,
+    'twesearch.lib.couchbase_importer': 30,
+    'twesearch.lib.easy_importer': 40,
+    'twesearch.lib.crawler_state': 60,
+    'twesearch.lib.spool': 20,
+    'twesearch.lib.query_registry': 10,
+    'twesearch.lib.metrics': 10,
+    'twesearch.twesearch': 250,
+}
+
+# Only twesearch.twesearch may load these (searchtweets), everything else should leave them to first use
+HEAVY_MODULES = ('searchtweets', 'tweepy', 'requests', 'neo4j', 'couchbase')
+
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+'''
+
+
+def probe(module, cwd):
+    """
+    Imports module in a fresh interpreter. Returns (milliseconds, heavy modules it loaded)
+    """
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=cwd, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=cwd))
+    if output.returncode:
+        return None, output.stderr.strip().splitlines()[-1]
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    return result['ms'], result['heavy']
+
+@click.command()
+@click.option('-r', '--repeat', default=5, help='Fresh interpreters per module, the fastest is reported')
+@click.option('-m', '--module', 'modules', multiple=True, help='Only measure these modules')
+@click.option('-s', '--strict', is_flag=True, help='Exit 1 when a module is over budget or loads a heavy module it should not')
+def main(repeat, modules, strict):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    over = 0
+    print(f"{'module':<36} {'best (ms)':>10} {'budget':>7}  heavy modules loaded")
+    for module in modules or BUDGETS:
+        runs = [probe(module, root) for _ in range(repeat)]
+        if runs[0][0] is None:
+            print(f"{module:<36} {'failed':>10} {BUDGETS.get(module, '-'):>7}  {runs[0][1]}")
+            continue
+        best = min(ms for ms, _ in runs)
+        heavy = runs[0][1]
+        budget = BUDGETS.get(module)
+        failed = (budget is not None and best > budget) or (bool(heavy) and module != 'twesearch.twesearch')
+        over += failed
+        print(f"{module:<36} {best:>10.1f} {budget or '-':>7}  {', '.join(heavy) or '-'}{'  OVER' if failed else ''}")
+    if strict and over:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+import click
+import logging
+import random
+import string
+import time
+
+from twesearch.lib.query_registry import QueryRegistry
+
+logging.disable(logging.WARNING)
+
+
+def random_terms(count, rng, length=(4, 14)):
+    return [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(*length))) for _ in range(count)]
+
+def legacy_delta(new_queries, existing_queries):
+    """
+    The scan add_query.py used to do: every new term against every existing query
+    """
+    return [q.lower() for q in new_queries if not any(q.lower() in x for x in existing_queries)]
+
+@click.command()
+@click.option('-e', '--existing', default=20000, help='Queries already in the query file')
+@click.option('-n', '--new', default=50000, help='Terms being merged in')
+@click.option('-l', '--legacy-sample', default=500, help='New terms run through the legacy scan; its full cost is extrapolated from the sample')
+def main(existing, new, legacy_sample):
+    rng = random.Random(0)
+    existing_queries = ['#' + t for t in random_terms(existing, rng)]
+    # Roughly a quarter of the new terms are already covered by an existing query
+    new_terms = [q[1:] if rng.random() < 0.25 else t for q, t in zip(rng.choices(existing_queries, k=new), random_terms(new, rng))]
+
+    sample = new_terms[:legacy_sample]
+    start = time.perf_counter()
+    legacy = legacy_delta(sample, existing_queries)
+    legacy_seconds = (time.perf_counter() - start) * new / len(sample)
+
+    start = time.perf_counter()
+    registry = QueryRegistry({'query': q, 'active': True} for q in existing_queries)
+    delta = registry.delta(new_terms, min_length=0)
+    registry_seconds = time.perf_counter() - start
+
+    assert [t for t in delta if t in set(sample)] == [t for t in dict.fromkeys(legacy)]
+
+    # What add_query.py -u does next: add the delta and pick the queries to write back to the file
+    start = time.perf_counter()
+    file_queries = {id(q) for q in registry.queries()}
+    added = registry.add([{'query': q, 'active': True} for q in delta])
+    added_ids = {id(q) for q in added}
+    rewrite = [q for q in registry.queries() if id(q) in file_queries or id(q) in added_ids]
+    rewrite_seconds = time.perf_counter() - start
+    assert len(rewrite) == len(file_queries) + len(added)
+    print(f'{existing} existing queries, {new} new terms, {len(delta)} new queries')
+    print(f'legacy scan: {legacy_seconds:.1f}s (extrapolated from {len(sample)} terms)')
+    print(f'registry:    {registry_seconds:.2f}s, {legacy_seconds / registry_seconds:.0f}x faster')
+    print(f'add and rewrite: {rewrite_seconds:.2f}s')
+
+if __name__ == '__main__':
+    main()
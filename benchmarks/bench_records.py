@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import click
+import copy
+import gc
+import logging
+import tracemalloc
+
+from twesearch.lib.neo4j_importer import build_tweet_stages
+from twesearch.lib.records import compact_tweet, compact_user
+from twesearch.lib.util import format_tweets_for_neo4j
+
+logging.disable(logging.WARNING)
+
+LANGS = ['en', 'es', 'pt', 'fr', 'de', 'und']
+SOURCES = ['Twitter for iPhone', 'Twitter for Android', 'Twitter Web App', 'TweetDeck']
+
+
+def make_results(size, authors):
+    timestamp = '2021-06-01T12:00:00.000000'
+    users = [{'id': str(2 * 10 ** 9 + i), 'username': f'user{i}', 'name': f'User {i}',
+              'created_at': '2012-03-04T05:06:07.000Z', 'description': f'bio {i}', 'location': 'Somewhere',
+              'profile_image_url': f'https://pbs.twimg.com/profile_images/{i}/a_normal.jpg', 'protected': False,
+              'verified': False, 'public_metrics': {'followers_count': i, 'following_count': 10, 'tweet_count': 100, 'listed_count': 1},
+              'fetched_timestamp': timestamp}
+             for i in range(authors)]
+    tweets = []
+    for i in range(size):
+        tweet_id = str(1400000000000000000 + i)
+        tweets.append({'id': tweet_id, 'author_id': users[i % authors]['id'], 'text': f'tweet number {i} #tag{i % 50}',
+                       'created_at': '2021-06-01T00:00:00.000Z', 'lang': LANGS[i % len(LANGS)], 'source': SOURCES[i % len(SOURCES)],
+                       'conversation_id': tweet_id, 'possibly_sensitive': False,
+                       'public_metrics': {'retweet_count': i % 7, 'reply_count': 0, 'like_count': i % 13, 'quote_count': 0},
+                       'referenced_tweets': [{'type': 'retweeted', 'id': str(1300000000000000000 + i)}],
+                       'entities': {'hashtags': [{'start': 16, 'end': 22, 'tag': f'tag{i % 50}'}]},
+                       'fetched_timestamp': timestamp})
+    return tweets, users
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current, peak
+
+@click.command()
+@click.option('-s', '--size', default=100000, help='Tweets per measurement')
+@click.option('-a', '--authors', default=10000)
+def main(size, authors):
+    tweets, users = make_results(size, authors)
+
+    def as_dicts():
+        ts, us = copy.deepcopy(tweets), copy.deepcopy(users)
+        return ts, us, format_tweets_for_neo4j(ts, us)
+
+    def as_records():
+        ts = [compact_tweet(t) for t in copy.deepcopy(tweets)]
+        us = [compact_user(u) for u in copy.deepcopy(users)]
+        return ts, us, format_tweets_for_neo4j(ts, us)
+
+    dict_stages = build_tweet_stages(format_tweets_for_neo4j(tweets, users))
+    record_stages = build_tweet_stages(as_records()[2])
+    assert [(n, r) for n, _, r, _ in dict_stages] == [(n, r) for n, _, r, _ in record_stages]
+
+    print(f"{'representation':>16} {'retained (MB)':>14} {'peak (MB)':>10} {'bytes/tweet':>12}")
+    results = {}
+    for name, build in [('dicts', as_dicts), ('records', as_records)]:
+        current, peak = measure(build)
+        results[name] = current
+        print(f"{name:>16} {current / 2 ** 20:>14.1f} {peak / 2 ** 20:>10.1f} {current / size:>12.0f}")
+    print(f"records retain {100 * (1 - results['records'] / results['dicts']):.0f}% less for {size} tweets with neo4j formatting")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+import click
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import yaml
+
+BASE_TWEET_ID = 1400000000000000000
+BASE_USER_ID = 2000000000
+LANGS = ['en', 'es', 'pt', 'fr', 'de', 'und']
+SOURCES = ['Twitter for iPhone', 'Twitter for Android', 'Twitter Web App', 'TweetDeck']
+
+# v2 paths, mapped to the api names twesearch's rate limiter uses
+ROUTES = [
+    (re.compile(r'/2/tweets/search/(recent|all)$'), 'search'),
+    (re.compile(r'/2/tweets/(?P<id>\d+)/retweeted_by$'), 'retweeted_by'),
+    (re.compile(r'/2/tweets$'), 'tweets'),
+    (re.compile(r'/2/users/(?P<id>\d+)/tweets$'), 'timeline'),
+    (re.compile(r'/2/users/(?P<id>\d+)/followers$'), 'followers'),
+    (re.compile(r'/2/users/(?P<id>\d+)/following$'), 'following'),
+    (re.compile(r'/2/users/by$'), 'users_by_name'),
+    (re.compile(r'/2/users$'), 'users'),
+]
+
+
+class SyntheticData:
+    """
+    Deterministic v2 objects: tweet n is always the same tweet, user n the same user. Tweets
+    are spread over `authors` users, a share of them retweet or quote an earlier tweet and
+    some carry a place, so responses have realistic includes.
+    """
+
+    def __init__(self, total=10000, authors=2000, followers=50000):
+        self.total = total
+        self.authors = authors
+        self.followers = followers
+
+    def user(self, n):
+        return {'id': str(BASE_USER_ID + n), 'username': f'user{n}', 'name': f'User {n}',
+                'created_at': '2012-03-04T05:06:07.000Z', 'description': f'Bio of user {n} #tag{n % 50}',
+                'location': ['Somewhere', 'Elsewhere', ''][n % 3], 'protected': False, 'verified': n % 97 == 0,
+                'profile_image_url': f'https://pbs.twimg.com/profile_images/{n}/a_normal.jpg',
+                'url': f'https://t.co/u{n}' if n % 4 == 0 else '',
+                'entities': {'description': {'hashtags': [{'start': 15, 'end': 21, 'tag': f'tag{n % 50}'}]}},
+                'public_metrics': {'followers_count': n * 7 % 100000, 'following_count': n % 1000,
+                                   'tweet_count': n * 3 % 50000, 'listed_count': n % 20}}
+
+    def tweet(self, n):
+        tweet_id = str(BASE_TWEET_ID + n)
+        author = n % self.authors
+        tweet = {'id': tweet_id, 'author_id': str(BASE_USER_ID + author), 'conversation_id': tweet_id,
+                 'text': f'Tweet number {n} about #tag{n % 50} with @user{(n * 31) % self.authors} https://t.co/x{n}',
+                 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(1622505600 + n)),
+                 'lang': LANGS[n % len(LANGS)], 'source': SOURCES[n % len(SOURCES)], 'possibly_sensitive': False,
+                 'public_metrics': {'retweet_count': n % 7, 'reply_count': n % 3, 'like_count': n % 13, 'quote_count': n % 2},
+                 'entities': {'hashtags': [{'start': 22, 'end': 28, 'tag': f'tag{n % 50}'}],
+                              'mentions': [{'start': 34, 'end': 42, 'username': f'user{(n * 31) % self.authors}'}],
+                              'urls': [{'start': 43, 'end': 60, 'url': f'https://t.co/x{n}',
+                                        'expanded_url': f'https://example{n % 100}.com/article/{n}'}]}}
+        if n % 5 == 0 and n:
+            tweet['referenced_tweets'] = [{'type': 'retweeted' if n % 10 else 'quoted', 'id': str(BASE_TWEET_ID + n // 2)}]
+        if n % 20 == 0:
+            tweet['geo'] = {'place_id': f'place{n % 30}'}
+        return tweet
+
+    def place(self, place_id):
+        return {'id': place_id, 'full_name': f'Place {place_id}', 'country': 'US', 'country_code': 'US',
+                'name': place_id, 'place_type': 'city'}
+
+    def includes(self, tweets):
+        user_ids = {t['author_id'] for t in tweets}
+        referenced = [self.tweet(int(r['id']) - BASE_TWEET_ID) for t in tweets for r in t.get('referenced_tweets', [])]
+        user_ids.update(t['author_id'] for t in referenced)
+        places = {t['geo']['place_id'] for t in tweets if 'geo' in t}
+        includes = {'users': [self.user(int(u) - BASE_USER_ID) for u in sorted(user_ids)]}
+        if referenced:
+            includes['tweets'] = referenced
+        if places:
+            includes['places'] = [self.place(p) for p in sorted(places)]
+        return includes
+
+
+class MockTwitterAPI(ThreadingHTTPServer):
+    """
+    Local stand-in for the v2 search, timeline, tweet/user lookup, followers/following and
+    retweeted_by endpoints. Serves SyntheticData, or the recorded responses in recordings_dir
+    (one <api name>.json per endpoint holding a list of response bodies, served in turn and
+    chained with next_token). Pages like the real API and sends x-rate-limit-* headers; with
+    enforce_rate_limits a request over the limit gets a 429.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), data=None, recordings_dir=None, rate_limit=(100000, 900),
+                 enforce_rate_limits=False, latency=0.0):
+        super().__init__(address, MockHandler)
+        self.data = data or SyntheticData()
+        self.recordings = {}
+        if recordings_dir:
+            for path in glob.glob(os.path.join(recordings_dir, '*.json')):
+                with open(path) as f:
+                    self.recordings[os.path.basename(path)[:-len('.json')]] = json.load(f)
+        self.rate_limit = rate_limit
+        self.enforce_rate_limits = enforce_rate_limits
+        self.latency = latency
+        self.windows = {}
+        self.request_counts = {}
+        self.bytes_sent = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def take(self, api):
+        """
+        Counts a request against api's window. Returns (allowed, rate limit headers)
+        """
+        limit, window = self.rate_limit
+        now = time.time()
+        with self._lock:
+            self.request_counts[api] = self.request_counts.get(api, 0) + 1
+            start, used = self.windows.get(api, (now, 0))
+            if now >= start + window:
+                start, used = now, 0
+            allowed = not self.enforce_rate_limits or used < limit
+            if allowed:
+                used += 1
+            self.windows[api] = (start, used)
+        return allowed, {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(max(limit - used, 0)),
+                         'x-rate-limit-reset': str(int(start + window))}
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so clients that pool connections can reuse them
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        for pattern, api in ROUTES:
+            match = pattern.search(url.path)
+            if match:
+                break
+        else:
+            return self._send(404, {'title': 'Not Found Error', 'detail': f'No mock for {url.path}'})
+
+        allowed, headers = self.server.take(api)
+        if not allowed:
+            return self._send(429, {'title': 'Too Many Requests', 'detail': 'Too Many Requests'}, headers)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if api in self.server.recordings:
+            return self._send(200, self._recorded(api, params), headers)
+        return self._send(200, getattr(self, f'_{api}')(params, match.groupdict().get('id')), headers)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.server._lock:
+            self.server.bytes_sent += len(payload)
+
+    def _recorded(self, api, params):
+        pages = self.server.recordings[api]
+        index = int(params.get('next_token') or params.get('pagination_token') or 0)
+        body = json.loads(json.dumps(pages[index % len(pages)]))
+        body.setdefault('meta', {})
+        if index + 1 < len(pages):
+            body['meta']['next_token'] = str(index + 1)
+        else:
+            body['meta'].pop('next_token', None)
+        return body
+
+    def _page(self, items, params, default_size, token_param):
+        offset = int(params.get(token_param) or 0)
+        size = int(params.get('max_results') or default_size)
+        page = items[offset:offset + size]
+        meta = {'result_count': len(page)}
+        if offset + size < len(items):
+            meta['next_token'] = str(offset + size)
+        return page, meta
+
+    def _tweet_page(self, numbers, params, default_size, token_param):
+        data = self.server.data
+        since_id = int(params.get('since_id') or 0)
+        numbers = [n for n in numbers if BASE_TWEET_ID + n > since_id]
+        page, meta = self._page(numbers, params, default_size, token_param)
+        tweets = [data.tweet(n) for n in page]
+        if tweets:
+            meta.update({'newest_id': tweets[0]['id'], 'oldest_id': tweets[-1]['id']})
+            return {'data': tweets, 'includes': data.includes(tweets), 'meta': meta}
+        return {'meta': meta}
+
+    def _search(self, params, _):
+        # Newest first, like the API
+        return self._tweet_page(range(self.server.data.total - 1, -1, -1), params, 10, 'next_token')
+
+    def _timeline(self, params, user_id):
+        data = self.server.data
+        author = (int(user_id) - BASE_USER_ID) % data.authors
+        return self._tweet_page(range(data.total - data.authors + author, -1, -data.authors), params, 10, 'pagination_token')
+
+    def _follow_page(self, params, user_id, step):
+        data = self.server.data
+        numbers = list(range((int(user_id) - BASE_USER_ID) % step, data.followers, step))
+        page, meta = self._page(numbers, params, 100, 'pagination_token')
+        body = {'meta': meta}
+        if page:
+            body['data'] = [data.user(n) for n in page]
+        return body
+
+    def _followers(self, params, user_id):
+        return self._follow_page(params, user_id, 1)
+
+    def _following(self, params, user_id):
+        return self._follow_page(params, user_id, 7)
+
+    def _retweeted_by(self, params, tweet_id):
+        return self._follow_page(params, str(BASE_USER_ID + int(tweet_id) % 100), 3)
+
+    def _lookup(self, ids, make, max_value):
+        found, errors = [], []
+        for value, number in ids:
+            if 0 <= number < max_value:
+                found.append(make(number))
+            else:
+                errors.append({'value': value, 'detail': f'Could not find {value}', 'title': 'Not Found Error',
+                               'resource_type': 'user' if make == self.server.data.user else 'tweet',
+                               'type': 'https://api.twitter.com/2/problems/resource-not-found'})
+        body = {}
+        if found:
+            body['data'] = found
+        if errors:
+            body['errors'] = errors
+        return body
+
+    def _tweets(self, params, _):
+        data = self.server.data
+        ids = [(i, int(i) - BASE_TWEET_ID) for i in params.get('ids', '').split(',') if i]
+        body = self._lookup(ids, data.tweet, data.total)
+        if body.get('data'):
+            body['includes'] = data.includes(body['data'])
+        return body
+
+    def _users(self, params, _):
+        data = self.server.data
+        ids = [(i, int(i) - BASE_USER_ID) for i in params.get('ids', '').split(',') if i]
+        return self._lookup(ids, data.user, data.followers)
+
+    def _users_by_name(self, params, _):
+        data = self.server.data
+        names = [(u, int(u[4:]) if u.lower().startswith('user') and u[4:].isdigit() else -1)
+                 for u in params.get('usernames', '').split(',') if u]
+        return self._lookup(names, data.user, data.followers)
+
+
+def write_credentials(directory, base_url):
+    """
+    Writes a .twitter_keys.yaml pointing twesearch at the mock. Set HOME to directory before
+    creating a Twesearch to use it
+    """
+    path = os.path.join(directory, '.twitter_keys.yaml')
+    with open(path, 'w') as f:
+        yaml.dump({'search_tweets_v2': {'endpoint': f'{base_url}/2/tweets/search/recent',
+                                        'bearer_token': 'mock-bearer-token'}}, f)
+    return path
+
+@click.command()
+@click.option('-p', '--port', default=8099)
+@click.option('-t', '--total', default=10000, help='Tweets in the synthetic search results')
+@click.option('-a', '--authors', default=2000)
+@click.option('-f', '--followers', default=50000, help='Followers of each synthetic user')
+@click.option('-r', '--recordings-dir', help='Serve the recorded <api name>.json responses in this directory instead')
+@click.option('-l', '--rate-limit', default=100000, help='Requests per 15 minute window, per endpoint')
+@click.option('-e', '--enforce-rate-limits', is_flag=True, help='Answer requests over the limit with a 429')
+@click.option('--latency', default=0.0, help='Seconds to wait before every response')
+@click.option('-k', '--keys-dir', help='Write a .twitter_keys.yaml pointing at the mock into this directory')
+def main(port, total, authors, followers, recordings_dir, rate_limit, enforce_rate_limits, latency, keys_dir):
+    server = MockTwitterAPI(('127.0.0.1', port), SyntheticData(total, authors, followers), recordings_dir,
+                            (rate_limit, 900), enforce_rate_limits, latency)
+    if keys_dir:
+        print(f'Wrote {write_credentials(keys_dir, server.base_url)}')
+    print(f'Mock Twitter API listening on {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -2,29 +2,45 @@
 import click
 import yaml
 
+from twesearch.lib.crawler_state import CrawlerState
+from twesearch.lib.query_registry import QueryRegistry
+
+BLOCK_WORDS = ['cnn', 'crypto', 'az', 'breaking', 'fact', 'facts', 'fired', 
+    'florida', 'foxnews', 'freedom', 'frostedflakes', 'gif', 'gifs', 'giphy', 'joke', 
+    'msnbc','notsorry','phoenix', 'political', 'politics', 'racism', 'texas', 'tokyo2020', 'tokyoolympics',
+    'tonythetiger', 'world', 'worldwide']
+
 @click.command()
 @click.option('-n', '--new-query-file')
 @click.option('-e', '--existing-query-file')
 @click.option('-d', '--delta-output-file')
 @click.option('-u', '--update-query-file', is_flag=True)
 @click.option('-ht', '--hashtag', is_flag=True)
-def main(new_query_file, existing_query_file, delta_output_file, hashtag, update_query_file):
+@click.option('-s', '--state-db', help="Also add the new queries to the crawler's state store")
+@click.option('-x', '--deactivate-file', help='Deactivate the queries listed in this file, one per line')
+def main(new_query_file, existing_query_file, delta_output_file, hashtag, update_query_file, state_db, deactivate_file):
     
+    new_queries = []
     if new_query_file:
         with open(new_query_file) as i_f:
             new_queries = i_f.read().splitlines()
     
+    existing_queries_list = []
     if existing_query_file:
         with open(existing_query_file) as q_f:
-            existing_queries_list = yaml.full_load(q_f)
-    
-    existing_queries = [q['query'] for q in existing_queries_list]
-    delta_queries = [q.lower() for q in new_queries if not any(q.lower() in x for x in existing_queries)]
-    block_words = ['cnn', 'crypto', 'az', 'breaking', 'fact', 'facts', 'fired', 
-    'florida', 'foxnews', 'freedom', 'frostedflakes', 'gif', 'gifs', 'giphy', 'joke', 
-    'msnbc','notsorry','phoenix', 'political', 'politics', 'racism', 'texas', 'tokyo2020', 'tokyoolympics',
-    'tonythetiger', 'world', 'worldwide']
-    delta_queries = [q for q in delta_queries if q not in block_words and len(q) > 3]
+            existing_queries_list = yaml.full_load(q_f) or []
+
+    state = CrawlerState(state_db) if state_db else None
+    registry = QueryRegistry(existing_queries_list)
+    file_queries = {id(q) for q in registry.queries()}
+    state_query_names = set()
+    if state:
+        # Queries already in the state store count as existing too
+        state_queries = state.queries()
+        state_query_names = {q['query'] for q in state_queries}
+        registry.add(state_queries)
+
+    delta_queries = registry.delta(new_queries, block_words=BLOCK_WORDS)
     if delta_output_file:
         with open(delta_output_file, 'w+') as d_f:
             d_f.writelines(f'{q}\n' for q in delta_queries)
@@ -32,16 +48,28 @@ def main(new_query_file, existing_query_file, delta_output_file, hashtag, update
     if hashtag:
         delta_queries = ['#' + q for q in delta_queries]
     
-    if update_query_file:
-        for q in delta_queries:
-            existing_queries_list.append({
+    added = registry.add([{
                 "active": True,
                 "query": q,
                 "since_id": None, 
                 "quota_override": None
-            })
+            } for q in delta_queries])
+    print(f'{len(added)} new queries')
+    added_ids = {id(q) for q in added}
+
+    deactivated = []
+    if deactivate_file:
+        with open(deactivate_file) as x_f:
+            deactivated = registry.deactivate(x_f.read().splitlines())
+        print(f'Deactivated {len(deactivated)} queries')
+
+    if update_query_file:
         with open(existing_query_file, 'w') as q_f:
-            yaml.dump(existing_queries_list, q_f)
+            yaml.dump([q for q in registry.queries() if id(q) in file_queries or id(q) in added_ids], q_f)
+
+    if state:
+        state.upsert_queries([q for q in added if q['query'] not in state_query_names])
+        state.set_active([q['query'] for q in deactivated], False)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,19 +1,22 @@
 #!/usr/bin/env python
-from countdown import countdown
 import logging
 import json
-from random import randrange,choice
-import neo4j
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import yaml
-from dateutil.relativedelta import relativedelta
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 import requests
-import os
-import glob
 
 from twesearch.lib import neo4j_importer
 from twesearch.lib.util import format_tweets_for_neo4j, add_campaign
 from twesearch.lib import couchbase_importer
+from twesearch.lib.query_scheduler import QueryScheduler
+from twesearch.lib.spool import Spool
+from twesearch.lib.crawler_state import CrawlerState
+from twesearch.lib.query_registry import QueryRegistry
+from twesearch.lib.query_packer import pack_queries, demux, QUERY_MAX_LENGTH
+from twesearch.lib.quota_allocator import QuotaAllocator
+from twesearch.lib.metrics import serve_metrics
 from twesearch import Twesearch
 
 CAMPAIGN = "electionfraud-06-2021"
@@ -22,7 +25,13 @@ logging.disable(logging.DEBUG)
 with open (r'config.yaml') as f:
     GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
 
-neo4j_importer = neo4j_importer.Neo4jImporter(
+# With a spool_dir configured, results are written to the local spool and
+# bin/import_worker.py imports them, so a slow or down database never stalls fetching
+if GLOBAL_CONFIG.get('spool_dir'):
+    spool = Spool(GLOBAL_CONFIG['spool_dir'])
+else:
+    spool = None
+    neo4j_importer = neo4j_importer.Neo4jImporter(
                                             neo4j_uri=GLOBAL_CONFIG['neo4j_uri'],
                                             db_name=GLOBAL_CONFIG['neo4j_dbname'], 
                                             auth={'user': GLOBAL_CONFIG['neo4j_user'], 
@@ -32,47 +41,50 @@ neo4j_importer = neo4j_importer.Neo4jImporter(
                                                         #cb_uri=, 
                                                         #auth={'user': , 
                                                         #      'password': })
-tv2 = Twesearch(log=True, log_level='warn')
-
-with open(GLOBAL_CONFIG['query_file']) as f:
-    queries = yaml.full_load(f)
-
-print(f'Loaded {len(queries)} queries')
-
-while True:
-
-    with open('crawler.lock', 'w') as lock_file:
-        lock_file.write('')
-
-    query = choice([q for q in queries if q['active']])
-
-    with open('quota.json') as quota_file:
-        quota = json.load(quota_file)
-
-    quota_max = quota['quota_max']
-
-    today = str(date.today())
-    quota_start_date = datetime.fromisoformat(quota['quota_start_date'])
-    quota_end_date = quota_start_date + relativedelta(months=1)
-
-    if datetime.now() > quota_end_date:
-        quota_used = 0
-        quota.update({'quota_start_date': today})
-        quota_start_date = datetime.fromisoformat(quota['quota_start_date'])
-        quota_end_date = quota_start_date + relativedelta(months=1)
-        with open('quota.json', 'w') as quota_file:
-            quota_file.write(json.dumps(quota))
-    else:
-        quota_used = quota['quota_used']
-
-    quota_remaining_timedelta = quota_end_date - datetime.now()
-    quota_remaining_seconds = quota_remaining_timedelta.total_seconds()
-    quota_remaining_iterations = int(quota_remaining_seconds / ((60 * GLOBAL_CONFIG['timeout_minutes']) + GLOBAL_CONFIG['timeout_seconds']))
-    
-    if query['quota_override']: 
-        max_results = query['quota_override']    
+tv2 = Twesearch(log=True, log_level='warn', compact=GLOBAL_CONFIG.get('compact_records', False))
+
+# Request, rate limit, extract and import metrics on http://127.0.0.1:<metrics_port>/metrics (and /metrics.json)
+if GLOBAL_CONFIG.get('metrics_port'):
+    serve_metrics(GLOBAL_CONFIG['metrics_port'])
+
+# Queries, since_ids, quota usage and run history live in one SQLite file, updated a query at a time.
+# An empty store is seeded from the YAML query file and quota.json; bin/crawler_state.py exports them back
+state = CrawlerState(GLOBAL_CONFIG.get('state_db', 'crawler_state.db'))
+state.import_legacy(GLOBAL_CONFIG['query_file'], 'quota.json')
+# The registry drops queries that only differ in case or spacing, so none of them runs twice
+registry = QueryRegistry(state.queries())
+queries = registry.active()
+
+print(f'Loaded {len(queries)} active queries out of {len(registry)}')
+
+# With pack_queries, queries averaging at most pack_max_yield tweets a run are OR'ed together into
+# shared searches and their tweets routed back to them locally
+if GLOBAL_CONFIG.get('pack_queries'):
+    yields = state.recent_yields()
+    low_yield = [q for q in queries if q['query'] in yields and yields[q['query']] <= GLOBAL_CONFIG.get('pack_max_yield', 10)]
+    packs, unpacked = pack_queries(low_yield, GLOBAL_CONFIG.get('query_max_length', QUERY_MAX_LENGTH))
+    low_yield_names = {q['query'] for q in low_yield}
+    queries = [q for q in queries if q['query'] not in low_yield_names] + unpacked + packs
+    print(f'Running {len(queries)} searches after packing')
+
+QUERY_INTERVAL = (60 * GLOBAL_CONFIG['timeout_minutes']) + GLOBAL_CONFIG['timeout_seconds']
+CONCURRENCY = GLOBAL_CONFIG.get('concurrency', 4)
+
+# 'yield' (the default) runs productive queries more often and gives them more of the quota,
+# 'even' gives every query the same interval and share. bin/crawler_state.py --allocation shows the split
+allocator = QuotaAllocator(QUERY_INTERVAL, strategy=GLOBAL_CONFIG.get('allocation', 'yield'))
+allocator.set_queries([q['query'] for q in queries])
+# Runs are recorded per member query, with the tweets demux routed to it, so packs start from their members' yields
+allocator.seed(state.run_history(), packs={q['query']: [m['query'] for m in q['members']] for q in queries if 'members' in q})
+
+def calculate_max_results(query, quota):
+    """
+    Asks the allocator for this run's share of the remaining monthly quota
+    """
+    if query['quota_override']:
+        max_results = query['quota_override']
     else:
-        max_results = int((quota_max - quota_used) / quota_remaining_iterations)
+        max_results = allocator.max_results(query['query'], quota)
 
     if max_results < 100:
         results_per_call = max_results
@@ -81,94 +93,145 @@ while True:
             max_results = 10
     else:
         results_per_call = 100
+    return max_results, results_per_call
 
-    print(f'''
-    quota_override: {'TRUE' if query['quota_override'] else 'false'}
-
-    query: {query['query']}
-
-    quota_used: {quota_used}
-    quota remaining: {quota_max - quota_used}
-    current quota start: {quota_start_date}
-    current quota end: {quota_end_date}
-    quota remaining timedelta: {quota_remaining_timedelta}
-    quota remaining seconds: {quota_remaining_seconds}
-    quota remaining iterations: {quota_remaining_iterations}
-    max_results: {max_results}
-    ''')
-
+def run_query(query, max_results, results_per_call):
+    """
+    Runs on a worker thread. Only fetches - importing and state updates happen on the main thread.
+    Returns the results, or None if the query returned nothing in the last 7 days and should be removed
+    """
     since_id = query['since_id']
 
     if since_id:
-        print(f'Found since_id, using {since_id}')
+        print(f'Found since_id for {query["query"]}, using {since_id}')
         query_args = {'since_id': since_id}
     else:
         query_args = {}
-    try:  
-        results = tv2.search_tweets(query["query"], 
-                                    max_results=max_results, 
-                                    results_per_call=results_per_call,
-                                    other_query_args = query_args) 
+    try:
+        return tv2.search_tweets(query["query"], 
+                                 max_results=max_results, 
+                                 results_per_call=results_per_call,
+                                 other_query_args = query_args) 
     except requests.exceptions.HTTPError as e:
         resp = e.response
-        if resp.status_code == 400:
+        if resp is not None and resp.status_code == 400:
             resp = json.loads(resp.text)
             if 'since_id' in resp['errors'][0]['parameters'].keys():
                 print(f'Received invalid since_id error for {query["query"]}. Trying without since_id set')
                 results = tv2.search_tweets(query["query"], max_results = max_results)
-                if not results['counts']['total_tweets_count']:
-                    print(f'Query {query["query"]} has 0 results within the last 7 days. Removing')
-                    queries = [q for q in queries if q['query'] != query['query']]
-                    with open(GLOBAL_CONFIG['query_file'], 'w') as queries_file:
-                        yaml.dump(queries, queries_file, sort_keys=True)
-                    continue
-    
+                # A pack going quiet doesn't mean any of its queries should be removed
+                if not results['counts']['total_tweets_count'] and 'members' not in query:
+                    return None
+                return results
+        raise
+
+def import_results(query, results, quota):
+    """
+    Imports (or spools) the results, then records the run: quota used and the query's new since_id
+    are stored together, only once the results are safely written
+    """
     tweets_count = results['counts']['total_tweets_count']
     tweets = results['tweets']
     users = results['users']
-    
-    if len(tweets) > 0:                                                                        
-        quota_used += tweets_count
+
+    if len(tweets) > 0:
+        quota_used = quota['quota_used'] + tweets_count
 
         print('\r\r')
-        print(f'Fetched {tweets_count}, new quota used: {quota_used}. Remaining calls: {quota_max - quota_used} out of {quota_max}')
+        print(f'Fetched {tweets_count} for {query["query"]}, new quota used: {quota_used}. Remaining calls: {quota["quota_max"] - quota_used} out of {quota["quota_max"]}')
         print('\r\r')
 
         tweets = add_campaign(tweets, CAMPAIGN)
-        #couchbase_importer.upsert_documents('tweets', tweets)
-        
-        neo4j_tweets = format_tweets_for_neo4j(tweets, users)
-        neo4j_importer.insert('tweets', neo4j_tweets)
-        
     if len(users) > 0:
         users = add_campaign(users, CAMPAIGN)
-        #couchbase_importer.upsert_documents('users', users)
-        neo4j_importer.insert('users', users)
 
-    if tweets:
-        max_tweet_id = str(max([int(t['id']) for t in tweets]))
+    if spool:
+        if tweets or users:
+            spool.append([{'tweets': tweets, 'users': users}])
     else:
-        countdown(mins=GLOBAL_CONFIG['timeout_minutes'],secs=GLOBAL_CONFIG['timeout_seconds'])    
-        continue
+        if len(tweets) > 0:
+            #couchbase_importer.upsert_documents('tweets', tweets)
+            neo4j_tweets = format_tweets_for_neo4j(tweets, users)
+            neo4j_importer.insert('tweets', neo4j_tweets)
+
+        if len(users) > 0:
+            #couchbase_importer.upsert_documents('users', users)
+            neo4j_importer.insert('users', users)
+
+    max_tweet_id = str(max([int(t['id']) for t in tweets])) if tweets else None
+    if 'members' in query:
+        # The pack searched every member up to its newest tweet, so they all move on to it
+        routed, unrouted = demux(query, tweets)
+        print(f"Routed {len(tweets) - len(unrouted)} of {len(tweets)} tweets to {len(query['members'])} packed queries")
+        state.record_runs([(m['query'], 'ok', len(routed[m['query']]), max_tweet_id, None) for m in query['members']],
+                          quota_used=tweets_count if tweets else 0)
+        if max_tweet_id:
+            for member in query['members']:
+                member['since_id'] = max_tweet_id
+            query['since_id'] = max_tweet_id
+    elif tweets:
+        print(f"Setting since_id to {max_tweet_id} for query {query['query']}")
+        query.update({'since_id': max_tweet_id})
+        state.record_run(query['query'], 'ok', tweets_count, max_tweet_id)
+    else:
+        state.record_run(query['query'], 'ok')
 
-    print(f'before query update: {query}')
+scheduler = QueryScheduler([q for q in queries if q['active']], QUERY_INTERVAL)
+executor = ThreadPoolExecutor(max_workers=CONCURRENCY)
+running = {}
 
-    print(f"Setting since_id to {max_tweet_id} for query {query['query']}")
-    query.update({'since_id': max_tweet_id})
+while True:
 
-    print(f"Sleeping for {GLOBAL_CONFIG['timeout_minutes']}m{GLOBAL_CONFIG['timeout_seconds']}s and writing updated since_ids to json")
+    for query in scheduler.pop_due(limit=CONCURRENCY - len(running)):
+        quota = state.quota()
+        max_results, results_per_call = calculate_max_results(query, quota)
+        print(f'''
+    quota_override: {'TRUE' if query['quota_override'] else 'false'}
 
-    for q in queries:
-        if q['query'] == query['query']:
-            q.update(query)
-            print(f'after query update: {q}')
+    query: {query['query']}
 
+    quota_used: {quota['quota_used']}
+    quota remaining: {quota['quota_max'] - quota['quota_used']}
+    current quota start: {quota['quota_start_date']}
+    max_results: {max_results}
+    expected new tweets: {allocator.score(query['query']):.1f}
+    running queries: {len(running) + 1}
+    ''')
+        running[executor.submit(run_query, query, max_results, results_per_call)] = (query, max_results)
+
+    if not running:
+        next_due = scheduler.seconds_until_due()
+        if next_due is None:
+            print('No active queries left')
+            break
+        print(f'Nothing running, next query due in {next_due:.0f}s')
+        time.sleep(next_due)
+        continue
 
-    with open(GLOBAL_CONFIG['query_file'], 'w') as queries_file:
-        yaml.dump(queries, queries_file, sort_keys=True)
+    # With every worker busy a due query can't start anyway, so wait for one to finish
+    timeout = None if len(running) >= CONCURRENCY else scheduler.seconds_until_due()
+    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+    if not done:
+        continue
 
-    quota.update({'quota_used': quota_used})
-    with open('quota.json', 'w') as quota_file:
-        quota_file.write(json.dumps(quota))
-    os.remove("crawler.lock")
-    countdown(mins=GLOBAL_CONFIG['timeout_minutes'],secs=GLOBAL_CONFIG['timeout_seconds'])    
+    for future in done:
+        query, max_results = running.pop(future)
+        try:
+            results = future.result()
+        except Exception as e:
+            logging.error(f"Query {query['query']} failed, rescheduling: {e}")
+            state.record_runs([(q['query'], 'failed', 0, None, str(e)) for q in query.get('members', [query])])
+            scheduler.reschedule(query)
+            continue
+
+        if results is None:
+            print(f'Query {query["query"]} has 0 results within the last 7 days. Removing')
+            scheduler.remove(query['query'])
+            registry.remove([query['query']])
+            allocator.remove(query['query'])
+            state.remove_query(query['query'], reason='No results within the last 7 days')
+            continue
+
+        import_results(query, results, state.quota())
+        allocator.record(query['query'], results['counts']['total_tweets_count'], max_results)
+        scheduler.reschedule(query, delay=allocator.delay(query['query']))
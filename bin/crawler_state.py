@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import click
+import yaml
+
+from twesearch.lib.crawler_state import CrawlerState
+from twesearch.lib.quota_allocator import QuotaAllocator
+
+@click.command()
+@click.option('-d', '--state-db', help="Defaults to 'state_db' in config.yaml, then crawler_state.db")
+@click.option('--import-yaml', 'import_yaml', help='Load queries from a queries.yaml file')
+@click.option('--replace', is_flag=True, help='With --import-yaml, delete queries that are not in the file')
+@click.option('--export-yaml', 'export_yaml', help='Write the queries out in the queries.yaml format')
+@click.option('--import-quota', 'import_quota', help='Load the quota from a quota.json file')
+@click.option('--export-quota', 'export_quota', help='Write the quota out in the quota.json format')
+@click.option('-h', '--history', is_flag=True, help='Print the most recent runs')
+@click.option('-q', '--query', help='With --history, only runs of this query')
+@click.option('-l', '--limit', type=int, default=20)
+@click.option('-a', '--allocation', is_flag=True, help="Print how the crawler's allocator would split the quota, from run history")
+def main(state_db, import_yaml, replace, export_yaml, import_quota, export_quota, history, query, limit, allocation):
+    with open(r'config.yaml') as f:
+        GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader) or {}
+    state = CrawlerState(state_db or GLOBAL_CONFIG.get('state_db', 'crawler_state.db'))
+
+    if import_yaml:
+        print(f'Imported {state.import_yaml(import_yaml, replace=replace)} queries from {import_yaml}')
+    if import_quota:
+        state.import_quota(import_quota)
+        print(f'Imported quota from {import_quota}')
+    if export_yaml:
+        print(f'Exported {state.export_yaml(export_yaml)} queries to {export_yaml}')
+    if export_quota:
+        state.export_quota(export_quota)
+        print(f'Exported quota to {export_quota}')
+    if history:
+        for run in state.history(query=query, limit=limit):
+            print(f"{run['finished_at']} {run['status']:>8} {run['tweets_count']:>6} {run['query']}"
+                  f"{' since_id ' + run['since_id'] if run['since_id'] else ''}{' (' + run['error'] + ')' if run['error'] else ''}")
+
+    if allocation:
+        interval = (60 * GLOBAL_CONFIG.get('timeout_minutes', 15)) + GLOBAL_CONFIG.get('timeout_seconds', 0)
+        allocator = QuotaAllocator(interval, strategy=GLOBAL_CONFIG.get('allocation', 'yield'))
+        allocator.set_queries([q['query'] for q in state.queries(active_only=True)])
+        allocator.seed(state.run_history())
+        quota = state.quota()
+        stats = allocator.stats()
+        print(f"Strategy: {stats['strategy']}, {quota['quota_max'] - quota['quota_used']} of {quota['quota_max']} tweets left this period")
+        print(f"{'score':>8} {'yield':>8} {'runs':>5} {'hrs idle':>8} {'delay s':>8} {'share':>7} {'max_results':>11}  query")
+        for row in stats['queries'][:limit]:
+            print(f"{row['score']:>8} {str(row['yield']):>8} {row['runs']:>5} {str(row['hours_since_hit']):>8} {row['delay_seconds']:>8} "
+                  f"{row['quota_share']:>7.2%} {allocator.max_results(row['query'], quota):>11}  {row['query']}{' (truncated)' if row['truncated'] else ''}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import click
+import logging
+import yaml
+
+from twesearch.lib import neo4j_importer
+from twesearch.lib.easy_importer import store_results
+from twesearch.lib import couchbase_importer
+from twesearch.lib.spool import Spool
+from twesearch.lib.tweet_id_store import TweetIdStore
+from twesearch import Twesearch
+
+logging.disable(logging.DEBUG)
+
+@click.command()
+@click.option('-i', '--in-file', help='Seed tweet IDs, one per line')
+@click.option('-q', '--query', help='Seed with the results of this search')
+@click.option('-f', '--from-stubs', type=int, help='Seed with up to this many tweets Neo4j only has as references')
+@click.option('-d', '--max-depth', default=2, help='Levels of references to follow')
+@click.option('-m', '--max-tweets', type=int, help='Stop once this many tweets have been requested')
+@click.option('-c', '--conversations', is_flag=True, help='Also search the conversations of every tweet found')
+@click.option('-nn', '--no-neo4j', 'neo4j_flag', is_flag=True, default=False)
+@click.option('-nc', '--no-couchbase', 'cb_flag', is_flag=True, default=False)
+@click.option('-s', '--spool-dir', help='Write results to this spool for bin/import_worker.py instead of importing them')
+def main(in_file, query, from_stubs, max_depth, max_tweets, conversations, neo4j_flag, cb_flag, spool_dir):
+
+    with open (r'config.yaml') as f:
+        GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
+
+    spool = Spool(spool_dir) if spool_dir else None
+    if spool:
+        neo4j_flag = cb_flag = True
+    neo4j = None
+    if not neo4j_flag or from_stubs:
+        neo4j = neo4j_importer.Neo4jImporter(neo4j_uri=GLOBAL_CONFIG['neo4j_uri'], db_name=GLOBAL_CONFIG['neo4j_dbname'],
+                                                    auth={'user': GLOBAL_CONFIG['neo4j_user'], 'password': GLOBAL_CONFIG['neo4j_pw']},log=True)
+    if not cb_flag:
+        couchbase = couchbase_importer.CouchbaseImporter(cb_uri=GLOBAL_CONFIG['cb_uri'], auth={'user': GLOBAL_CONFIG['cb_user'],
+                                                                                                'password': GLOBAL_CONFIG['cb_pw']})
+    tweet_id_store = TweetIdStore(GLOBAL_CONFIG.get('tweet_id_store', 'tweet_ids.db'))
+    tv2 = Twesearch(log=True, log_level='info', tweet_id_store=tweet_id_store)
+
+    def store(tweets, users):
+        store_results(tweets, users, neo4j=None if neo4j_flag else neo4j, couchbase=None if cb_flag else couchbase,
+                      spool=spool, tweet_id_store=tweet_id_store)
+
+    seed_tweets = []
+    seed_ids = []
+    if in_file:
+        with open(in_file) as i_f:
+            seed_ids.extend(line.strip() for line in i_f if line.strip())
+    if from_stubs:
+        seed_ids.extend(neo4j.stub_tweet_ids(from_stubs))
+    if query:
+        results = tv2.search_tweets(query, max_results=max_tweets or 5000)
+        seed_tweets = results['tweets']
+        store(seed_tweets, results['users'])
+        if max_tweets is not None:
+            max_tweets = max(0, max_tweets - results['counts']['total_tweets_count'])
+    if not seed_ids and not seed_tweets:
+        raise click.UsageError('Give seeds with --in-file, --query or --from-stubs')
+
+    total = 0
+    for level in tv2.iter_expansion(tweets=seed_tweets, tweet_ids=seed_ids, max_depth=max_depth,
+                                    max_tweets=max_tweets, conversations=conversations):
+        store(level['tweets'], level['users'])
+        total += len(level['tweets'])
+        print(f"Depth {level['depth']}: {len(level['tweets'])} tweets, {len(level['users'])} users")
+    print(f'Expanded to {total} tweets. Tweet ID store: {tweet_id_store.stats()}')
+
+if __name__ == '__main__':
+    main()
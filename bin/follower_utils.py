@@ -6,10 +6,20 @@ import yaml
 from twesearch.lib import neo4j_importer
 from twesearch.lib.util import format_tweets_for_neo4j, add_campaign
 from twesearch.lib import couchbase_importer
+from twesearch.lib.spool import Spool
+from twesearch.lib.edges import FollowEdges
+from twesearch.lib.follow_snapshots import FollowSnapshots, diff_edges
+from twesearch.lib.user_cache import UserCache
 from twesearch import Twesearch
 
 logging.disable(logging.DEBUG)
 
+# Most followers/following fetched per user and direction
+MAX_FOLLOWS = 500000
+# How far short of the profile's count a paged-out fetch may come (suspended accounts, unfollows
+# during the fetch) before it is treated as cut off anyway
+FOLLOW_COUNT_TOLERANCE = 0.1
+
 @click.command()
 @click.option('-u', '--username')
 @click.option('-i', '--in-file')
@@ -20,11 +30,17 @@ logging.disable(logging.DEBUG)
 @click.option('-y', '--yolo', is_flag=True)
 @click.option('-nn', '--no-neo4j', 'neo4j_flag', is_flag=True, default=False)
 @click.option('-nc', '--no-couchbase', 'cb_flag', is_flag=True, default=False)
-def main(username, followers, following,neo4j_flag,cb_flag, in_file, _csv, sleep, yolo):
+@click.option('-sd', '--spool-dir', help='Write users to this spool for bin/import_worker.py instead of importing them')
+@click.option('-F', '--full', is_flag=True, help='Import every follower and edge even when there is a previous snapshot')
+def main(username, followers, following,neo4j_flag,cb_flag, in_file, _csv, sleep, yolo, spool_dir, full):
 
     with open (r'config.yaml') as f:
         GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
 
+    spool = Spool(spool_dir) if spool_dir else None
+    if spool:
+        neo4j_flag = cb_flag = True
+
     if not neo4j_flag:
         neo4j = neo4j_importer.Neo4jImporter(neo4j_uri=GLOBAL_CONFIG['neo4j_uri'], db_name=GLOBAL_CONFIG['neo4j_dbname'], 
                                                     auth={'user': GLOBAL_CONFIG['neo4j_user'], 'password': GLOBAL_CONFIG['neo4j_pw']},log=True)
@@ -32,20 +48,86 @@ def main(username, followers, following,neo4j_flag,cb_flag, in_file, _csv, sleep
         couchbase = couchbase_importer.CouchbaseImporter(cb_uri=GLOBAL_CONFIG['cb_uri'], auth={'user': GLOBAL_CONFIG['cb_user'], 
                                                                                                 'password': GLOBAL_CONFIG['cb_pw']})
 
-    tv2 = Twesearch(log=True, log_level='info')
+    user_cache = UserCache(GLOBAL_CONFIG['user_cache']) if GLOBAL_CONFIG.get('user_cache') else None
+    # One client for every user, so credentials are parsed once and its connections are reused
+    tv2 = Twesearch(log=True, log_level='info', user_cache=user_cache)
+    # With a snapshot of the last run, only the follows that changed since are written
+    snapshots = FollowSnapshots(GLOBAL_CONFIG['follow_snapshots']) if GLOBAL_CONFIG.get('follow_snapshots') else None
 
-    def get_follows(username):
+    def get_follows(user):
+        username = user['username']
         print('Fetching:')
         if followers: print('Followers') 
         if following: print('Following')
         print(f'For {username}. Buckle up partner')
 
-        tv2 = Twesearch(log=True, log_level='info')
-        
-        user_id = tv2.username_to_id(username)
+        user_id = user['id']
         if user_id:
-            user = tv2.get_users([user_id], expansions='')['users'][0]
-            users = []
+            header_fields = ['created_at', 'description', 'entities', 'id', 'location', 'name', 'pinned_tweet_id', 
+            'profile_image_url', 'protected', 'public_metrics', 'url', 'username', 'verified', 'fetched_timestamp', 'withheld']
+
+            def import_pages(pages, direction, csv_filename=None):
+                """
+                Writes each page of users to the databases (and CSV) as soon as it arrives,
+                keeping only their IDs in memory, as FollowEdges. Users already in the previous
+                snapshot are only written to the CSV. Returns (edges, previous snapshot edges or None,
+                whether the last page came back without a next token)
+                """
+                edges = FollowEdges(user_id, direction)
+                previous = snapshots.get(user_id, direction) if snapshots else None
+                if previous:
+                    print(f'Previous {direction} snapshot of {len(previous[1])} taken at {previous[0]}')
+                previous = None if previous is None or full else previous[1]
+                known_ids = set(previous.ids) if previous else set()
+                csv_file = None
+                if csv_filename:
+                    csv_file = open(csv_filename, 'w')
+                    writer = csv.DictWriter(csv_file, fieldnames = header_fields, 
+                                            delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+                    writer.writeheader()
+                paged_out = False
+                try:
+                    for page in pages:
+                        paged_out = page.get('next_token') is None
+                        page_users = page['users']
+                        edges.extend(u['id'] for u in page_users)
+                        if csv_file:
+                            writer.writerows(page_users)
+                        if known_ids:
+                            page_users = [u for u in page_users if int(u['id']) not in known_ids]
+                        if user_cache:
+                            user_cache.put_many(page_users)
+                        if spool:
+                            spool.append([{'tweets': [], 'users': page_users}])
+                        if not cb_flag:
+                            couchbase.upsert_documents('users', page_users)
+                        if not neo4j_flag and page_users:
+                            neo4j.insert('users', page_users)
+                        print(f'Imported {len(page_users)} new users. {len(edges)} fetched so far')
+                finally:
+                    if csv_file:
+                        csv_file.close()
+                return edges, previous, paged_out
+
+            def edge_changes(edges, previous, paged_out, expected_count):
+                """
+                Returns (added, removed, complete). A fetch is complete when it paged through to the end
+                and stayed under MAX_FOLLOWS. The profile's count is only a sanity check, since suspended
+                accounts are counted but never returned. An incomplete fetch removes nothing, as edges it
+                didn't reach may still exist
+                """
+                complete = paged_out and len(edges) < MAX_FOLLOWS
+                if complete and len(edges) < expected_count * (1 - FOLLOW_COUNT_TOLERANCE):
+                    print(f'Only {len(edges)} of {expected_count} {edges.direction} came back, treating the fetch as cut off')
+                    complete = False
+                if not complete:
+                    print(f'Fetched {len(edges)} of {expected_count} {edges.direction}, not expiring missing edges or saving the snapshot')
+                if previous is None:
+                    return edges, FollowEdges(user_id, edges.direction), complete
+                added, removed = diff_edges(previous, edges)
+                return added, removed if complete else FollowEdges(user_id, edges.direction), complete
+
+            edge_sets = []
             if followers:
                 followers_count = user["public_metrics"]["followers_count"]
 
@@ -56,12 +138,11 @@ def main(username, followers, following,neo4j_flag,cb_flag, in_file, _csv, sleep
                         quit()
 
                 print(f'Fetching followers')
-                follower_users = tv2.get_followers(user_id, expansions='', max_results=500000, sleep=sleep)['users']
-                print(f'Fetched {len(follower_users)} followers')
-                follower_ids = [follower['id'] for follower in follower_users]
-
-                user['followers'] = follower_ids
-                users = users + follower_users
+                if _csv: print('Writing follower CSV')
+                follower_edges, previous, paged_out = import_pages(tv2.iter_followers(user_id, expansions='', max_results=MAX_FOLLOWS, sleep=sleep),
+                                                        'followers', username + '_followers.csv' if _csv else None)
+                print(f'Fetched {len(follower_edges)} followers')
+                edge_sets.append((follower_edges,) + edge_changes(follower_edges, previous, paged_out, followers_count))
 
             if following:
                 following_count = user["public_metrics"]["following_count"]
@@ -73,46 +154,45 @@ def main(username, followers, following,neo4j_flag,cb_flag, in_file, _csv, sleep
                         quit()
 
                 print(f'Fetching following')
-                following_users = tv2.get_following(user_id, expansions='', max_results=500000, sleep=sleep)['users']
-                print(f'Fetched {len(following_users)} following')
-                following_ids = [following['id'] for following in following_users]
-
-                user['following'] = following_ids
-                users = users + following_users
-            
-            users.append(user)
-            header_fields = ['created_at', 'description', 'entities', 'id', 'location', 'name', 'pinned_tweet_id', 
-            'profile_image_url', 'protected', 'public_metrics', 'url', 'username', 'verified', 'fetched_timestamp', 'withheld']
+                if _csv: print('Writing following CSV')
+                following_edges, previous, paged_out = import_pages(tv2.iter_following(user_id, expansions='', max_results=MAX_FOLLOWS, sleep=sleep),
+                                                         'following', username + '_following.csv' if _csv else None)
+                print(f'Fetched {len(following_edges)} following')
+                edge_sets.append((following_edges,) + edge_changes(following_edges, previous, paged_out, following_count))
+
+            if spool:
+                print(f'Spooling {username}')
+                spool.append([{'tweets': [], 'users': [user]}] +
+                             [{'tweets': [], 'users': [], 'edges': added.to_record(), 'expired_edges': removed.to_record()}
+                              for _, added, removed, _ in edge_sets])
             if not cb_flag:
                 print(f'Inserting into couchbase')
-                couchbase.upsert_documents('users', users)
-                user = [user]
-                couchbase.upsert_documents('users', user)
+                couchbase.upsert_documents('users', [user])
             if not neo4j_flag:
                 print(f'Inserting into neo4j')
-                neo4j.insert('users', users)
-            if _csv and following:
-                print('Writing following CSV')
-                with open(username + '_following.csv', 'w') as following_csv:
-                    writer = csv.DictWriter(following_csv, fieldnames = header_fields, 
-                                            delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-                    writer.writeheader()
-                    writer.writerows(following_users)
-            if _csv and followers:
-                print('Writing follower CSV')
-                with open(username + '_followers.csv', 'w') as follower_csv:
-                    writer = csv.DictWriter(follower_csv, fieldnames = header_fields, 
-                                            delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-                    writer.writeheader()
-                    writer.writerows(follower_users)
+                neo4j.insert('users', [user])
+                for _, added, removed, _ in edge_sets:
+                    print(f'Inserting {len(added)} and expiring {len(removed)} {added.rel_type} edges in neo4j')
+                    neo4j.insert_follow_edges(added)
+                    neo4j.expire_follow_edges(removed)
+            # Only once the changes are imported (or durably spooled), so a failed run is diffed again.
+            # An incomplete fetch keeps the previous snapshot, so the next full one is diffed against it
+            if snapshots:
+                for edges, _, _, complete in edge_sets:
+                    if complete:
+                        snapshots.put(edges)
     if in_file:
         with open(in_file) as i_f:
             usernames = i_f.read().splitlines()
     else:
         usernames = [username]
     
-    for username in usernames:
-        get_follows(username)
+    resolved = tv2.resolve_users(usernames, by_usernames=True)
+    for name, user in resolved.items():
+        if isinstance(user, dict):
+            get_follows(user)
+        else:
+            print(f'Skipping {name}: {user}')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,11 +1,13 @@
 import click
 import logging
-import json
 import yaml
 
 from twesearch.lib import neo4j_importer
 from twesearch.lib.util import format_tweets_for_neo4j, add_campaign
 from twesearch.lib import couchbase_importer
+from twesearch.lib.spool import Spool
+from twesearch.lib.user_cache import UserCache
+from twesearch.lib.crawler_state import CrawlerState
 from twesearch import Twesearch
 
 logging.disable(logging.DEBUG)
@@ -15,23 +17,30 @@ logging.disable(logging.DEBUG)
 @click.option('-i', '--in-file')
 @click.option('-nn', '--no-neo4j', 'neo4j_flag', is_flag=True, default=False)
 @click.option('-nc', '--no-couchbase', 'cb_flag', is_flag=True, default=False)
-def main(username, neo4j_flag,cb_flag, in_file):
+@click.option('-s', '--spool-dir', help='Write results to this spool for bin/import_worker.py instead of importing them')
+def main(username, neo4j_flag,cb_flag, in_file, spool_dir):
 
     with open (r'config.yaml') as f:
         GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
     
+    spool = Spool(spool_dir) if spool_dir else None
+    if spool:
+        neo4j_flag = cb_flag = True
     if not neo4j_flag:
         neo4j = neo4j_importer.Neo4jImporter(neo4j_uri=GLOBAL_CONFIG['neo4j_uri'], db_name=GLOBAL_CONFIG['neo4j_dbname'], 
                                                     auth={'user': GLOBAL_CONFIG['neo4j_user'], 'password': GLOBAL_CONFIG['neo4j_pw']},log=True)
     if not cb_flag: 
         couchbase = couchbase_importer.CouchbaseImporter(cb_uri=GLOBAL_CONFIG['cb_uri'], auth={'user': GLOBAL_CONFIG['cb_user'], 
                                                                                                 'password': GLOBAL_CONFIG['cb_pw']})
-    tv2 = Twesearch(log=True, log_level='info')
+    user_cache = UserCache(GLOBAL_CONFIG['user_cache']) if GLOBAL_CONFIG.get('user_cache') else None
+    tv2 = Twesearch(log=True, log_level='info', user_cache=user_cache)
+    # Shares the crawler's quota
+    state = CrawlerState(GLOBAL_CONFIG.get('state_db', 'crawler_state.db'))
+    state.import_legacy(quota_file='quota.json')
     def get_timeline(user_id):
         print(f'Fetching timeline tweets for {username}. Buckle up partner')
-        with open('quota.json') as quota_file:
-            quota = json.load(quota_file)
-        
+        quota = state.quota()
+
         quota_used = quota['quota_used']
         quota_max = quota['quota_max']
         print(f'Quota used: {quota_used}. Remaining calls: {quota_max - quota_used} out of {quota_max}')
@@ -44,10 +53,15 @@ def main(username, neo4j_flag,cb_flag, in_file):
         if tweets:
             quota_used += tweets_count
             print(f'Fetched {tweets_count}, new quota used: {quota_used}. Remaining calls: {quota_max - quota_used} out of {quota_max}')
-            quota.update({'quota_used': quota_used})
+            state.add_quota_used(tweets_count)
+
+        if spool:
+            if tweets or users:
+                print(f'Spooling {len(tweets)} tweets and {len(users)} users')
+                spool.append([{'tweets': tweets, 'users': users}])
+            return
 
-            with open('quota.json', 'w') as quota_file:
-                quota_file.write(json.dumps(quota))
+        if tweets:
             print('Inserting tweets')
 
             if not cb_flag:
@@ -67,9 +81,16 @@ def main(username, neo4j_flag,cb_flag, in_file):
     if in_file:
         with open(in_file) as i_f:
             usernames = i_f.read().splitlines()
-        user_ids = [tv2.username_to_id(username) for username in usernames]
     else: 
-        user_ids = [tv2.username_to_id(username)]
+        usernames = [username]
+
+    resolved = tv2.resolve_users(usernames, by_usernames=True)
+    user_ids = []
+    for name, user in resolved.items():
+        if isinstance(user, dict):
+            user_ids.append(user['id'])
+        else:
+            print(f'Skipping {name}: {user}')
     
     for user_id in user_ids:
         get_timeline(user_id)
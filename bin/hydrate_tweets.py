@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+import click
+import logging
+import yaml
+
+from twesearch.lib import neo4j_importer
+from twesearch.lib.easy_importer import store_results
+from twesearch.lib import couchbase_importer
+from twesearch.lib.spool import Spool
+from twesearch.lib.tweet_id_store import TweetIdStore
+from twesearch import Twesearch
+
+logging.disable(logging.DEBUG)
+
+@click.command()
+@click.option('-i', '--in-file', required=True, help='Tweet IDs to hydrate, one per line')
+@click.option('-b', '--batch-size', default=10000, help='IDs read, fetched and imported at a time')
+@click.option('-r', '--refetch', is_flag=True, help='Fetch every ID, even ones already fetched or missing')
+@click.option('-k', '--skip-stored', is_flag=True, help='Also skip tweets already imported into Neo4j')
+@click.option('-nn', '--no-neo4j', 'neo4j_flag', is_flag=True, default=False)
+@click.option('-nc', '--no-couchbase', 'cb_flag', is_flag=True, default=False)
+@click.option('-s', '--spool-dir', help='Write results to this spool for bin/import_worker.py instead of importing them')
+def main(in_file, batch_size, refetch, skip_stored, neo4j_flag, cb_flag, spool_dir):
+
+    with open (r'config.yaml') as f:
+        GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
+
+    spool = Spool(spool_dir) if spool_dir else None
+    if spool:
+        neo4j_flag = cb_flag = True
+    neo4j = None
+    if not neo4j_flag or skip_stored:
+        neo4j = neo4j_importer.Neo4jImporter(neo4j_uri=GLOBAL_CONFIG['neo4j_uri'], db_name=GLOBAL_CONFIG['neo4j_dbname'],
+                                                    auth={'user': GLOBAL_CONFIG['neo4j_user'], 'password': GLOBAL_CONFIG['neo4j_pw']},log=True)
+    if not cb_flag:
+        couchbase = couchbase_importer.CouchbaseImporter(cb_uri=GLOBAL_CONFIG['cb_uri'], auth={'user': GLOBAL_CONFIG['cb_user'],
+                                                                                                'password': GLOBAL_CONFIG['cb_pw']})
+    # Tweets fetched before and IDs the API didn't return are remembered across runs
+    tweet_id_store = TweetIdStore(GLOBAL_CONFIG.get('tweet_id_store', 'tweet_ids.db'))
+    tv2 = Twesearch(log=True, log_level='info', tweet_id_store=tweet_id_store)
+
+    def hydrate(tweet_ids):
+        results = tv2.get_tweets_by_ids(tweet_ids, known_ids=neo4j.existing_tweet_ids if skip_stored else None, refetch=refetch)
+        tweets = results['tweets']
+        users = results['users']
+        counts = results['counts']
+        print(f"Hydrated {len(tweets)} tweets: {counts['requested_ids_count']} requested, "
+              f"{counts['skipped_ids_count']} skipped, {counts['missing_ids_count']} missing")
+
+        store_results(tweets, users, neo4j=None if neo4j_flag else neo4j, couchbase=None if cb_flag else couchbase,
+                      spool=spool, tweet_id_store=tweet_id_store)
+
+    batch = []
+    with open(in_file) as i_f:
+        for line in i_f:
+            tweet_id = line.strip()
+            if not tweet_id:
+                continue
+            batch.append(tweet_id)
+            if len(batch) >= batch_size:
+                hydrate(batch)
+                batch = []
+    if batch:
+        hydrate(batch)
+    print(f'Tweet ID store: {tweet_id_store.stats()}')
+
+if __name__ == '__main__':
+    main()
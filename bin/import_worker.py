@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+import click
+import logging
+import time
+import yaml
+
+from twesearch.lib import neo4j_importer
+from twesearch.lib.util import format_tweets_for_neo4j
+from twesearch.lib import couchbase_importer
+from twesearch.lib.spool import Spool
+from twesearch.lib.edges import FollowEdges
+from twesearch.lib.metrics import serve_metrics
+
+logging.disable(logging.DEBUG)
+
+@click.command()
+@click.option('-s', '--spool-dir')
+@click.option('-f', '--follow', is_flag=True, help='Keep polling the spool for new records')
+@click.option('-p', '--poll-seconds', type=int, default=10)
+@click.option('-r', '--replay', is_flag=True, help='Re-import the whole spool from the first segment')
+@click.option('--prune', is_flag=True, help='Delete segments that have been fully imported')
+@click.option('-nn', '--no-neo4j', 'neo4j_flag', is_flag=True, default=False)
+@click.option('-nc', '--no-couchbase', 'cb_flag', is_flag=True, default=False)
+@click.option('-m', '--metrics-port', type=int, help='Serve import metrics on this port, at /metrics and /metrics.json')
+def main(spool_dir, follow, poll_seconds, replay, prune, neo4j_flag, cb_flag, metrics_port):
+
+    with open (r'config.yaml') as f:
+        GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
+
+    spool = Spool(spool_dir or GLOBAL_CONFIG['spool_dir'])
+    if metrics_port:
+        serve_metrics(metrics_port)
+    if replay:
+        spool.reset_checkpoint()
+
+    if not neo4j_flag:
+        neo4j = neo4j_importer.Neo4jImporter(neo4j_uri=GLOBAL_CONFIG['neo4j_uri'], db_name=GLOBAL_CONFIG['neo4j_dbname'],
+                                                    auth={'user': GLOBAL_CONFIG['neo4j_user'], 'password': GLOBAL_CONFIG['neo4j_pw']},log=True)
+    if not cb_flag:
+        couchbase = couchbase_importer.CouchbaseImporter(cb_uri=GLOBAL_CONFIG['cb_uri'], auth={'user': GLOBAL_CONFIG['cb_user'],
+                                                                                                'password': GLOBAL_CONFIG['cb_pw']})
+
+    def import_record(record):
+        tweets = record['tweets']
+        users = record['users']
+        if tweets:
+            if not cb_flag:
+                couchbase.upsert_documents('tweets', tweets)
+            if not neo4j_flag:
+                neo4j.insert('tweets', format_tweets_for_neo4j(tweets, users))
+        if users:
+            if not cb_flag:
+                couchbase.upsert_documents('users', users)
+            if not neo4j_flag:
+                neo4j.insert('users', users)
+        # Follower/following edges only live in the graph
+        if record.get('edges') and not neo4j_flag:
+            neo4j.insert_follow_edges(FollowEdges.from_record(record['edges']))
+        if record.get('expired_edges') and not neo4j_flag:
+            neo4j.expire_follow_edges(FollowEdges.from_record(record['expired_edges']))
+
+    while True:
+        imported = 0
+        # The checkpoint only moves past a record once it is in every sink, so a crash
+        # or database outage means the record is imported again on the next run
+        for checkpoint, record in spool.read():
+            import_record(record)
+            spool.write_checkpoint(checkpoint)
+            imported += 1
+        if imported:
+            print(f'Imported {imported} spooled records, now at {spool.read_checkpoint()}')
+        if prune:
+            spool.prune()
+
+        if not follow:
+            break
+        time.sleep(poll_seconds)
+
+if __name__ == '__main__':
+    main()
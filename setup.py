@@ -7,12 +7,16 @@ setuptools.setup(
     author_email="c@chriskd.me",
     url="https://github.com/chriskd/twesearch",
     packages=setuptools.find_packages(),
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=["searchtweets-v2", "tweepy", "Click"],
     scripts=[
             'bin/crawler.py',
             'bin/follower_utils.py',
             'bin/get_timeline.py',
-            'bin/add_query.py'
+            'bin/add_query.py',
+            'bin/import_worker.py',
+            'bin/crawler_state.py',
+            'bin/hydrate_tweets.py',
+            'bin/expand_references.py'
             ]
 )
@@ -0,0 +1,71 @@
+import sys
+import types
+
+import pytest
+
+from twesearch.lib.couchbase_importer import CouchbaseImporter
+
+
+class CouchbaseException(Exception):
+    pass
+
+@pytest.fixture(autouse=True)
+def couchbase_exceptions(monkeypatch):
+    # Only the exception type is needed, the collection below stands in for the cluster
+    module = types.ModuleType('couchbase.exceptions')
+    module.CouchbaseException = CouchbaseException
+    monkeypatch.setitem(sys.modules, 'couchbase', types.ModuleType('couchbase'))
+    monkeypatch.setitem(sys.modules, 'couchbase.exceptions', module)
+
+class Result:
+    def __init__(self, success):
+        self.success = success
+
+class FakeCollection:
+    def __init__(self, docs=None, failing=()):
+        self.docs = dict(docs or {})
+        self.failing = set(failing)
+        self.calls = []
+
+    def get_multi(self, keys):
+        self.calls.append(('get_multi', list(keys)))
+        results = {key: Result(key in self.docs) for key in keys}
+        if not all(r.success for r in results.values()):
+            error = CouchbaseException('document not found')
+            error.all_results = results
+            raise error
+        return results
+
+    def upsert_multi(self, docs):
+        self.calls.append(('upsert_multi', list(docs)))
+        results = {key: Result(key not in self.failing) for key in docs}
+        for key in docs:
+            if key not in self.failing:
+                self.docs[key] = docs[key]
+        if self.failing & set(docs):
+            error = CouchbaseException('some upserts failed')
+            error.all_results = results
+            raise error
+        return results
+
+    def upsert(self, key, doc):
+        self.calls.append(('upsert', key))
+        self.docs[key] = doc
+
+def make_importer(collection):
+    importer = CouchbaseImporter('couchbase://localhost', {'user': 'u', 'password': 'p'})
+    importer._collection = lambda bucket: collection
+    return importer
+
+def test_existing_keys_are_looked_up_in_batches():
+    collection = FakeCollection({str(i): {} for i in range(0, 2500, 2)})
+    existing = make_importer(collection).existing_keys('tweets', [str(i) for i in range(2500)], batch_size=1000)
+    assert existing == {str(i) for i in range(0, 2500, 2)}
+    assert [len(keys) for _, keys in collection.calls] == [1000, 1000, 500]
+
+def test_upsert_retries_only_failed_keys():
+    collection = FakeCollection(failing={'3', '7'})
+    report = make_importer(collection).upsert_documents('tweets', [{'id': str(i)} for i in range(10)])
+    assert sorted(report['succeeded'], key=int) == [str(i) for i in range(10)]
+    assert report['failed'] == {}
+    assert [call for call in collection.calls if call[0] == 'upsert'] == [('upsert', '3'), ('upsert', '7')]
@@ -0,0 +1,54 @@
+import twesearch.twesearch as tw
+from twesearch.lib.tweet_id_store import TweetIdStore
+
+
+def tweet(tweet_id):
+    """
+    Tweet n replies to tweet 2n, so seeds 1 and 3 reach 2 and 6 at depth 2, 4 and 12 at depth 3
+    """
+    return {'id': tweet_id, 'text': 't', 'author_id': '100', 'conversation_id': tweet_id,
+            'referenced_tweets': [{'type': 'replied_to', 'id': str(int(tweet_id) * 2)}]}
+
+def make_twesearch(monkeypatch, tweet_id_store=None):
+    requested = []
+    def collect(self, query, api, max_results=1000, stream_args=None):
+        requested.append(list(query['ids']))
+        return [tweet(i) for i in query['ids']] + [{'users': [{'id': '100', 'username': 'someone'}]}]
+    monkeypatch.setattr(tw, 'gen_request_parameters', lambda **kwargs: kwargs)
+    monkeypatch.setattr(tw.Twesearch, '_collect', collect)
+    twesearch = tw.Twesearch.__new__(tw.Twesearch)
+    twesearch.search_args = {'output_format': 'm'}
+    twesearch.compact = False
+    twesearch.parallelism = 1
+    twesearch.chunk_retries = 0
+    twesearch.tweet_id_store = tweet_id_store
+    return twesearch, requested
+
+def levels(twesearch, **kwargs):
+    return [(level['depth'], sorted(t['id'] for t in level['tweets']))
+            for level in twesearch.iter_expansion(**kwargs)]
+
+def test_levels_are_labelled_by_depth(monkeypatch):
+    twesearch, requested = make_twesearch(monkeypatch)
+    assert levels(twesearch, tweet_ids=['1', '3'], max_depth=3) == [(1, ['1', '3']), (2, ['2', '6']), (3, ['12', '4'])]
+    assert len(requested) == 3
+
+def test_hydrated_seeds_start_at_their_references(monkeypatch):
+    twesearch, _ = make_twesearch(monkeypatch)
+    assert levels(twesearch, tweets=[tweet('1')], max_depth=2) == [(1, ['2']), (2, ['4'])]
+
+def test_budget_cuts_the_level_and_drops_the_rest(monkeypatch, tmp_path):
+    store = TweetIdStore(str(tmp_path / 'ids.db'))
+    store.add_known([tweet('3')])
+    twesearch, requested = make_twesearch(monkeypatch, tweet_id_store=store)
+    # Depth 1 is cut to 1, 3 and 5, and 3 is known, so one ID of the budget is left for depth 2.
+    # The dropped seed 7 isn't fetched then as if it were a reference
+    assert levels(twesearch, tweet_ids=['1', '3', '5', '7'], max_depth=3, max_tweets=3) == [(1, ['1', '5']), (2, ['2'])]
+    assert requested == [['1', '5'], ['2']]
+
+def test_known_tweets_are_walked_past(monkeypatch, tmp_path):
+    store = TweetIdStore(str(tmp_path / 'ids.db'))
+    store.add_known([tweet('2')])
+    twesearch, requested = make_twesearch(monkeypatch, tweet_id_store=store)
+    assert levels(twesearch, tweet_ids=['1'], max_depth=3) == [(1, ['1']), (2, []), (3, ['4'])]
+    assert requested == [['1'], ['4']]
@@ -0,0 +1,62 @@
+import pytest
+import requests
+
+import twesearch.twesearch as tw
+
+
+def make_twesearch(chunk_retries=2):
+    twesearch = tw.Twesearch.__new__(tw.Twesearch)
+    twesearch.parallelism = 1
+    twesearch.chunk_retries = chunk_retries
+    return twesearch
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(tw.time, 'sleep', lambda seconds: None)
+
+@pytest.mark.parametrize('error, retriable', [
+    (requests.exceptions.ConnectionError(), True),
+    (requests.exceptions.ReadTimeout(), True),
+    (http_error(429), True),
+    (http_error(503), True),
+    (http_error(400), False),
+    (requests.exceptions.HTTPError(), False),
+    (KeyError('id'), False),
+    (TypeError(), False),
+])
+def test_is_retriable(error, retriable):
+    assert tw.is_retriable(error) == retriable
+
+def test_transient_errors_are_retried():
+    calls = []
+    def fetch(chunk):
+        calls.append(chunk)
+        if len(calls) < 3:
+            raise requests.exceptions.ConnectionError()
+        return chunk
+    assert make_twesearch()._fetch_chunks(fetch, [['1', '2']], 'tweets') == ['1', '2']
+    assert len(calls) == 3
+
+def test_retries_run_out():
+    calls = []
+    def fetch(chunk):
+        calls.append(chunk)
+        raise http_error(503)
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_twesearch(chunk_retries=2)._fetch_chunks(fetch, [['1']], 'tweets')
+    assert len(calls) == 3
+
+@pytest.mark.parametrize('error', [KeyError('id'), http_error(403), requests.exceptions.HTTPError()])
+def test_permanent_errors_are_raised_at_once(error):
+    calls = []
+    def fetch(chunk):
+        calls.append(chunk)
+        raise error
+    with pytest.raises(type(error)):
+        make_twesearch()._fetch_chunks(fetch, [['1']], 'tweets')
+    assert len(calls) == 1
@@ -0,0 +1,42 @@
+from twesearch.lib.neo4j_importer import build_tweet_stages, build_user_stages, _unique
+from twesearch.lib.util import format_tweets_for_neo4j
+
+
+def stage_rows(stages):
+    return {name: rows for name, _, rows, _ in stages}
+
+def test_unique_dedupes_and_sorts():
+    assert _unique(['3', '1', '3', '2']) == ['1', '2', '3']
+    rows = [{'id': '2', 'v': 'a'}, {'id': '1', 'v': 'b'}, {'id': '2', 'v': 'c'}]
+    assert _unique(rows, lambda r: r['id']) == [{'id': '1', 'v': 'b'}, {'id': '2', 'v': 'c'}]
+
+def test_tweet_stages():
+    tweets = [{'id': '10', 'text': 'hi #Tag', 'author_id': '1', 'source': 'web',
+               'entities': {'hashtags': [{'tag': 'Tag'}], 'mentions': [{'username': 'bob'}]},
+               'referenced_tweets': [{'type': 'replied_to', 'id': '9'}]}]
+    users = [{'id': '1', 'username': 'alice'}]
+    rows = stage_rows(build_tweet_stages(format_tweets_for_neo4j(tweets, users)))
+    assert [r['id'] for r in rows['tweet nodes']] == ['10']
+    assert [r['id'] for r in rows['author nodes']] == ['1']
+    assert rows['referenced tweet nodes'] == ['9']
+    assert rows['POSTED'] == [{'user_id': '1', 'tweet_id': '10'}]
+    assert rows['HAS_TAG'] == [{'tweet_id': '10', 'tag': 'tag'}]
+    assert rows['MENTIONED'] == [{'tweet_id': '10', 'username': 'bob'}]
+    assert rows['REPLIED_TO'] == [{'tweet_id': '10', 'referenced_id': '9'}]
+
+def test_tweet_without_author_id_does_not_abort_the_import():
+    tweets = [{'id': '10', 'text': 'withheld'},
+              {'id': '11', 'text': 'no user', 'author_id': '2'},
+              {'id': '12', 'text': 'hi', 'author_id': '1'}]
+    users = [{'id': '1', 'username': 'alice'}]
+    rows = stage_rows(build_tweet_stages(format_tweets_for_neo4j(tweets, users)))
+    assert [r['id'] for r in rows['tweet nodes']] == ['10', '11', '12']
+    assert rows['follow user nodes'] == ['2']
+    assert rows['POSTED'] == [{'user_id': '1', 'tweet_id': '12'}, {'user_id': '2', 'tweet_id': '11'}]
+
+def test_user_stages():
+    users = [{'id': '1', 'username': 'alice', 'url': 'https://example.com', 'followers': ['2', '3']}]
+    rows = stage_rows(build_user_stages(users))
+    assert [r['id'] for r in rows['user nodes']] == ['1']
+    assert 'followers' not in rows['user nodes'][0]
+    assert rows['follow user nodes'] == ['2', '3']
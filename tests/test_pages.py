@@ -0,0 +1,46 @@
+import twesearch.twesearch as tw
+
+
+class FakeStream:
+    """
+    One page per stream, like RateLimitedResultStream with single_page: users 0..total in pages of
+    max_results, with a next token while there are more
+    """
+    total = 0
+    requests = []
+
+    def __init__(self, rate_limiter, api, single_page=False, http_pool=None, request_parameters=None,
+                 max_results=None, **kwargs):
+        import json
+        start = int(json.loads(request_parameters).get('pagination_token') or 0)
+        self.users = [{'id': str(i), 'username': f'u{i}'} for i in range(start, min(start + max_results, self.total))]
+        end = start + len(self.users)
+        self.page_next_token = str(end) if end < self.total else None
+        self.meta = {'result_count': len(self.users)}
+        FakeStream.requests.append(start)
+
+    def stream(self):
+        return [{'users': self.users}] if self.users else []
+
+def make_twesearch(monkeypatch, total):
+    monkeypatch.setattr(tw, 'RateLimitedResultStream', FakeStream)
+    FakeStream.total = total
+    FakeStream.requests = []
+    twesearch = tw.Twesearch.__new__(tw.Twesearch)
+    twesearch.search_args = {'output_format': 'm'}
+    twesearch.compact = False
+    twesearch.rate_limiter = None
+    twesearch.http_pool = None
+    return twesearch
+
+def test_last_page_has_no_next_token(monkeypatch):
+    twesearch = make_twesearch(monkeypatch, total=25)
+    pages = list(twesearch._iter_pages({'id': '1'}, 'followers', 10, 100))
+    assert [len(p['users']) for p in pages] == [10, 10, 5]
+    assert [p['next_token'] for p in pages] == ['10', '20', None]
+
+def test_fetch_cut_off_at_max_results_keeps_the_next_token(monkeypatch):
+    twesearch = make_twesearch(monkeypatch, total=25)
+    pages = list(twesearch._iter_pages({'id': '1'}, 'followers', 10, 20))
+    assert [len(p['users']) for p in pages] == [10, 10]
+    assert pages[-1]['next_token'] == '20'
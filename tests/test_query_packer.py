@@ -0,0 +1,74 @@
+from twesearch.lib.query_packer import QUERY_MAX_LENGTH, demux, is_packable, pack_queries, pack_query_text
+
+
+def query(text, since_id=None, quota_override=None):
+    return {'query': text, 'since_id': since_id, 'quota_override': quota_override, 'active': True}
+
+def tweet(tweet_id, text, **fields):
+    return dict({'id': str(tweet_id), 'text': text}, **fields)
+
+def test_packable_queries():
+    assert is_packable(query('#tag'))
+    assert is_packable(query('$cash'))
+    assert is_packable(query('@user'))
+    assert is_packable(query('keyword'))
+    assert not is_packable(query('two words'))
+    assert not is_packable(query('#tag -is:retweet'))
+    assert not is_packable(query('"exact phrase"'))
+    assert not is_packable(query('#tag', quota_override=True))
+
+def test_packs_fit_the_length_limit_exactly():
+    # Every term is 9 characters, so a pack of n is 2 + 9n + 4(n - 1) characters
+    terms = [f'#term{i:04d}' for i in range(100)]
+    packs, unpacked = pack_queries([query(t) for t in terms])
+    assert unpacked == []
+    assert all(len(p['query']) <= QUERY_MAX_LENGTH for p in packs)
+    # 39 terms make 505 characters, a 40th would make 518
+    assert [len(p['members']) for p in packs] == [39, 39, 22]
+    assert len(packs[0]['query']) == 505
+    assert sorted(m['query'] for p in packs for m in p['members']) == terms
+
+def test_pack_boundary_at_max_length():
+    terms = ['#aaa', '#bbb', '#ccc']
+    fits = len(pack_query_text(terms))
+    packs, unpacked = pack_queries([query(t) for t in terms], max_length=fits)
+    assert [len(p['members']) for p in packs] == [3]
+    packs, unpacked = pack_queries([query(t) for t in terms], max_length=fits - 1)
+    # The third term doesn't fit, and a pack of one is left as the plain query
+    assert [len(p['members']) for p in packs] == [2]
+    assert [q['query'] for q in unpacked] == ['#ccc']
+
+def test_unpackable_queries_are_left_alone():
+    queries = [query('#one'), query('two words'), query('#three')]
+    packs, unpacked = pack_queries(queries)
+    assert [p['query'] for p in packs] == ['(#one OR #three)']
+    assert [q['query'] for q in unpacked] == ['two words']
+
+def test_pack_since_id_is_the_oldest_member_since_id():
+    packs, _ = pack_queries([query('#a', '100'), query('#b', '90'), query('#c', '120')])
+    assert packs[0]['since_id'] == '90'
+    packs, _ = pack_queries([query('#a', '100'), query('#b')])
+    assert packs[0]['since_id'] is None
+
+def test_demux_routes_by_text_entities_and_references():
+    pack = pack_queries([query('#fraud'), query('@someone'), query('audit')])[0][0]
+    tweets = [tweet(1, 'about #Fraud'),
+              tweet(2, 'hi', entities={'mentions': [{'username': 'SomeOne'}]}),
+              tweet(3, 'RT', referenced_tweets=[{'type': 'retweeted', 'id': '4'}]),
+              tweet(4, 'the audit is on'),
+              tweet(5, 'auditing is not a match'),
+              tweet(6, 'nothing here')]
+    routed, unrouted = demux(pack, tweets)
+    assert [t['id'] for t in routed['#fraud']] == ['1']
+    assert [t['id'] for t in routed['@someone']] == ['2']
+    assert [t['id'] for t in routed['audit']] == ['3', '4']
+    assert [t['id'] for t in unrouted] == ['5', '6']
+
+def test_demux_only_routes_tweets_newer_than_the_member_since_id():
+    pack = pack_queries([query('#a', '100'), query('#b', '200'), query('#c')])[0][0]
+    tweets = [tweet(150, '#a #b #c'), tweet(250, '#a #b #c'), tweet(100, '#a #b #c'), tweet(200, '#b')]
+    routed, unrouted = demux(pack, tweets)
+    assert [t['id'] for t in routed['#a']] == ['150', '250']
+    assert [t['id'] for t in routed['#b']] == ['250']
+    assert [t['id'] for t in routed['#c']] == ['150', '250', '100']
+    assert [t['id'] for t in unrouted] == ['200']
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from twesearch.lib.query_registry import QueryRegistry, SubstringAutomaton, normalize_query
+
+
+def occurrences(pattern, text):
+    """
+    Brute-force count of (possibly overlapping) occurrences of pattern in text
+    """
+    return sum(1 for i in range(len(text) - len(pattern) + 1) if text.startswith(pattern, i))
+
+def automaton_counts(patterns, text):
+    counts = {}
+    for index in SubstringAutomaton(patterns).search(text):
+        counts[patterns[index]] = counts.get(patterns[index], 0) + 1
+    return counts
+
+def brute_force_counts(patterns, text):
+    return {p: occurrences(p, text) for p in patterns if occurrences(p, text)}
+
+def query(text, active=True):
+    return {'query': text, 'active': active}
+
+@pytest.mark.parametrize('patterns, text', [
+    (['he', 'she', 'his', 'hers'], 'ushers'),
+    (['a', 'aa', 'aaa'], 'aaaa'),
+    (['abcd', 'bc', 'c', 'bcd'], 'xabcdx'),
+    (['election', 'elect', 'lection', 'fraud'], '#electionfraud and election day'),
+    (['aba', 'bab'], 'abababa'),
+    (['x'], ''),
+])
+def test_automaton_matches_brute_force(patterns, text):
+    assert automaton_counts(patterns, text) == brute_force_counts(patterns, text)
+
+def test_automaton_matches_brute_force_on_random_input():
+    rng = random.Random(0)
+    for _ in range(200):
+        patterns = list({''.join(rng.choice('ab') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))})
+        text = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 30)))
+        assert automaton_counts(patterns, text) == brute_force_counts(patterns, text)
+
+def test_registry_normalizes_and_skips_duplicates():
+    registry = QueryRegistry([query('#ElectionFraud'), query('#electionfraud'), query('stop  the steal')])
+    assert len(registry) == 2
+    assert [q['query'] for q in registry.duplicates] == ['#electionfraud']
+    assert '#ELECTIONFRAUD' in registry
+    assert registry.get('Stop the Steal')['query'] == 'stop  the steal'
+
+def test_add_returns_only_new_queries():
+    registry = QueryRegistry([query('#one')])
+    added = registry.add([query('#ONE'), query('#two'), query('#two')])
+    assert [q['query'] for q in added] == ['#two']
+    assert len(registry) == 2
+
+def test_contained_matches_brute_force():
+    existing = ['#stopthesteal', '#electionfraud2020', 'dominion voting', 'riggedelection']
+    terms = ['steal', 'StopTheSteal', 'fraud2020', 'election', 'rigged', 'voting machines', 'dominion', 'absent', ' ']
+    registry = QueryRegistry(query(q) for q in existing)
+    expected = {normalize_query(t) for t in terms if t.strip() and any(normalize_query(t) in e for e in existing)}
+    assert registry.contained(terms) == expected
+    assert registry.contained(terms) == {'steal', 'stopthesteal', 'fraud2020', 'election', 'rigged', 'dominion'}
+
+def test_delta_keeps_order_and_drops_covered_blocked_and_short_terms():
+    registry = QueryRegistry([query('#stopthesteal'), query('audit')])
+    terms = ['NewTerm', 'steal', 'newterm', 'audit', 'fraud', 'xyz', 'blocked word', 'Another One']
+    assert registry.delta(terms, block_words=['Blocked Word']) == ['newterm', 'fraud', 'another one']
+
+def test_delta_matches_brute_force_scan():
+    rng = random.Random(1)
+    words = [''.join(rng.choice('abcde') for _ in range(rng.randint(2, 6))) for _ in range(300)]
+    existing = sorted({'#' + w for w in words[:150]})
+    terms = words[100:]
+    registry = QueryRegistry(query(q) for q in existing)
+    expected = list(dict.fromkeys(t for t in terms if len(t) >= 4 and not any(t in e for e in existing)))
+    assert registry.delta(terms) == expected
+
+def test_deactivate_and_remove():
+    registry = QueryRegistry([query('#one'), query('#two'), query('#three')])
+    assert [q['query'] for q in registry.deactivate(['#ONE', '#missing'])] == ['#one']
+    assert registry.deactivate(['#one']) == []
+    assert [q['query'] for q in registry.active()] == ['#two', '#three']
+
+    removed = registry.remove(['#two', '#missing'])
+    assert [q['query'] for q in removed] == ['#two']
+    assert '#two' not in registry
+    assert registry.get('#two') is None
+    assert registry.contained(['two']) == set()
+    # A removed query no longer covers new terms, and can be added back
+    assert registry.delta(['#two'], min_length=0) == ['#two']
+    assert [q['query'] for q in registry.add([query('#two')])] == ['#two']
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from twesearch.lib.quota_allocator import QuotaAllocator
+
+
+def iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+def test_packs_are_seeded_from_their_members_runs():
+    now = datetime.datetime(2021, 6, 1).timestamp()
+    history = [('#a', iso(now - 300), 4), ('#b', iso(now - 299), 6),
+               ('#a', iso(now - 200), 2), ('#b', iso(now - 199), 0),
+               ('#solo', iso(now - 100), 10)]
+    allocator = QuotaAllocator(600, alpha=0.5)
+    allocator.set_queries(['(#a OR #b)', '#solo'])
+    allocator.seed(history, packs={'(#a OR #b)': ['#a', '#b']})
+    pack = allocator.queries['(#a OR #b)']
+    # EWMA per member (#a: 3, #b: 3), summed for the pack
+    assert pack['yield'] == pytest.approx(6)
+    assert pack['runs'] == 2
+    assert pack['last_hit'] == pytest.approx(now - 200, abs=1)
+    assert allocator.queries['#solo']['yield'] == 10
+    # Members aren't scheduled on their own
+    assert set(allocator.queries) == {'(#a OR #b)', '#solo'}
+
+def test_pack_without_history_starts_cold():
+    allocator = QuotaAllocator(600)
+    allocator.set_queries(['(#a OR #b)'])
+    allocator.seed([], packs={'(#a OR #b)': ['#a', '#b']})
+    assert allocator.queries['(#a OR #b)']['yield'] is None
+
+NOW = datetime.datetime(2021, 6, 11).timestamp()
+# Twenty days left of a period that started on June 1st
+QUOTA = {'quota_max': 2000000, 'quota_used': 500000, 'quota_start_date': '2021-06-01T00:00:00'}
+SECONDS_LEFT = datetime.datetime(2021, 7, 1).timestamp() - NOW
+
+def allocator_with_history(strategy):
+    allocator = QuotaAllocator(900, strategy=strategy, alpha=0.3)
+    allocator.set_queries(['#busy', '#steady', '#quiet', '#new'])
+    for hours_ago, counts in [(3, (400, 50, 0)), (2, (600, 40, 1)), (1, (500, 60, 0))]:
+        for name, count in zip(['#busy', '#steady', '#quiet'], counts):
+            allocator.record(name, count, max_results=1000, at=NOW - hours_ago * 3600)
+    return allocator
+
+def test_ewma_weights_recent_runs():
+    allocator = QuotaAllocator(900, alpha=0.3)
+    allocator.record('#q', 100, at=NOW - 2)
+    allocator.record('#q', 0, at=NOW - 1)
+    allocator.record('#q', 50, at=NOW)
+    # 100, then 0.3 * 0 + 0.7 * 100 = 70, then 0.3 * 50 + 0.7 * 70 = 64
+    assert allocator.queries['#q']['yield'] == pytest.approx(64)
+
+def test_yield_allocations_sum_to_the_remaining_quota():
+    allocator = allocator_with_history('yield')
+    remaining = QUOTA['quota_max'] - QUOTA['quota_used']
+    # Every query runs SECONDS_LEFT / delay more times, fetching max_results each time
+    runs = {name: SECONDS_LEFT / allocator.delay(name, now=NOW) for name in allocator.queries}
+    planned = sum(allocator.max_results(name, QUOTA, now=NOW) * runs[name] for name in allocator.queries)
+    # Never more than the quota, and short of it only by rounding each run down to whole tweets
+    assert remaining - sum(runs.values()) <= planned <= remaining
+    shares = {name: allocator.max_results(name, QUOTA, now=NOW) for name in allocator.queries}
+    assert shares['#busy'] > shares['#steady'] > shares['#quiet']
+    # A query that hasn't run yet is planned at the average yield
+    assert allocator.score('#new', now=NOW) == pytest.approx(allocator._prior())
+
+def test_even_strategy_splits_the_quota_over_every_run():
+    allocator = allocator_with_history('even')
+    remaining = QUOTA['quota_max'] - QUOTA['quota_used']
+    iterations = int(SECONDS_LEFT / 900)
+    runs_left = iterations * len(allocator.queries)
+    assert all(allocator.delay(name, now=NOW) == 900 for name in allocator.queries)
+    assert all(allocator.max_results(name, QUOTA, now=NOW) == int(remaining / runs_left) for name in allocator.queries)
+
+def test_exhausted_quota_allocates_nothing():
+    allocator = allocator_with_history('yield')
+    quota = dict(QUOTA, quota_used=QUOTA['quota_max'] + 10)
+    assert all(allocator.max_results(name, quota, now=NOW) == 0 for name in allocator.queries)
+
+def test_idle_queries_decay_and_run_less_often():
+    allocator = QuotaAllocator(900, idle_half_life=3600)
+    allocator.record('#a', 100, at=NOW)
+    allocator.record('#b', 100, at=NOW - 7200)
+    assert allocator.score('#b', now=NOW) == pytest.approx(25)
+    assert allocator.delay('#b', now=NOW) > allocator.delay('#a', now=NOW)
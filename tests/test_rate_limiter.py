@@ -0,0 +1,93 @@
+import pytest
+
+from twesearch.lib import rate_limiter
+from twesearch.lib.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """
+    Stands in for the time module. sleep only advances the clock with advance_on_sleep, otherwise
+    it just records the wait, like concurrent callers that all reserved before anyone woke up
+    """
+
+    def __init__(self, advance_on_sleep=True):
+        self.now = 1000.0
+        self.advance_on_sleep = advance_on_sleep
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.advance_on_sleep:
+            self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', fake)
+    return fake
+
+def test_full_bucket_does_not_wait(clock):
+    limiter = RateLimiter({'search': (3, 30)})
+    assert [limiter.acquire('search') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert clock.sleeps == []
+
+def test_empty_bucket_waits_for_one_token(clock):
+    limiter = RateLimiter({'search': (3, 30)})
+    for _ in range(3):
+        limiter.acquire('search')
+    # 3 tokens per 30s refill one every 10s
+    assert limiter.acquire('search') == pytest.approx(10.0)
+
+def test_refill_is_capped_at_the_limit(clock):
+    limiter = RateLimiter({'search': (3, 30)})
+    for _ in range(3):
+        limiter.acquire('search')
+    clock.now += 3600
+    assert [limiter.acquire('search') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire('search') == pytest.approx(10.0)
+
+def test_concurrent_callers_reserve_places_in_line(clock):
+    clock.advance_on_sleep = False
+    limiter = RateLimiter({'search': (3, 30)})
+    for _ in range(3):
+        limiter.acquire('search')
+    waits = [limiter.acquire('search') for _ in range(3)]
+    assert waits == [pytest.approx(10.0), pytest.approx(20.0), pytest.approx(30.0)]
+    assert limiter.stats()['search']['tokens'] == -3
+
+def test_headers_resync_the_bucket(clock):
+    limiter = RateLimiter({'search': (450, 900)})
+    limiter.update('search', {'x-rate-limit-limit': '450', 'x-rate-limit-remaining': '0',
+                              'x-rate-limit-reset': str(int(clock.time()) + 60)})
+    # Nothing refills before the reset the server gave
+    assert limiter.acquire('search') == pytest.approx(60.0)
+    # Once the reset has passed the whole window's worth comes back, less the reservation
+    assert limiter.acquire('search') == 0.0
+    assert limiter.stats()['search']['tokens'] == pytest.approx(448)
+
+def test_reservations_past_the_reset_wait_whole_windows(clock):
+    clock.advance_on_sleep = False
+    limiter = RateLimiter({'tweets': (300, 900)})
+    limiter.update('tweets', {'x-rate-limit-limit': '2', 'x-rate-limit-remaining': '0',
+                              'x-rate-limit-reset': str(int(clock.time()) + 60)})
+    waits = [limiter.acquire('tweets') for _ in range(3)]
+    assert waits == [pytest.approx(60.0), pytest.approx(60.0), pytest.approx(960.0)]
+
+def test_update_without_rate_limit_headers_is_ignored(clock):
+    limiter = RateLimiter({'search': (3, 30)})
+    limiter.acquire('search')
+    limiter.update('search', {'content-type': 'application/json'})
+    assert limiter.stats()['search']['tokens'] == 2
+    assert limiter.stats()['search']['limit'] == 3
+
+def test_limits_are_per_endpoint(clock):
+    limiter = RateLimiter({'search': (1, 30), 'tweets': (1, 30)})
+    assert limiter.acquire('search') == 0.0
+    assert limiter.acquire('tweets') == 0.0
+    assert limiter.acquire('search') == pytest.approx(30.0)
@@ -0,0 +1,60 @@
+from twesearch.lib.query_packer import pack_query_text
+from twesearch.lib.reference_graph import ExpansionFrontier, conversation_queries, referenced_ids
+
+
+def tweet(tweet_id, references=(), conversation_id=None):
+    return {'id': tweet_id, 'referenced_tweets': [{'type': 'replied_to', 'id': r} for r in references],
+            'conversation_id': conversation_id or tweet_id}
+
+def test_referenced_ids_include_the_conversation_root():
+    assert referenced_ids(tweet('2', ['1'], conversation_id='1')) == ['1', '1']
+    assert referenced_ids(tweet('1')) == []
+    assert referenced_ids({'id': '5', 'referenced_tweets': [{'id': 4}]}) == ['4']
+
+def test_seeds_are_queued_once():
+    frontier = ExpansionFrontier(['1', 2, '1'])
+    assert frontier.take() == ['1', '2']
+    assert len(frontier) == 0
+
+def test_add_queues_unseen_references_in_order():
+    frontier = ExpansionFrontier(['1'])
+    frontier.take()
+    assert frontier.add([tweet('1', ['3', '2']), tweet('4', ['2', '1', '4'])]) == 2
+    assert frontier.take() == ['3', '2']
+    # Already hydrated, queued or handed out, so never queued again
+    assert frontier.add([tweet('3', ['1', '2', '4'])]) == 0
+    assert frontier.take() == []
+
+def test_tweets_seen_in_includes_are_not_queued():
+    frontier = ExpansionFrontier()
+    frontier.mark_seen([{'id': '2'}])
+    frontier.add([tweet('1', ['2', '3'])])
+    assert frontier.take() == ['3']
+
+def test_take_cuts_the_level_to_the_limit_and_drops_the_rest():
+    frontier = ExpansionFrontier(['1', '2', '3'])
+    assert frontier.take(2) == ['1', '2']
+    assert len(frontier) == 0
+    # The dropped ID stays seen, so a later reference doesn't bring it back a level deeper
+    frontier.add([tweet('4', ['3'])])
+    assert frontier.take() == []
+
+def test_drop():
+    frontier = ExpansionFrontier(['1', '2'])
+    assert frontier.drop() == 2
+    assert frontier.take() == []
+
+def test_conversations_are_collected_once():
+    frontier = ExpansionFrontier()
+    frontier.add([tweet('2', conversation_id='1'), tweet('3', conversation_id='1'), tweet('5')])
+    assert frontier.take_conversations() == ['1', '5']
+    frontier.add([tweet('6', conversation_id='1')])
+    assert frontier.take_conversations() == []
+
+def test_conversation_queries_fit_the_length():
+    ids = [str(10 ** 18 + i) for i in range(40)]
+    queries = conversation_queries(ids, max_length=200)
+    assert len(queries) > 1
+    assert all(len(q) <= 200 for q in queries)
+    assert ''.join(queries).count('conversation_id:') == 40
+    assert conversation_queries(ids[:1]) == [pack_query_text([f'conversation_id:{ids[0]}'])]
@@ -0,0 +1,83 @@
+import gzip
+import os
+
+import pytest
+
+from twesearch.lib.spool import Spool
+
+
+def records(spool, checkpoint=None):
+    return [record for _, record in spool.read(checkpoint)]
+
+def last_segment_path(spool):
+    return spool._segment_path(spool.segments()[-1])
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / 'spool'))
+
+def test_append_and_read_round_trip(spool):
+    spool.append([{'n': 1}, {'n': 2}])
+    spool.append([{'n': 3}])
+    read = list(spool.read())
+    assert [record for _, record in read] == [{'n': 1}, {'n': 2}, {'n': 3}]
+    assert [checkpoint for checkpoint, _ in read] == [{'segment': 1, 'line': 1}, {'segment': 1, 'line': 2},
+                                                       {'segment': 1, 'line': 3}]
+
+def test_resume_from_checkpoint(spool):
+    spool.append([{'n': n} for n in range(5)])
+    for checkpoint, record in spool.read():
+        spool.write_checkpoint(checkpoint)
+        if record['n'] == 2:
+            break
+    # A new reader, as after a restart, picks up after the last imported record
+    assert records(Spool(spool.directory)) == [{'n': 3}, {'n': 4}]
+    spool.reset_checkpoint()
+    assert len(records(spool)) == 5
+
+def test_resume_across_segments(tmp_path):
+    spool = Spool(str(tmp_path / 'spool'), segment_max_bytes=1)
+    for n in range(4):
+        assert spool.append([{'n': n}]) == n + 1
+    spool.write_checkpoint({'segment': 2, 'line': 1})
+    assert records(spool) == [{'n': 2}, {'n': 3}]
+
+def test_truncated_trailing_member_is_left_for_later(spool):
+    spool.append([{'n': 1}])
+    member = gzip.compress(b'{"n":2}\n')
+    with open(last_segment_path(spool), 'ab') as f:
+        f.write(member[:len(member) // 2])
+    assert records(spool) == [{'n': 1}]
+    # Appends after the crash are still read, past the damaged bytes
+    spool.append([{'n': 3}])
+    assert records(spool) == [{'n': 1}, {'n': 3}]
+
+def test_corrupt_member_is_skipped(spool):
+    spool.append([{'n': 1}])
+    spool.append([{'n': 2}])
+    spool.append([{'n': 3}])
+    path = last_segment_path(spool)
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    second = data.find(b'\x1f\x8b\x08', 1)
+    # Clobber the compressed body of the second member, leaving its header in place
+    data[second + 12:second + 16] = b'\xff\xff\xff\xff'
+    with open(path, 'wb') as f:
+        f.write(bytes(data))
+    assert records(spool) == [{'n': 1}, {'n': 3}]
+
+def test_prune_keeps_unacknowledged_segments(tmp_path):
+    spool = Spool(str(tmp_path / 'spool'), segment_max_bytes=1)
+    for n in range(4):
+        spool.append([{'n': n}])
+    spool.write_checkpoint({'segment': 3, 'line': 0})
+    assert spool.prune() == 2
+    assert spool.segments() == [3, 4]
+    assert records(spool) == [{'n': 2}, {'n': 3}]
+    # Nothing at or after the checkpoint is ever removed
+    assert spool.prune() == 0
+
+def test_empty_spool(spool):
+    assert records(spool) == []
+    assert spool.prune() == 0
+    assert os.path.isdir(spool.directory)
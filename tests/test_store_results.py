@@ -0,0 +1,60 @@
+from twesearch.lib.easy_importer import store_results
+from twesearch.lib.spool import Spool
+
+
+class FakeNeo4j:
+    def __init__(self):
+        self.inserted = []
+
+    def insert(self, label, records):
+        self.inserted.append((label, len(records)))
+
+class FakeCouchbase:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.upserted = []
+
+    def upsert_documents(self, bucket, docs):
+        self.upserted.append((bucket, [d['id'] for d in docs]))
+        return {'failed': {d['id']: 'timeout' for d in docs if d['id'] in self.failing}}
+
+class FakeStore:
+    def __init__(self):
+        self.known = []
+
+    def add_known(self, tweets):
+        self.known.extend(t['id'] for t in tweets)
+
+def results():
+    tweets = [{'id': '1', 'author_id': '10', 'text': 'a'}, {'id': '2', 'author_id': '10', 'text': 'b'}]
+    users = [{'id': '10', 'username': 'someone'}]
+    return tweets, users
+
+def test_imports_into_both_databases():
+    tweets, users = results()
+    neo4j, couchbase, store = FakeNeo4j(), FakeCouchbase(), FakeStore()
+    assert store_results(tweets, users, neo4j=neo4j, couchbase=couchbase, tweet_id_store=store) == 2
+    assert couchbase.upserted == [('tweets', ['1', '2']), ('users', ['10'])]
+    assert neo4j.inserted == [('tweets', 2), ('users', 1)]
+    assert store.known == ['1', '2']
+
+def test_couchbase_failures_are_not_known():
+    tweets, users = results()
+    store = FakeStore()
+    assert store_results(tweets, users, couchbase=FakeCouchbase(failing={'2'}), tweet_id_store=store) == 1
+    assert store.known == ['1']
+
+def test_spooled_tweets_are_known(tmp_path):
+    tweets, users = results()
+    spool, store = Spool(str(tmp_path / 'spool')), FakeStore()
+    neo4j = FakeNeo4j()
+    assert store_results(tweets, users, neo4j=neo4j, spool=spool, tweet_id_store=store) == 2
+    assert neo4j.inserted == []
+    assert [r['tweets'] for _, r in spool.read()] == [tweets]
+    assert store.known == ['1', '2']
+
+def test_nothing_known_without_a_sink():
+    tweets, users = results()
+    store = FakeStore()
+    assert store_results(tweets, users, tweet_id_store=store) == 0
+    assert store.known == []
@@ -0,0 +1,55 @@
+import datetime
+
+from twesearch.lib.tweet_id_store import TweetIdStore, LOOKUP_BATCH_SIZE
+
+
+def make_store(tmp_path, **kwargs):
+    return TweetIdStore(str(tmp_path / 'ids.db'), **kwargs)
+
+def test_partition_keeps_order(tmp_path):
+    store = make_store(tmp_path)
+    store.add_known([{'id': '2'}, {'id': '5'}])
+    store.add_missing(['3'])
+    assert store.partition(['1', '2', '3', '4', '5']) == (['1', '4'], ['2', '5'], ['3'])
+
+def test_partition_spans_lookup_batches(tmp_path):
+    store = make_store(tmp_path)
+    ids = [str(i) for i in range(1, 2 * LOOKUP_BATCH_SIZE + 10)]
+    store.add_known({'id': i} for i in ids[::2])
+    to_fetch, known, missing = store.partition(ids)
+    assert known == ids[::2]
+    assert to_fetch == ids[1::2]
+    assert missing == []
+
+def test_missing_ids_are_retried_after_a_while(tmp_path):
+    store = make_store(tmp_path, retry_missing_after=3600)
+    store.add_missing(['1', '2'])
+    stale = (datetime.datetime.now() - datetime.timedelta(hours=2)).isoformat()
+    with store.db:
+        store.db.execute('UPDATE missing_tweets SET last_checked_at = ? WHERE id = 1', (stale,))
+    assert store.partition(['1', '2']) == (['1'], [], ['2'])
+
+def test_tweets_that_come_back_are_no_longer_missing(tmp_path):
+    store = make_store(tmp_path)
+    store.add_missing(['1'])
+    store.add_known([{'id': '1'}])
+    assert store.missing() == []
+    assert store.stats() == {'known': 1, 'missing': 0}
+
+def test_known_references(tmp_path):
+    store = make_store(tmp_path)
+    store.add_known([{'id': '3', 'referenced_tweets': [{'type': 'quoted', 'id': '1'}, {'type': 'replied_to', 'id': '2'}],
+                      'conversation_id': '2'},
+                     {'id': '4', 'conversation_id': '4'},
+                     {'id': '5'}])
+    references = {t['id']: t for t in store.known_references(['3', '4', '5', '6'])}
+    assert set(references) == {'3', '4', '5'}
+    assert references['3'] == {'id': '3', 'referenced_tweets': [{'id': '1'}, {'id': '2'}], 'conversation_id': '2'}
+    assert references['4'] == {'id': '4', 'referenced_tweets': [], 'conversation_id': '4'}
+    assert references['5']['conversation_id'] is None
+
+def test_add_known_replaces_references(tmp_path):
+    store = make_store(tmp_path)
+    store.add_known([{'id': '3'}])
+    store.add_known([{'id': '3', 'referenced_tweets': [{'id': '1'}]}])
+    assert store.known_references(['3'])[0]['referenced_tweets'] == [{'id': '1'}]
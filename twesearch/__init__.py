@@ -1 +1,11 @@
-from .twesearch import Twesearch
+# Twesearch pulls in searchtweets and its HTTP stack, so it is only imported on first use.
+# That keeps `import twesearch.lib.<module>` cheap for scripts that never call the API
+
+__all__ = ['Twesearch']
+
+
+def __getattr__(name):
+    if name == 'Twesearch':
+        from .twesearch import Twesearch
+        return Twesearch
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,38 +1,110 @@
-import couchbase
-from couchbase.cluster import Cluster, ClusterOptions
-from couchbase_core.cluster import PasswordAuthenticator
-import couchbase.subdocument as SD
-from couchbase.durability import Durability
-from couchbase.cluster import QueryOptions
-from .util import create_stdout_logger
+from .util import ghetto_split
+from .records import to_dict
+from .metrics import METRICS
 import logging
+import threading
+import time
 
 class CouchbaseImporter:
     def __init__(self, cb_uri, auth):
-        self.cluster = Cluster(cb_uri, ClusterOptions(
-            PasswordAuthenticator(auth['user'], auth['password'])))
-        tweet_bucket = self.cluster.bucket('tweets')
-        users_bucket = self.cluster.bucket('twitter_users')
+        # The couchbase SDK is imported and the cluster connected on first use, by _connect
+        self.cb_uri = cb_uri
+        self.auth = auth
+        self.cluster = None
+        self._collections = None
+        self._connect_lock = threading.Lock()
 
-        self.tweet_collection = tweet_bucket.default_collection()
-        self.users_collection = users_bucket.default_collection()
+        # Logging is configured by the calling script, not here
+        self.logger = logging.getLogger(__name__)
+
+    def _connect(self):
+        with self._connect_lock:
+            if self._collections is None:
+                from couchbase.cluster import Cluster, ClusterOptions
+                from couchbase_core.cluster import PasswordAuthenticator
+                self.cluster = Cluster(self.cb_uri, ClusterOptions(
+                    PasswordAuthenticator(self.auth['user'], self.auth['password'])))
+                self._collections = {'tweets': self.cluster.bucket('tweets').default_collection(),
+                                     'users': self.cluster.bucket('twitter_users').default_collection()}
+            return self._collections
+
+    @property
+    def tweet_collection(self):
+        return self._connect()['tweets']
+
+    @property
+    def users_collection(self):
+        return self._connect()['users']
+
+    def _collection(self, bucket):
+        return self._connect().get(bucket)
+
+    def existing_keys(self, bucket, keys, batch_size=1000):
+        """
+        Returns the set of keys that have a document in bucket, looked up batch_size keys per get_multi
+        call. Can be passed to Twesearch.get_tweets_by_ids as known_ids, with functools.partial(existing_keys, 'tweets')
+        """
+        from couchbase.exceptions import CouchbaseException
+        keys = list(keys)
+        bucket_collection = self._collection(bucket)
+        existing = set()
+        for batch in ghetto_split(keys, batch_size):
+            try:
+                results = bucket_collection.get_multi(batch)
+            except CouchbaseException as e:
+                # Missing keys fail the batch, the per-key results still say which ones exist
+                results = getattr(e, 'all_results', None) or {}
+            existing.update(key for key, result in results.items() if result.success)
+        logging.info(f"{len(existing)} of {len(keys)} keys are already in the {bucket} bucket")
+        return existing
 
-        self.logger = create_stdout_logger('debug')
-    
     def upsert_document(self, bucket, doc):
         try:
-            if bucket == 'tweets':
-                bucket_collection = self.tweet_collection
-            elif bucket == 'users':
-                bucket_collection = self.users_collection
+            bucket_collection = self._collection(bucket)
 
             key = doc["id"]
-            result = bucket_collection.upsert(key, doc)
+            result = bucket_collection.upsert(key, to_dict(doc))
             return result.cas
         except Exception as e:
-            print(e)
+            logging.error(f"Failed to upsert {doc.get('id')} to {bucket} bucket: {e}")
     
-    def upsert_documents(self, bucket, items):
-        logging.info(f'Upserting {len(items)} items to {bucket} bucket')
-        results = [self.upsert_document(bucket, item) for item in items]
-        logging.info(f"{len(results)} items upserted")
\ No newline at end of file
+    def upsert_documents(self, bucket, items, batch_size=1000):
+        """
+        Upserts items batch_size documents per upsert_multi call, so at most batch_size operations are
+        in flight at once. Returns {'succeeded': [keys], 'failed': {key: error}}
+        """
+        from couchbase.exceptions import CouchbaseException
+        logging.info(f'Upserting {len(items)} items to {bucket} bucket, {batch_size} per batch')
+        bucket_collection = self._collection(bucket)
+        report = {'succeeded': [], 'failed': {}}
+        for batch in ghetto_split(items, batch_size):
+            docs = {doc['id']: to_dict(doc) for doc in batch}
+            start = time.perf_counter()
+            try:
+                bucket_collection.upsert_multi(docs)
+                report['succeeded'].extend(docs.keys())
+                METRICS.inc('twesearch_import_rows_total', len(docs), sink='couchbase', stage=bucket)
+            except CouchbaseException as e:
+                # Only the keys whose per-key result failed are retried, one at a time. Without
+                # per-key results there's no telling which succeeded, so every key is retried
+                results = getattr(e, 'all_results', None) or {}
+                retry = {key: doc for key, doc in docs.items() if key not in results or not results[key].success}
+                succeeded = [key for key in docs if key not in retry]
+                report['succeeded'].extend(succeeded)
+                failed_before = len(report['failed'])
+                logging.warning(f"Batch of {len(docs)} to {bucket} bucket had failures, retrying {len(retry)} keys individually: {e}")
+                for key, doc in retry.items():
+                    try:
+                        bucket_collection.upsert(key, doc)
+                        report['succeeded'].append(key)
+                    except CouchbaseException as key_error:
+                        report['failed'][key] = str(key_error)
+                failed = len(report['failed']) - failed_before
+                METRICS.inc('twesearch_import_rows_total', len(docs) - failed, sink='couchbase', stage=bucket)
+                METRICS.inc('twesearch_import_failures_total', failed, sink='couchbase', stage=bucket)
+            METRICS.observe('twesearch_import_chunk_seconds', time.perf_counter() - start, sink='couchbase', stage=bucket)
+
+        logging.info(f"{len(report['succeeded'])} items upserted, {len(report['failed'])} failed")
+        if report['failed']:
+            logging.error(f"Failed to upsert to {bucket} bucket: {report['failed']}")
+        return report
\ No newline at end of file
@@ -0,0 +1,243 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import yaml
+from dateutil.relativedelta import relativedelta
+
+CRAWLER_STATE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    active INTEGER NOT NULL DEFAULT 1,
+    since_id TEXT,
+    quota_override INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS quota (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    quota_start_date TEXT NOT NULL,
+    quota_used INTEGER NOT NULL,
+    quota_max INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tweets_count INTEGER NOT NULL DEFAULT 0,
+    since_id TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_query ON runs (query);
+'''
+
+# Keys every query in the YAML query file has. Anything else is kept in the extra column
+QUERY_KEYS = ('query', 'active', 'since_id', 'quota_override')
+
+
+class CrawlerState:
+    """
+    SQLite store for the crawler's queries (with their since_ids), monthly quota usage and run
+    history. Every update is a single transaction, so a crash leaves either the old or the new
+    state, and several processes (crawler.py, get_timeline.py, add_query.py) can share one file.
+    Imports from and exports to the queries.yaml / quota.json formats.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(CRAWLER_STATE_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            with self.db:
+                yield self.db
+
+    def queries(self, active_only=False):
+        """
+        Returns the queries as the dicts the YAML query file holds
+        """
+        sql = 'SELECT query, active, since_id, quota_override, extra FROM queries'
+        if active_only:
+            sql += ' WHERE active = 1'
+        with self._lock:
+            rows = self.db.execute(sql + ' ORDER BY query').fetchall()
+        return [_row_to_query(row) for row in rows]
+
+    def get_query(self, query):
+        with self._lock:
+            row = self.db.execute('SELECT query, active, since_id, quota_override, extra FROM queries WHERE query = ?',
+                                  (query,)).fetchone()
+        return _row_to_query(row) if row else None
+
+    def upsert_queries(self, queries):
+        """
+        Inserts or replaces the given query dicts in one transaction
+        """
+        with self._transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO queries (query, active, since_id, quota_override, extra) VALUES (?, ?, ?, ?, ?)',
+                           [_query_to_row(q) for q in queries])
+        logging.info(f"Stored {len(queries)} queries")
+
+    def set_active(self, queries, active):
+        with self._transaction() as db:
+            db.executemany('UPDATE queries SET active = ? WHERE query = ?', [(int(active), q) for q in queries])
+
+    def remove_query(self, query, reason=None):
+        with self._transaction() as db:
+            db.execute('DELETE FROM queries WHERE query = ?', (query,))
+            self._insert_run(db, query, 'removed', error=reason)
+
+    def quota(self):
+        """
+        Returns the quota as quota.json holds it, starting a new quota period once a month has passed
+        """
+        with self._transaction() as db:
+            row = db.execute('SELECT quota_start_date, quota_used, quota_max FROM quota WHERE id = 1').fetchone()
+            if row is None:
+                raise ValueError(f"No quota in {self.path}, import one with bin/crawler_state.py --import-quota")
+            quota = {'quota_start_date': row[0], 'quota_used': row[1], 'quota_max': row[2]}
+            if datetime.datetime.now() > datetime.datetime.fromisoformat(quota['quota_start_date']) + relativedelta(months=1):
+                quota.update({'quota_start_date': str(datetime.date.today()), 'quota_used': 0})
+                db.execute('UPDATE quota SET quota_start_date = ?, quota_used = 0 WHERE id = 1', (quota['quota_start_date'],))
+                logging.info(f"Started a new quota period on {quota['quota_start_date']}")
+        return quota
+
+    def set_quota(self, quota):
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO quota (id, quota_start_date, quota_used, quota_max) VALUES (1, ?, ?, ?)',
+                       (quota['quota_start_date'], quota['quota_used'], quota['quota_max']))
+
+    def add_quota_used(self, tweets_count):
+        with self._transaction() as db:
+            db.execute('UPDATE quota SET quota_used = quota_used + ? WHERE id = 1', (tweets_count,))
+
+    def record_run(self, query, status, tweets_count=0, since_id=None, error=None):
+        """
+        Records one run of query. The run's tweets are added to the quota and, when since_id is
+        given, the query's since_id moves to it, all in the same transaction
+        """
+        self.record_runs([(query, status, tweets_count, since_id, error)])
+
+    def record_runs(self, runs, quota_used=None):
+        """
+        Records several (query, status, tweets_count, since_id, error) runs in one transaction, for
+        a packed search whose tweets were split between its queries. quota_used is what the whole
+        search cost, by default the sum of the runs' tweets_count
+        """
+        if quota_used is None:
+            quota_used = sum(run[2] for run in runs)
+        with self._transaction() as db:
+            if quota_used:
+                db.execute('UPDATE quota SET quota_used = quota_used + ? WHERE id = 1', (quota_used,))
+            for query, status, tweets_count, since_id, error in runs:
+                if since_id:
+                    db.execute('UPDATE queries SET since_id = ? WHERE query = ?', (str(since_id), query))
+                self._insert_run(db, query, status, tweets_count, since_id, error)
+
+    def recent_yields(self, runs=5):
+        """
+        Returns {query: average tweets per run} over each query's last runs successful runs
+        """
+        with self._lock:
+            rows = self.db.execute("SELECT query, tweets_count FROM runs WHERE status = 'ok' ORDER BY id DESC").fetchall()
+        counts = {}
+        for query, tweets_count in rows:
+            query_counts = counts.setdefault(query, [])
+            if len(query_counts) < runs:
+                query_counts.append(tweets_count)
+        return {query: sum(c) / len(c) for query, c in counts.items()}
+
+    def run_history(self, days=30):
+        """
+        Returns (query, finished_at, tweets_count) for the successful runs of the last days days, oldest first
+        """
+        since = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+        with self._lock:
+            return self.db.execute("SELECT query, finished_at, tweets_count FROM runs WHERE status = 'ok' AND finished_at >= ? ORDER BY id",
+                                   (since,)).fetchall()
+
+    def _insert_run(self, db, query, status, tweets_count=0, since_id=None, error=None):
+        db.execute('INSERT INTO runs (query, finished_at, status, tweets_count, since_id, error) VALUES (?, ?, ?, ?, ?, ?)',
+                   (query, datetime.datetime.now().isoformat(), status, tweets_count,
+                    str(since_id) if since_id else None, error))
+
+    def history(self, query=None, limit=100):
+        """
+        Returns the most recent runs, newest first
+        """
+        sql = 'SELECT query, finished_at, status, tweets_count, since_id, error FROM runs'
+        params = ()
+        if query:
+            sql += ' WHERE query = ?'
+            params = (query,)
+        with self._lock:
+            rows = self.db.execute(sql + ' ORDER BY id DESC LIMIT ?', params + (limit,)).fetchall()
+        return [dict(zip(('query', 'finished_at', 'status', 'tweets_count', 'since_id', 'error'), row)) for row in rows]
+
+    def import_yaml(self, query_file, replace=False):
+        """
+        Loads a queries.yaml file. With replace, queries not in the file are deleted
+        """
+        with open(query_file) as f:
+            queries = yaml.full_load(f) or []
+        if replace:
+            with self._transaction() as db:
+                db.execute('DELETE FROM queries')
+        self.upsert_queries(queries)
+        return len(queries)
+
+    def export_yaml(self, query_file):
+        """
+        Writes the queries in the queries.yaml format, replacing query_file atomically
+        """
+        queries = self.queries()
+        tmp_path = query_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            yaml.dump(queries, f, sort_keys=True)
+        os.replace(tmp_path, query_file)
+        return len(queries)
+
+    def import_quota(self, quota_file):
+        with open(quota_file) as f:
+            self.set_quota(json.load(f))
+
+    def export_quota(self, quota_file):
+        tmp_path = quota_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(self.quota()))
+        os.replace(tmp_path, quota_file)
+
+    def import_legacy(self, query_file=None, quota_file=None):
+        """
+        Seeds an empty store from the YAML query file and quota.json, when they exist.
+        Anything already in the store is left alone
+        """
+        with self._lock:
+            has_queries = self.db.execute('SELECT 1 FROM queries LIMIT 1').fetchone() is not None
+            has_quota = self.db.execute('SELECT 1 FROM quota').fetchone() is not None
+        if not has_queries and query_file and os.path.exists(query_file):
+            logging.info(f"Importing {self.import_yaml(query_file)} queries from {query_file}")
+        if not has_quota and quota_file and os.path.exists(quota_file):
+            self.import_quota(quota_file)
+            logging.info(f"Imported quota from {quota_file}")
+
+
+def _query_to_row(query):
+    extra = {k: v for k, v in query.items() if k not in QUERY_KEYS}
+    return (query['query'], int(query.get('active', True)),
+            str(query['since_id']) if query.get('since_id') else None,
+            query.get('quota_override'), json.dumps(extra) if extra else None)
+
+def _row_to_query(row):
+    query = {'query': row[0], 'active': bool(row[1]), 'since_id': row[2], 'quota_override': row[3]}
+    if row[4]:
+        query.update(json.loads(row[4]))
+    return query
@@ -1,39 +1,92 @@
-from twesearch.lib import neo4j_importer
 from twesearch.lib.util import format_tweets_for_neo4j, add_campaign
-from twesearch.lib import couchbase_importer
+import functools
 import logging
 import yaml
 
 logging.disable(logging.DEBUG)
 
+# config.yaml is read, and each database's driver imported and connected, on first use rather
+# than at import, so a notebook that only uses one backend never loads the other
 
-with open (r'config.yaml') as f:
-    GLOBAL_CONFIG = yaml.load(f, Loader=yaml.FullLoader)
 
-neo4j_importer = neo4j_importer.Neo4jImporter(
-                                    neo4j_uri=GLOBAL_CONFIG['neo4j_uri'],
-                                    db_name=GLOBAL_CONFIG['neo4j_dbname'], 
-                                    auth={'user': GLOBAL_CONFIG['neo4j_user'], 
-                                            'password': GLOBAL_CONFIG['neo4j_pw']},
-                                    log=True)
+@functools.lru_cache(maxsize=None)
+def load_config(path='config.yaml'):
+    with open (path) as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
 
-couchbase_importer = couchbase_importer.CouchbaseImporter(
-                                    cb_uri=GLOBAL_CONFIG['cb_uri'], 
-                                    auth={'user': GLOBAL_CONFIG['cb_user'],
-                                            'password': GLOBAL_CONFIG['cb_pw']})
+@functools.lru_cache(maxsize=None)
+def get_neo4j_importer():
+    from twesearch.lib.neo4j_importer import Neo4jImporter
+    config = load_config()
+    return Neo4jImporter(neo4j_uri=config['neo4j_uri'],
+                         db_name=config['neo4j_dbname'],
+                         auth={'user': config['neo4j_user'],
+                               'password': config['neo4j_pw']},
+                         log=True)
 
-def easy_import(items):
+@functools.lru_cache(maxsize=None)
+def get_couchbase_importer():
+    from twesearch.lib.couchbase_importer import CouchbaseImporter
+    config = load_config()
+    return CouchbaseImporter(cb_uri=config['cb_uri'],
+                             auth={'user': config['cb_user'],
+                                   'password': config['cb_pw']})
+
+def __getattr__(name):
+    # The module-level names this module used to set up at import
+    if name == 'GLOBAL_CONFIG':
+        return load_config()
+    if name == 'neo4j_importer':
+        return get_neo4j_importer()
+    if name == 'couchbase_importer':
+        return get_couchbase_importer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def easy_import(items, neo4j=True, couchbase=True):
     tweets = items['tweets']
     users = items['users']
 
-    if len(tweets) > 0:                                                                        
+    if len(tweets) > 0:
 
-        couchbase_importer.upsert_documents('tweets', tweets)
+        if couchbase:
+            get_couchbase_importer().upsert_documents('tweets', tweets)
+
+        if neo4j:
+            neo4j_tweets = format_tweets_for_neo4j(tweets, users)
+            get_neo4j_importer().insert('tweets', neo4j_tweets)
 
-        neo4j_tweets = format_tweets_for_neo4j(tweets, users)
-        neo4j_importer.insert('tweets', neo4j_tweets)
-    
     if len(users) > 0:
-        couchbase_importer.upsert_documents('users', users)
+        if couchbase:
+            get_couchbase_importer().upsert_documents('users', users)
+
+        if neo4j:
+            get_neo4j_importer().insert('users', users)
 
-        neo4j_importer.insert('users', users)
\ No newline at end of file
+def store_results(tweets, users, neo4j=None, couchbase=None, spool=None, tweet_id_store=None):
+    """
+    Spools the results, or imports them with whichever of the neo4j and couchbase importers are
+    given. Then, if a tweet_id_store is given, records the tweets that were written as known, so
+    a failed write is fetched again on the next run. Returns the number of tweets recorded
+    """
+    if spool is not None:
+        if tweets or users:
+            spool.append([{'tweets': tweets, 'users': users}])
+        written = tweets
+    elif neo4j is None and couchbase is None:
+        return 0
+    else:
+        failed = {}
+        if tweets:
+            if couchbase is not None:
+                failed = couchbase.upsert_documents('tweets', tweets)['failed']
+            if neo4j is not None:
+                neo4j.insert('tweets', format_tweets_for_neo4j(tweets, users))
+        if users:
+            if couchbase is not None:
+                couchbase.upsert_documents('users', users)
+            if neo4j is not None:
+                neo4j.insert('users', users)
+        written = [t for t in tweets if t['id'] not in failed]
+    if tweet_id_store is not None:
+        tweet_id_store.add_known(written)
+    return len(written)
@@ -0,0 +1,45 @@
+from array import array
+
+# Relationship written for each direction, matching the FOLLOWS/FOLLOWING schema in neo4j_importer
+REL_TYPES = {'followers': 'FOLLOWS', 'following': 'FOLLOWING'}
+
+
+class FollowEdges:
+    """
+    The follower or following IDs of one user, held as an array('Q') of 8-byte integers
+    instead of a list of ID strings. pairs() expands them lazily into the (src, dst)
+    string pairs Neo4jImporter.insert_edges writes.
+    """
+
+    def __init__(self, user_id, direction, ids=()):
+        if direction not in REL_TYPES:
+            raise ValueError(f"direction must be one of {list(REL_TYPES)}, not {direction}")
+        self.user_id = str(user_id)
+        self.direction = direction
+        self.ids = array('Q')
+        self.extend(ids)
+
+    @property
+    def rel_type(self):
+        return REL_TYPES[self.direction]
+
+    def extend(self, ids):
+        self.ids.extend(int(i) for i in ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pairs(self):
+        if self.direction == 'followers':
+            return ((str(i), self.user_id) for i in self.ids)
+        return ((self.user_id, str(i)) for i in self.ids)
+
+    def to_record(self):
+        """
+        JSON-serializable form, for the spool
+        """
+        return {'user_id': self.user_id, 'direction': self.direction, 'ids': self.ids.tolist()}
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record['user_id'], record['direction'], record['ids'])
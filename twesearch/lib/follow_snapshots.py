@@ -0,0 +1,66 @@
+import datetime
+import logging
+import sqlite3
+import threading
+from array import array
+
+from twesearch.lib.edges import FollowEdges
+
+FOLLOW_SNAPSHOTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    user_id TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    fetched_timestamp TEXT NOT NULL,
+    ids BLOB NOT NULL,
+    PRIMARY KEY (user_id, direction)
+);
+'''
+
+
+class FollowSnapshots:
+    """
+    Local SQLite store of the last follower/following ID set fetched for each account, with
+    when it was fetched. IDs are stored as the raw bytes of an array('Q'), so even accounts
+    with millions of followers load and save in one read or write.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(FOLLOW_SNAPSHOTS_SCHEMA)
+
+    def get(self, user_id, direction):
+        """
+        Returns (fetched_timestamp, FollowEdges) for the last snapshot, None if there isn't one
+        """
+        with self._lock:
+            row = self.db.execute('SELECT fetched_timestamp, ids FROM snapshots WHERE user_id = ? AND direction = ?',
+                                  (str(user_id), direction)).fetchone()
+        if row is None:
+            return None
+        edges = FollowEdges(user_id, direction)
+        edges.ids = array('Q', row[1])
+        return row[0], edges
+
+    def put(self, edges, fetched_timestamp=None):
+        fetched_timestamp = fetched_timestamp or datetime.datetime.now().isoformat()
+        with self._lock:
+            self.db.execute('INSERT OR REPLACE INTO snapshots (user_id, direction, fetched_timestamp, ids) VALUES (?, ?, ?, ?)',
+                            (edges.user_id, edges.direction, fetched_timestamp, edges.ids.tobytes()))
+            self.db.commit()
+        logging.info(f"Saved {edges.direction} snapshot of {len(edges)} IDs for {edges.user_id}")
+
+
+def diff_edges(previous, current):
+    """
+    Returns (added, removed) FollowEdges between two snapshots of the same user and direction
+    """
+    previous_ids = set(previous.ids)
+    current_ids = set(current.ids)
+    added = FollowEdges(current.user_id, current.direction)
+    added.ids = array('Q', (i for i in current.ids if i not in previous_ids))
+    removed = FollowEdges(current.user_id, current.direction)
+    removed.ids = array('Q', (i for i in previous.ids if i not in current_ids))
+    logging.info(f"{current.direction} of {current.user_id}: {len(added)} added, {len(removed)} removed, "
+                 f"{len(current) - len(added)} unchanged")
+    return added, removed
@@ -0,0 +1,52 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'twesearch'
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose keep-alive connections outlive the sessions it is mounted on. searchtweets
+    and tweepy close their session after every stream or call, which would otherwise drop the
+    pool and pay a new TCP and TLS handshake on the next request. shutdown() really closes it.
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class HTTPPool:
+    """
+    One keep-alive connection pool (up to pool_size connections per host) for every request a
+    Twesearch instance makes. session() hands out cheap per-stream sessions that share it, so
+    response hooks stay per stream while the connections are reused. Responses are gzip encoded.
+    """
+
+    def __init__(self, bearer_token=None, pool_size=10):
+        self.adapter = PooledAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.headers = {'Accept-Encoding': 'gzip', 'User-Agent': USER_AGENT}
+        if bearer_token:
+            self.headers['Authorization'] = f'Bearer {bearer_token}'
+
+    def session(self, extra_headers=None, auth=True):
+        """
+        A requests session on the shared pool. Without auth the Authorization header is left
+        off, for clients that sign their own requests
+        """
+        session = requests.Session()
+        session.trust_env = False
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.headers.update({k: v for k, v in self.headers.items() if auth or k != 'Authorization'})
+        if extra_headers:
+            session.headers.update(extra_headers)
+        return session
+
+    def close(self):
+        self.adapter.shutdown()
+        logging.debug("Closed the HTTP connection pool")
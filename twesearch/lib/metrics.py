@@ -0,0 +1,155 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds. Wide enough for a 1ms cache hit and a 15 minute rate limit window
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+# name: (type, help). Everything twesearch records is declared here, so the exposition has help text
+METRIC_DEFINITIONS = {
+    'twesearch_api_requests_total': ('counter', 'Twitter API requests, by endpoint and HTTP status'),
+    'twesearch_api_response_bytes_total': ('counter', 'Response body bytes (after gzip decoding) received from the Twitter API, by endpoint'),
+    'twesearch_api_request_seconds': ('histogram', 'Twitter API request latency, by endpoint'),
+    'twesearch_rate_limit_wait_seconds': ('histogram', 'Time spent waiting on the rate limiter before a request, by endpoint'),
+    'twesearch_extract_records_total': ('counter', 'Message-format items split into tweets, users and places'),
+    'twesearch_extract_seconds': ('histogram', 'Time to split one batch of message-format items'),
+    'twesearch_extract_records_per_second': ('gauge', 'Items per second over the last batch split'),
+    'twesearch_import_rows_total': ('counter', 'Rows written to a sink, by sink and stage'),
+    'twesearch_import_chunk_seconds': ('histogram', 'Latency of one committed import chunk, by sink and stage'),
+    'twesearch_import_retries_total': ('counter', 'Neo4j transaction attempts rerun after a deadlock or other transient error, by sink and stage'),
+    'twesearch_import_failures_total': ('counter', 'Neo4j chunks or Couchbase documents that failed after retries, by sink and stage'),
+}
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram with its sum and count, as Prometheus exposes them
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and latency histograms keyed by name and labels. Recording is a
+    dict lookup and an add under a lock, cheap enough for every request and chunk. snapshot()
+    returns everything as a dict for JSON; prometheus() renders the text exposition format.
+    """
+
+    def __init__(self, definitions=None):
+        self.definitions = dict(METRIC_DEFINITIONS if definitions is None else definitions)
+        self.started_at = time.time()
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes how long the with block took in the name histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """
+        Returns {'uptime_seconds', 'metrics': {name: [{'labels', 'value'} or {'labels', 'count', 'sum', 'buckets'}]}}
+        """
+        metrics = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._values.items()):
+                sample = {'labels': dict(labels)}
+                if isinstance(value, Histogram):
+                    sample.update({'count': value.count, 'sum': round(value.sum, 6),
+                                   'buckets': {str(bound): count for bound, count in value.cumulative()}})
+                else:
+                    sample['value'] = value
+                metrics.setdefault(name, []).append(sample)
+        return {'uptime_seconds': round(time.time() - self.started_at, 3), 'metrics': metrics}
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), value in sorted(self._values.items()):
+                by_name.setdefault(name, []).append((labels, value))
+            for name, samples in by_name.items():
+                metric_type, help_text = self.definitions.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    if isinstance(value, Histogram):
+                        for bound, count in value.cumulative():
+                            lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {count}')
+                        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {value.count}')
+                        lines.append(f'{name}_sum{_format_labels(labels)} {value.sum}')
+                        lines.append(f'{name}_count{_format_labels(labels)} {value.count}')
+                    else:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+# The process-wide registry every twesearch component records into
+METRICS = Metrics()
+
+
+def serve_metrics(port, host='127.0.0.1', metrics=METRICS):
+    """
+    Serves metrics on /metrics (Prometheus text) and /metrics.json (snapshot) from a daemon thread
+    """
+    # http.server is only imported by processes that serve metrics
+    from twesearch.lib.metrics_server import MetricsServer
+    return MetricsServer(port, host, metrics).start()
@@ -0,0 +1,44 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from twesearch.lib.metrics import METRICS
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    Serves metrics on /metrics (Prometheus text) and /metrics.json (snapshot) from a daemon thread
+    """
+    daemon_threads = True
+
+    def __init__(self, port, host='127.0.0.1', metrics=METRICS):
+        super().__init__((host, port), _MetricsHandler)
+        self.metrics = metrics
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logging.info(f"Serving metrics on http://{self.server_address[0]}:{self.server_address[1]}/metrics")
+        return self
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body, content_type = self.server.metrics.prometheus(), 'text/plain; version=0.0.4'
+        elif path == '/metrics.json':
+            body, content_type = json.dumps(self.server.metrics.snapshot()), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
@@ -1,137 +1,62 @@
-from neo4j import GraphDatabase
-from .util import ghetto_split, create_stdout_logger
+from .metrics import METRICS
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import itertools
 import logging
+import re
+import threading
+import time
+import zlib
 
 
-TWEET_IMPORT_QUERY = '''
-UNWIND $tweets AS t
-WITH t
-ORDER BY t.tweet_id
-
-WITH t,
-     t.tweet_entities as e,
-     t.tweet_referenced_tweets as refs,
-     t.tweet_author_followers as followers,
-     t.tweet_author_following as following
-
-//Create Tweet Node
-MERGE (tweet:Tweet {id:t.tweet_id})
-SET tweet.text = t.tweet_text,
-    tweet.created_at = datetime(t.tweet_created_at),
-    tweet.like_count = t.tweet_public_metrics.like_count,
-    tweet.retweet_count = t.tweet_public_metrics.retweet_count,
-    tweet.reply_count = t.tweet_public_metrics.reply_count,
-    tweet.quote_count = t.tweet_public_metrics.quote_count,
-    tweet.lang = t.tweet_lang,
-    tweet.source = t.tweet_source,
-    tweet.author_id = t.tweet_author_id,
-    tweet.author_username = t.tweet_author_username,
-    tweet.camp_id = t.tweet_camp_id,
-    tweet.fetched_timestamp = t.tweet_fetched_timestamp,
-    tweet.author_fetched_timestamp = t.tweet_author_fetched_timestamp
+# The import runs as a series of independent stages, each one a single UNWIND over a
+# deduplicated parameter list built in Python. Node stages run first so the relationship
+# stages only MATCH their endpoints; that keeps every statement small, lock-ordered and cheap to plan.
+
+TWEET_NODES_QUERY = '''
+UNWIND $rows AS t
+MERGE (tweet:Tweet {id:t.id})
+SET tweet.text = t.text,
+    tweet.created_at = datetime(t.created_at),
+    tweet.like_count = t.public_metrics.like_count,
+    tweet.retweet_count = t.public_metrics.retweet_count,
+    tweet.reply_count = t.public_metrics.reply_count,
+    tweet.quote_count = t.public_metrics.quote_count,
+    tweet.lang = t.lang,
+    tweet.source = t.source,
+    tweet.author_id = t.author_id,
+    tweet.author_username = t.author_username,
+    tweet.camp_id = t.camp_id,
+    tweet.fetched_timestamp = t.fetched_timestamp,
+    tweet.author_fetched_timestamp = t.author_fetched_timestamp
 SET (
 CASE
 WHEN tweet.retweet_count > 0
 THEN tweet END).retweeted = True
+'''
 
-//Create Source Node, and Tweet-POSTED_VIA->Source relationship
-MERGE (source:Source {name:t.tweet_source})
-MERGE (tweet)-[:POSTED_VIA]->(source)
+TWEET_STUB_NODES_QUERY = '''
+UNWIND $rows AS id
+MERGE (:Tweet {id:id})
+'''
 
-//Create User node, and User-POSTED->Tweet relationship
-MERGE (user:User {id:t.tweet_author_id})
-SET user.name = t.tweet_author_name,
-    user.username = t.tweet_author_username,
-    user.location = t.tweet_author_location,
-    user.followers_count = t.tweet_author_public_metrics.followers_count,
-    user.following_count = t.tweet_author_public_metrics.following_count,
-    user.tweets_count = t.tweet_author_public_metrics.tweet_count,
-    user.listed_count = t.tweet_author_public_metrics.listed_count,
-    user.profile_image_url = t.tweet_author_profile_image_url,
-    user.description = t.tweet_author_description,
-    user.created_at = datetime(t.tweet_author_created_at),
-    user.url = toLower(t.tweet_author_url),
-    user.camp_id = t.tweet_camp_id,
-    user.fetched_timestamp = t.tweet_author_fetched_timestamp
-MERGE (user)-[:POSTED]->(tweet)
+# Stub nodes MERGEd for referenced tweets have no text, so they don't count as imported
+EXISTING_TWEETS_QUERY = '''
+UNWIND $rows AS id
+MATCH (tweet:Tweet {id:id})
+WHERE tweet.text IS NOT NULL
+RETURN tweet.id AS id
+'''
+
+STUB_TWEETS_QUERY = '''
+MATCH (tweet:Tweet)
+WHERE tweet.text IS NULL
+RETURN tweet.id AS id
+LIMIT $limit
+'''
 
-//Iterate through follower IDs, create User node, 
-//then create Follower-FOLLOWS->User relationships
-FOREACH (follower in followers |
-  MERGE (flwr:User {id:follower})
-  MERGE (flwr)-[:FOLLOWS]->(user)
-)
-//Iterate through following IDs, create User node,
-//then create User-FOLLOWS->Following relationship
-FOREACH (following in following |
-    MERGE (flwing:User {id:following})
-    MERGE (user)-[:FOLLOWING]->(flwing)
-)
-
-//This section deals with unpacking the Entities enum from Twitter
-//Create hashtag nodes and Tweet-HAS_TAG->Tag relationships
-FOREACH (h IN e.hashtags |
-  MERGE (tag:Hashtag {tag:toLower(h.tag)})
-  MERGE (tweet)-[:HAS_TAG]->(tag)
-)
-
-//Create mentioned Users nodes and Tweet-TWEET_MENTIONED->User
-//and User-USER_MENTIONED->User relationship
-FOREACH (m IN e.mentions |
-  MERGE (mentioned:User {username:m.username})
-  MERGE (tweet)-[:MENTIONED]->(mentioned)
-)
-
-FOREACH (r IN [r IN refs WHERE r.type = 'replied_to'] |
-  MERGE (reply_tweet:Tweet {id:r.id})
-  MERGE (tweet)-[:REPLIED_TO]->(reply_tweet)
-)
-//Create Tweet node, and Tweet-QUOTED_TWEET->Tweet relationship
-FOREACH (q IN [q IN refs WHERE q.type = 'quoted'] |
-  MERGE (quoted_tweet:Tweet {id:q.id})
-  MERGE (tweet)-[:QUOTED]->(quoted_tweet)
-)
-//Create Tweet node, and Tweet->RETWEETED_TWEET->Tweet relationship
-FOREACH (rt IN [rt IN refs WHERE rt.type = 'retweeted'] |
-  MERGE (rt_tweet:Tweet {id:rt.id})
-  MERGE (tweet)-[:RETWEETED]->(rt_tweet)
-)
-//Create URL nodes and Tweet-HAS_LINK->Link relationships
-WITH e.urls as urls,tweet
-UNWIND urls as url
-WITH toLower(url.expanded_url) as expanded_url,tweet
-WITH apoc.text.replace(expanded_url, '^https?://', '') as normalized_url, expanded_url,tweet
-WITH apoc.text.replace(apoc.text.replace(normalized_url, '(&?)(utm_.*?(?=&|$))', ''), '(\?$|(?<=\?)&)', '') as normalized_url, expanded_url,tweet
-WITH apoc.text.replace(normalized_url, '/$', '') as normalized_url, expanded_url,tweet
-CALL apoc.when(
-    normalized_url =~ '^(www\.)?thegatewaypundit.com.*',
-    "RETURN apoc.text.replace($url, '/\?.*$', '') as url", 
-    'RETURN $url as url',
-    {url: normalized_url}
-) yield value
-WITH collect({expanded_url: expanded_url, normalized_url: value['url']}) as urls,tweet
-FOREACH (u IN urls |
-  MERGE (url:URL {url:u['normalized_url']})
-  MERGE (tweet)-[:HAS_LINK]->(url)
-  SET url.original_url = u['expanded_url']
-  SET url.domain = apoc.data.domain(u['expanded_url'])
-  SET (
-    CASE 
-    WHEN url.first_seen IS NULL
-    THEN url END).first_seen = datetime() 
-)
-'''
-
-USER_IMPORT_QUERY = '''
-UNWIND $users as u
-WITH u
-ORDER BY u.id
-
-WITH u,
-     u.followers as followers,
-     u.following as following
-
-//Create User node, and User-POSTED->Tweet relationship
+USER_NODES_QUERY = '''
+UNWIND $rows AS u
 MERGE (user:User {id:u.id})
 SET user.name = u.name,
     user.username = u.username,
@@ -145,42 +70,463 @@ SET user.name = u.name,
     user.created_at = datetime(u.created_at),
     user.url = u.url,
     user.camp_id = u.camp_id
-MERGE (user)-[:POSTED]->(tweet)
+SET (
+CASE
+WHEN u.fetched_timestamp IS NOT NULL
+THEN user END).fetched_timestamp = u.fetched_timestamp
+'''
+
+USER_STUB_NODES_QUERY = '''
+UNWIND $rows AS id
+MERGE (:User {id:id})
+'''
+
+MENTIONED_USER_NODES_QUERY = '''
+UNWIND $rows AS username
+MERGE (:User {username:username})
+'''
+
+SOURCE_NODES_QUERY = '''
+UNWIND $rows AS name
+MERGE (:Source {name:name})
+'''
 
+HASHTAG_NODES_QUERY = '''
+UNWIND $rows AS tag
+MERGE (:Hashtag {tag:tag})
+'''
+
+URL_NODES_QUERY = '''
+UNWIND $rows AS u
 MERGE (url:URL {url:u.url})
-MERGE (user)-[:HAS_LINK]->(url)
+SET url.original_url = u.original_url,
+    url.domain = u.domain
+SET (
+  CASE
+  WHEN url.first_seen IS NULL
+  THEN url END).first_seen = datetime()
+'''
+
+POSTED_VIA_QUERY = '''
+UNWIND $rows AS r
+MATCH (tweet:Tweet {id:r.tweet_id})
+MATCH (source:Source {name:r.source})
+MERGE (tweet)-[:POSTED_VIA]->(source)
+'''
+
+POSTED_QUERY = '''
+UNWIND $rows AS r
+MATCH (user:User {id:r.user_id})
+MATCH (tweet:Tweet {id:r.tweet_id})
+MERGE (user)-[:POSTED]->(tweet)
+'''
+
+FOLLOWS_QUERY = '''
+UNWIND $rows AS r
+MATCH (flwr:User {id:r.follower_id})
+MATCH (user:User {id:r.user_id})
+MERGE (flwr)-[:FOLLOWS]->(user)
+'''
+
+FOLLOWING_QUERY = '''
+UNWIND $rows AS r
+MATCH (user:User {id:r.user_id})
+MATCH (flwing:User {id:r.following_id})
+MERGE (user)-[:FOLLOWING]->(flwing)
+'''
+
+HAS_TAG_QUERY = '''
+UNWIND $rows AS r
+MATCH (tweet:Tweet {id:r.tweet_id})
+MATCH (tag:Hashtag {tag:r.tag})
+MERGE (tweet)-[:HAS_TAG]->(tag)
+'''
 
-//Iterate through follower IDs, create User node, 
-//then create Follower-FOLLOWS->User relationships
-FOREACH (follower in followers |
-  MERGE (flwr:User {id:follower})
-  MERGE (flwr)-[:FOLLOWS]->(user)
-)
-//Iterate through following IDs, create User node,
-//then create User-FOLLOWS->Following relationship
-FOREACH (following in following |
-    MERGE (flwing:User {id:following})
-    MERGE (user)-[:FOLLOWING]->(flwing)
-)
+MENTIONED_QUERY = '''
+UNWIND $rows AS r
+MATCH (tweet:Tweet {id:r.tweet_id})
+MATCH (mentioned:User {username:r.username})
+MERGE (tweet)-[:MENTIONED]->(mentioned)
 '''
 
+# Relationship types can't be parameterized, so each reference type gets its own stage
+REFERENCE_QUERIES = {reference_type: '''
+UNWIND $rows AS r
+MATCH (tweet:Tweet {id:r.tweet_id})
+MATCH (referenced:Tweet {id:r.referenced_id})
+MERGE (tweet)-[:%s]->(referenced)
+''' % rel_type for reference_type, rel_type in [('replied_to', 'REPLIED_TO'), ('quoted', 'QUOTED'), ('retweeted', 'RETWEETED')]}
+
+TWEET_HAS_LINK_QUERY = '''
+UNWIND $rows AS r
+MATCH (tweet:Tweet {id:r.tweet_id})
+MATCH (url:URL {url:r.url})
+MERGE (tweet)-[:HAS_LINK]->(url)
+'''
+
+USER_HAS_LINK_QUERY = '''
+UNWIND $rows AS r
+MATCH (user:User {id:r.user_id})
+MATCH (url:URL {url:r.url})
+MERGE (user)-[:HAS_LINK]->(url)
+'''
+
+# Edge loader statements, one (src, dst) ID pair per row. Both ends are merged so they also
+# work for users that haven't been imported yet
+EDGE_QUERIES = {
+    'FOLLOWS': '''
+UNWIND $rows AS r
+MERGE (flwr:User {id:r[0]})
+MERGE (user:User {id:r[1]})
+MERGE (flwr)-[rel:FOLLOWS]->(user)
+REMOVE rel.expired_at
+''',
+    'FOLLOWING': '''
+UNWIND $rows AS r
+MERGE (user:User {id:r[0]})
+MERGE (flwing:User {id:r[1]})
+MERGE (user)-[rel:FOLLOWING]->(flwing)
+REMOVE rel.expired_at
+''',
+}
+
+# Follow edges that have gone away are kept, stamped with when they were found missing
+EXPIRE_EDGE_QUERIES = {
+    'FOLLOWS': '''
+UNWIND $rows AS r
+MATCH (flwr:User {id:r[0]})-[rel:FOLLOWS]->(user:User {id:r[1]})
+WHERE rel.expired_at IS NULL
+SET rel.expired_at = datetime()
+''',
+    'FOLLOWING': '''
+UNWIND $rows AS r
+MATCH (user:User {id:r[0]})-[rel:FOLLOWING]->(flwing:User {id:r[1]})
+WHERE rel.expired_at IS NULL
+SET rel.expired_at = datetime()
+''',
+}
+
+def normalize_url(expanded_url):
+    '''
+    Lowercases, strips the scheme, utm_* parameters and trailing slashes, so the same
+    link shared different ways ends up as one URL node
+    '''
+    expanded_url = expanded_url.lower()
+    normalized_url = re.sub(r'^https?://', '', expanded_url)
+    normalized_url = re.sub(r'(&?)(utm_.*?(?=&|$))', '', normalized_url)
+    normalized_url = re.sub(r'(\?$|(?<=\?)&)', '', normalized_url)
+    normalized_url = re.sub(r'/$', '', normalized_url)
+    if re.match(r'^(www\.)?thegatewaypundit.com.*', normalized_url):
+        normalized_url = re.sub(r'/\?.*$', '', normalized_url)
+    return {'url': normalized_url, 'original_url': expanded_url, 'domain': urlparse(expanded_url).hostname}
+
+def _unique(rows, key=None):
+    '''
+    Dedupes rows (last one wins for keyed rows) and sorts them, so concurrent writers lock nodes in the same order
+    '''
+    if key is None:
+        return sorted(set(rows))
+    return [v for _, v in sorted({key(r): r for r in rows}.items())]
+
+def build_tweet_stages(tweets):
+    '''
+    Turns format_tweets_for_neo4j output into the ordered list of (stage name, query, rows, partition key) to run.
+    The partition key is the row field naming the node workers must not share (None when rows are the key itself).
+    Every relationship stage hanging off a tweet is split by tweet id, so each Tweet node is locked by one worker
+    '''
+    tweet_rows, author_rows, stub_tweet_ids, stub_user_ids = [], [], [], []
+    sources, hashtags, mentioned, urls = [], [], [], []
+    posted_via, posted, follows, following, has_tag, mentions, has_link = [], [], [], [], [], [], []
+    references = {reference_type: [] for reference_type in REFERENCE_QUERIES}
+
+    for t in tweets:
+        tweet_id = t['tweet_id']
+        author_id = t.get('tweet_author_id')
+        tweet_rows.append({'id': tweet_id, 'text': t.get('tweet_text'), 'created_at': t.get('tweet_created_at'),
+                           'public_metrics': t.get('tweet_public_metrics'), 'lang': t.get('tweet_lang'),
+                           'source': t.get('tweet_source'), 'author_id': author_id,
+                           'author_username': t.get('tweet_author_username'), 'camp_id': t.get('tweet_camp_id'),
+                           'fetched_timestamp': t.get('tweet_fetched_timestamp'),
+                           'author_fetched_timestamp': t.get('tweet_author_fetched_timestamp')})
+
+        if 'tweet_author_username' in t:
+            author = {k[len('tweet_author_'):]: v for k, v in t.items()
+                      if k.startswith('tweet_author_') and k not in ('tweet_author_followers', 'tweet_author_following')}
+            author['url'] = author['url'].lower() if author.get('url') else author.get('url')
+            author['camp_id'] = t.get('tweet_camp_id')
+            author_rows.append(author)
+        elif author_id is not None:
+            # Author wasn't in the users result set, only link the tweet to a bare User node
+            stub_user_ids.append(author_id)
+        # A tweet without an author_id (withheld, or fetched without the field) gets no POSTED edge
+        if author_id is not None:
+            posted.append((author_id, tweet_id))
+
+        if t.get('tweet_source'):
+            sources.append(t['tweet_source'])
+            posted_via.append((tweet_id, t['tweet_source']))
+
+        for follower_id in t.get('tweet_author_followers') or []:
+            stub_user_ids.append(follower_id)
+            follows.append((follower_id, author_id))
+        for following_id in t.get('tweet_author_following') or []:
+            stub_user_ids.append(following_id)
+            following.append((author_id, following_id))
+
+        entities = t.get('tweet_entities') or {}
+        for h in entities.get('hashtags') or []:
+            hashtags.append(h['tag'].lower())
+            has_tag.append((tweet_id, h['tag'].lower()))
+        for m in entities.get('mentions') or []:
+            mentioned.append(m['username'])
+            mentions.append((tweet_id, m['username']))
+        for u in entities.get('urls') or []:
+            if not u.get('expanded_url'):
+                continue
+            url = normalize_url(u['expanded_url'])
+            urls.append(url)
+            has_link.append((tweet_id, url['url']))
+
+        for r in t.get('tweet_referenced_tweets') or []:
+            if r['type'] in references:
+                stub_tweet_ids.append(r['id'])
+                references[r['type']].append((tweet_id, r['id']))
+
+    stages = [
+        ('tweet nodes', TWEET_NODES_QUERY, _unique(tweet_rows, lambda r: r['id']), 'id'),
+        ('referenced tweet nodes', TWEET_STUB_NODES_QUERY, _unique(stub_tweet_ids), None),
+        ('author nodes', USER_NODES_QUERY, _unique(author_rows, lambda r: r['id']), 'id'),
+        ('follow user nodes', USER_STUB_NODES_QUERY, _unique(stub_user_ids), None),
+        ('mentioned user nodes', MENTIONED_USER_NODES_QUERY, _unique(mentioned), None),
+        ('source nodes', SOURCE_NODES_QUERY, _unique(sources), None),
+        ('hashtag nodes', HASHTAG_NODES_QUERY, _unique(hashtags), None),
+        ('url nodes', URL_NODES_QUERY, _unique(urls, lambda r: r['url']), 'url'),
+        ('POSTED', POSTED_QUERY, [{'user_id': u, 'tweet_id': t} for u, t in _unique(posted)], 'tweet_id'),
+        ('POSTED_VIA', POSTED_VIA_QUERY, [{'tweet_id': t, 'source': s} for t, s in _unique(posted_via)], 'tweet_id'),
+        ('FOLLOWS', FOLLOWS_QUERY, [{'follower_id': f, 'user_id': u} for f, u in _unique(follows)], 'user_id'),
+        ('FOLLOWING', FOLLOWING_QUERY, [{'user_id': u, 'following_id': f} for u, f in _unique(following)], 'user_id'),
+        ('HAS_TAG', HAS_TAG_QUERY, [{'tweet_id': t, 'tag': h} for t, h in _unique(has_tag)], 'tweet_id'),
+        ('MENTIONED', MENTIONED_QUERY, [{'tweet_id': t, 'username': m} for t, m in _unique(mentions)], 'tweet_id'),
+    ]
+    for reference_type, query in REFERENCE_QUERIES.items():
+        stages.append((reference_type.upper(), query,
+                       [{'tweet_id': t, 'referenced_id': r} for t, r in _unique(references[reference_type])], 'tweet_id'))
+    stages.append(('HAS_LINK', TWEET_HAS_LINK_QUERY, [{'tweet_id': t, 'url': u} for t, u in _unique(has_link)], 'tweet_id'))
+    return stages
+
+def build_user_stages(users):
+    '''
+    Turns a list of v2 user dicts (optionally carrying followers/following ID lists) into
+    the ordered list of (stage name, query, rows, partition key) to run
+    '''
+    user_rows, stub_user_ids, urls = [], [], []
+    follows, following, has_link = [], [], []
+    for u in users:
+        user_rows.append({k: v for k, v in u.items() if k not in ('followers', 'following')})
+        for follower_id in u.get('followers') or []:
+            stub_user_ids.append(follower_id)
+            follows.append((follower_id, u['id']))
+        for following_id in u.get('following') or []:
+            stub_user_ids.append(following_id)
+            following.append((u['id'], following_id))
+        if u.get('url'):
+            urls.append({'url': u['url'], 'original_url': u['url'], 'domain': urlparse(u['url']).hostname})
+            has_link.append((u['id'], u['url']))
+
+    return [
+        ('user nodes', USER_NODES_QUERY, _unique(user_rows, lambda r: r['id']), 'id'),
+        ('follow user nodes', USER_STUB_NODES_QUERY, _unique(stub_user_ids), None),
+        ('url nodes', URL_NODES_QUERY, _unique(urls, lambda r: r['url']), 'url'),
+        ('FOLLOWS', FOLLOWS_QUERY, [{'follower_id': f, 'user_id': u} for f, u in _unique(follows)], 'user_id'),
+        ('FOLLOWING', FOLLOWING_QUERY, [{'user_id': u, 'following_id': f} for u, f in _unique(following)], 'user_id'),
+        ('HAS_LINK', USER_HAS_LINK_QUERY, [{'user_id': u, 'url': url} for u, url in _unique(has_link)], 'url'),
+    ]
+
+def _run_rows(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+def _read_ids(tx, query, **params):
+    return [record['id'] for record in tx.run(query, **params)]
+
 class Neo4jImporter:
 
-    def __init__(self, neo4j_uri, db_name, auth, log=False):
-        driver = GraphDatabase.driver(neo4j_uri, auth=(auth['user'], 
-                                        auth['password'])) 
-        self.session = driver.session(database=db_name)
-        self.logger = create_stdout_logger('debug')
+    def __init__(self, neo4j_uri, db_name, auth, log=False, parallelism=1, retries=3,
+                 target_chunk_seconds=2.0, min_chunk_size=100, max_chunk_size=20000):
+        # The neo4j driver is imported and connected by the driver property on first use
+        self.neo4j_uri = neo4j_uri
+        self.auth = auth
+        self._driver = None
+        self._driver_lock = threading.Lock()
+        self.db_name = db_name
+        # log is kept for existing callers. Logging is configured by the calling script, not here
+        self.logger = logging.getLogger(__name__)
+        self.parallelism = parallelism
+        self.retries = retries
+        self.target_chunk_seconds = target_chunk_seconds
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        # Starting point only, every committed chunk moves it towards target_chunk_seconds
+        self.chunk_size = 5000
+        self._chunk_size_lock = threading.Lock()
+        self.stage_timings = {}
 
-    def insert(self, item_type, items, chunk_size=5000):
+    @property
+    def driver(self):
+        with self._driver_lock:
+            if self._driver is None:
+                from neo4j import GraphDatabase
+                self._driver = GraphDatabase.driver(self.neo4j_uri, auth=(self.auth['user'], self.auth['password']))
+            return self._driver
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
+
+    def insert(self, item_type, items, chunk_size=None, parallelism=None):
+        """
+        Runs each import stage in order. Within a stage rows are written in managed write transactions,
+        split across parallelism workers by the stage's partition key so no two workers touch the same
+        node on that side. The other end of a relationship (a popular hashtag, user or URL) can still be
+        shared, so with parallelism > 1 the occasional deadlock is expected: _write_chunk retries it and
+        counts the retry in twesearch_import_retries_total. Passing chunk_size fixes the chunk size,
+        otherwise it adapts to commit latency.
+        """
         if item_type == 'users':
-            import_query = USER_IMPORT_QUERY
+            stages = build_user_stages(items)
         elif item_type == 'tweets':
-            import_query = TWEET_IMPORT_QUERY
-
-        chunks = ghetto_split(items, chunk_size)
-        inc = 0
-        for chunk in chunks:
-            logging.info(f"Inserting {item_type} chunk {inc} of {len(chunks)}")
-            self.session.run(import_query,{item_type:chunk})
-            inc += 1
+            stages = build_tweet_stages(items)
+        parallelism = parallelism or self.parallelism
+
+        self.stage_timings = {}
+        for stage_name, query, rows, partition_key in stages:
+            if not rows:
+                continue
+            start = time.perf_counter()
+            partitions = self._partition(rows, partition_key, parallelism)
+            if len(partitions) > 1:
+                with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+                    list(executor.map(lambda p: self._write_rows(f"{item_type} {stage_name}", query, p, chunk_size), partitions))
+            else:
+                self._write_rows(f"{item_type} {stage_name}", query, rows, chunk_size)
+            self.stage_timings[stage_name] = time.perf_counter() - start
+            logging.info(f"Imported {len(rows)} {item_type} {stage_name} rows in {self.stage_timings[stage_name]:.2f}s")
+        return self.stage_timings
+
+    def existing_tweet_ids(self, tweet_ids, batch_size=10000):
+        """
+        Returns the set of tweet_ids that have been imported in full. Pass it to
+        Twesearch.get_tweets_by_ids as known_ids to skip hydrating them again
+        """
+        tweet_ids = [str(i) for i in tweet_ids]
+        existing = set()
+        with self.driver.session(database=self.db_name) as session:
+            for position in range(0, len(tweet_ids), batch_size):
+                existing.update(session.read_transaction(_read_ids, EXISTING_TWEETS_QUERY,
+                                                         rows=tweet_ids[position:position + batch_size]))
+        logging.info(f"{len(existing)} of {len(tweet_ids)} tweets are already in Neo4j")
+        return existing
+
+    def stub_tweet_ids(self, limit=10000):
+        """
+        IDs of up to limit tweets that are only referenced so far (stub nodes without text),
+        the seeds for Twesearch.iter_expansion
+        """
+        with self.driver.session(database=self.db_name) as session:
+            return session.read_transaction(_read_ids, STUB_TWEETS_QUERY, limit=limit)
+
+    def insert_edges(self, rel_type, pairs, batch_size=None, expire=False):
+        """
+        Writes (src, dst) user ID pairs as rel_type relationships, separately from user property
+        updates. pairs can be any iterable (FollowEdges.pairs() for instance); only one batch of
+        rows is materialized at a time. The batch size adapts like insert's chunks unless given.
+        With expire, the existing relationships are marked expired instead.
+        Returns how many pairs were written.
+        """
+        query = EXPIRE_EDGE_QUERIES[rel_type] if expire else EDGE_QUERIES[rel_type]
+        pairs = iter(pairs)
+        written = 0
+        start = time.perf_counter()
+        with self.driver.session(database=self.db_name) as session:
+            while True:
+                size = batch_size or self.chunk_size
+                batch = [list(pair) for pair in itertools.islice(pairs, size)]
+                if not batch:
+                    break
+                elapsed = self._write_chunk(session, query, batch, f"edges {rel_type}")
+                if not batch_size:
+                    self._adapt_chunk_size(len(batch), elapsed)
+                written += len(batch)
+                logging.debug(f"Inserted {written} {rel_type} edges so far")
+        logging.info(f"{'Expired' if expire else 'Imported'} {written} {rel_type} edges in {time.perf_counter() - start:.2f}s")
+        return written
+
+    def insert_follow_edges(self, edges, batch_size=None):
+        return self.insert_edges(edges.rel_type, edges.pairs(), batch_size)
+
+    def expire_follow_edges(self, edges, batch_size=None):
+        return self.insert_edges(edges.rel_type, edges.pairs(), batch_size, expire=True)
+
+    def _partition(self, rows, partition_key, parallelism):
+        if parallelism <= 1 or len(rows) <= self.min_chunk_size:
+            return [rows]
+        partitions = [[] for _ in range(parallelism)]
+        for row in rows:
+            key = row if partition_key is None else row[partition_key]
+            partitions[zlib.crc32(str(key).encode()) % parallelism].append(row)
+        return [p for p in partitions if p]
+
+    def _write_rows(self, label, query, rows, chunk_size=None):
+        with self.driver.session(database=self.db_name) as session:
+            position = 0
+            inc = 0
+            while position < len(rows):
+                size = chunk_size or self.chunk_size
+                chunk = rows[position:position + size]
+                logging.debug(f"Inserting {label} chunk {inc}: rows {position} to {position + len(chunk)} of {len(rows)}")
+                elapsed = self._write_chunk(session, query, chunk, label)
+                if not chunk_size:
+                    self._adapt_chunk_size(len(chunk), elapsed)
+                position += len(chunk)
+                inc += 1
+
+    def _write_chunk(self, session, query, chunk, label):
+        """
+        Commits one chunk through a managed write transaction, which the driver retries on
+        deadlocks and other transient errors. Retries again with backoff once the driver gives up.
+        """
+        from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            runs = []
+            def run(tx):
+                runs.append(1)
+                _run_rows(tx, query, chunk)
+            try:
+                session.write_transaction(run)
+                elapsed = time.perf_counter() - start
+                # The driver reruns the transaction function itself on deadlocks, count those reruns too
+                if len(runs) > 1:
+                    METRICS.inc('twesearch_import_retries_total', len(runs) - 1, sink='neo4j', stage=label)
+                METRICS.observe('twesearch_import_chunk_seconds', elapsed, sink='neo4j', stage=label)
+                METRICS.inc('twesearch_import_rows_total', len(chunk), sink='neo4j', stage=label)
+                return elapsed
+            except (TransientError, ServiceUnavailable, SessionExpired) as e:
+                if attempt == self.retries:
+                    METRICS.inc('twesearch_import_retries_total', max(len(runs) - 1, 0), sink='neo4j', stage=label)
+                    METRICS.inc('twesearch_import_failures_total', sink='neo4j', stage=label)
+                    raise
+                METRICS.inc('twesearch_import_retries_total', len(runs), sink='neo4j', stage=label)
+                logging.warning(f"Chunk of {len(chunk)} rows failed, retrying in {2 ** attempt}s: {e}")
+                time.sleep(2 ** attempt)
+
+    def _adapt_chunk_size(self, rows_written, elapsed):
+        if rows_written < self.chunk_size or elapsed <= 0:
+            # Short tail chunks say little about throughput
+            return
+        with self._chunk_size_lock:
+            # Move halfway towards the size that would have committed in target_chunk_seconds
+            target = rows_written * self.target_chunk_seconds / elapsed
+            new_size = int((self.chunk_size + target) / 2)
+            self.chunk_size = max(self.min_chunk_size, min(self.max_chunk_size, new_size))
+        logging.debug(f"Chunk of {rows_written} committed in {elapsed:.2f}s, chunk size now {self.chunk_size}")
@@ -0,0 +1,88 @@
+import logging
+import re
+
+from twesearch.lib.util import index_by_id
+
+# v2 standard search rejects queries longer than this; academic access allows 1024
+QUERY_MAX_LENGTH = 512
+
+# Only single hashtags, cashtags, mentions and keywords are packed, since those are the
+# queries whose matches can be worked out again locally from a tweet's text and entities
+PACKABLE_QUERY = re.compile(r'^[#$@]?\w+$')
+
+ENTITY_PREFIXES = {'#': ('hashtags', 'tag'), '$': ('cashtags', 'tag'), '@': ('mentions', 'username')}
+
+
+def is_packable(query):
+    return bool(PACKABLE_QUERY.match(query['query'])) and not query.get('quota_override')
+
+def pack_query_text(terms):
+    return '(' + ' OR '.join(terms) + ')'
+
+def pack_queries(queries, max_length=QUERY_MAX_LENGTH):
+    """
+    Groups packable queries into packs whose OR'ed query fits in max_length. Returns
+    (packs, unpacked queries). A pack is a query dict the crawler can run and schedule like
+    any other, with the original query dicts under 'members' and the oldest member since_id
+    (or none, if any member has none) as its own.
+    """
+    packs = []
+    unpacked = [q for q in queries if not is_packable(q)]
+    members = []
+    for query in sorted((q for q in queries if is_packable(q)), key=lambda q: q['query'].lower()):
+        if members and len(pack_query_text([m['query'] for m in members] + [query['query']])) > max_length:
+            packs.append(members)
+            members = []
+        members.append(query)
+    if members:
+        packs.append(members)
+
+    # A pack of one is just the query
+    unpacked += [p[0] for p in packs if len(p) == 1]
+    packs = [_make_pack(p) for p in packs if len(p) > 1]
+    logging.info(f"Packed {sum(len(p['members']) for p in packs)} queries into {len(packs)} searches, {len(unpacked)} left unpacked")
+    return packs, unpacked
+
+def _make_pack(members):
+    since_ids = [m['since_id'] for m in members]
+    return {'query': pack_query_text([m['query'] for m in members]),
+            'members': members,
+            'since_id': None if not all(since_ids) else str(min(int(s) for s in since_ids)),
+            'quota_override': None,
+            'active': True}
+
+def _tweet_matches(term, tweet):
+    entities = tweet.get('entities') or {}
+    if term[0] in ENTITY_PREFIXES:
+        entity_type, field = ENTITY_PREFIXES[term[0]]
+        if any(e.get(field, '').lower() == term[1:].lower() for e in entities.get(entity_type) or []):
+            return True
+        # Entities of retweets can be cut off with the text, so fall back to the text itself
+        return re.search(re.escape(term) + r'(?!\w)', tweet.get('text') or '', re.IGNORECASE) is not None
+    if re.search(r'(?<!\w)' + re.escape(term) + r'(?!\w)', tweet.get('text') or '', re.IGNORECASE):
+        return True
+    return any(e.get(field, '').lower() == term.lower()
+               for entity_type, field in ENTITY_PREFIXES.values() for e in entities.get(entity_type) or [])
+
+def demux(pack, tweets):
+    """
+    Routes a pack's tweets back to the member queries they match, by text and entities, also
+    checking the tweets they retweet or quote. A member only gets tweets newer than its own
+    since_id. Returns ({member query: [tweets]}, [tweets that matched no member])
+    """
+    tweets_by_id = index_by_id(tweets)
+    routed = {m['query']: [] for m in pack['members']}
+    unrouted = []
+    for tweet in tweets:
+        candidates = [tweet] + [tweets_by_id[r['id']] for r in tweet.get('referenced_tweets') or [] if r['id'] in tweets_by_id]
+        matched = False
+        for member in pack['members']:
+            if member['since_id'] and int(tweet['id']) <= int(member['since_id']):
+                continue
+            if any(_tweet_matches(member['query'], t) for t in candidates):
+                routed[member['query']].append(tweet)
+                matched = True
+        if not matched:
+            unrouted.append(tweet)
+    logging.debug(f"Routed {len(tweets) - len(unrouted)} of {len(tweets)} tweets to {len(routed)} queries")
+    return routed, unrouted
@@ -0,0 +1,171 @@
+import logging
+from collections import deque
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class SubstringAutomaton:
+    """
+    Aho-Corasick automaton over a set of patterns. search(text) finds every pattern that occurs
+    in text in one pass over it, however many patterns there are. Transitions are kept in a
+    single (state, char) dict rather than a dict per trie node, to keep large pattern sets small.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = {}
+        self._match = [-1]
+        self._fail = [0]
+        self._out = [0]
+        parents = [(0, None)]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto.get((state, char))
+                if next_state is None:
+                    next_state = len(self._match)
+                    self._goto[(state, char)] = next_state
+                    self._match.append(-1)
+                    parents.append((state, char))
+                state = next_state
+            if self._match[state] == -1:
+                self._match[state] = index
+        self._build_links(parents)
+
+    def _build_links(self, parents):
+        count = len(parents)
+        self._fail = [0] * count
+        self._out = [0] * count
+        children = {}
+        for state in range(1, count):
+            children.setdefault(parents[state][0], []).append(state)
+        queue = deque(children.get(0, ()))
+        while queue:
+            state = queue.popleft()
+            parent, char = parents[state]
+            if parent:
+                fail = self._fail[parent]
+                while fail and (fail, char) not in self._goto:
+                    fail = self._fail[fail]
+                self._fail[state] = self._goto.get((fail, char), 0)
+            fail = self._fail[state]
+            self._out[state] = fail if self._match[fail] != -1 else self._out[fail]
+            queue.extend(children.get(state, ()))
+
+    def search(self, text):
+        """
+        Yields the index of every pattern found in text (a pattern found twice is yielded twice)
+        """
+        goto, fail, match, out = self._goto, self._fail, self._match, self._out
+        state = 0
+        for char in text:
+            while state and (state, char) not in goto:
+                state = fail[state]
+            state = goto.get((state, char), 0)
+            found = state if match[state] != -1 else out[state]
+            while found:
+                yield match[found]
+                found = out[found]
+
+
+class QueryRegistry:
+    """
+    The crawler's query list, indexed by normalized query text (lowercase, single spaces) for
+    exact-match lookups, with bulk add/deactivate/remove/dedupe. delta() works out which new
+    terms aren't covered by an existing query using a SubstringAutomaton, so merging a large
+    term list costs one pass over the existing queries instead of one per new term.
+    """
+
+    def __init__(self, queries=()):
+        self._queries = {}
+        self.duplicates = []
+        for query in queries:
+            key = normalize_query(query['query'])
+            if key in self._queries:
+                self.duplicates.append(query)
+                continue
+            self._queries[key] = query
+        if self.duplicates:
+            logging.warning(f"Ignored {len(self.duplicates)} duplicate queries: {[q['query'] for q in self.duplicates]}")
+
+    def __len__(self):
+        return len(self._queries)
+
+    def __contains__(self, query):
+        return normalize_query(query) in self._queries
+
+    def get(self, query):
+        return self._queries.get(normalize_query(query))
+
+    def queries(self):
+        return list(self._queries.values())
+
+    def active(self):
+        return [q for q in self._queries.values() if q['active']]
+
+    def add(self, queries):
+        """
+        Adds query dicts, skipping any whose normalized text is already registered. Returns the ones added
+        """
+        added = []
+        for query in queries:
+            key = normalize_query(query['query'])
+            if key not in self._queries:
+                self._queries[key] = query
+                added.append(query)
+        logging.info(f"Added {len(added)} of {len(queries)} queries")
+        return added
+
+    def set_active(self, queries, active):
+        """
+        Activates or deactivates the named queries. Returns the ones changed
+        """
+        changed = []
+        for name in queries:
+            query = self.get(name)
+            if query is not None and bool(query['active']) != active:
+                query['active'] = active
+                changed.append(query)
+        return changed
+
+    def deactivate(self, queries):
+        return self.set_active(queries, False)
+
+    def remove(self, queries):
+        return [q for q in (self._queries.pop(normalize_query(name), None) for name in queries) if q is not None]
+
+    def contained(self, terms):
+        """
+        Returns the set of terms that occur (case-insensitively) inside some registered query
+        """
+        terms = list({normalize_query(t) for t in terms if t.strip()})
+        if not terms or not self._queries:
+            return set()
+        automaton = SubstringAutomaton(terms)
+        found = set()
+        for key in self._queries:
+            found.update(automaton.search(key))
+            if len(found) == len(terms):
+                break
+        return {terms[i] for i in found}
+
+    def delta(self, terms, block_words=(), min_length=4):
+        """
+        Returns the normalized terms, in their original order, that are not blocked, at least
+        min_length long and not already covered by a registered query (exactly or as a substring)
+        """
+        block_words = {normalize_query(w) for w in block_words}
+        candidates = []
+        seen = set()
+        for term in terms:
+            term = normalize_query(term)
+            if term in seen or term in block_words or len(term) < min_length or term in self._queries:
+                continue
+            seen.add(term)
+            candidates.append(term)
+        covered = self.contained(candidates)
+        delta = [t for t in candidates if t not in covered]
+        logging.info(f"{len(delta)} of {len(terms)} terms are new")
+        return delta
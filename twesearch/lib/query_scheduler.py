@@ -0,0 +1,81 @@
+import heapq
+import itertools
+import logging
+import time
+
+
+class QueryScheduler:
+    """
+    Keeps a next-due time for every query and hands out the ones that are due, earliest first.
+    A query that has been handed out is not handed out again until it is rescheduled, so
+    several queries can be in flight at once without any of them running twice.
+    """
+
+    def __init__(self, queries, interval, key='query'):
+        self.interval = interval
+        self.key = key
+        self._heap = []
+        self._due_at = {}
+        self._running = {}
+        self._counter = itertools.count()
+        now = time.monotonic()
+        for query in queries:
+            self.add(query, due_at=now)
+
+    def add(self, query, due_at=None):
+        name = query[self.key]
+        due_at = time.monotonic() if due_at is None else due_at
+        self._due_at[name] = (due_at, query)
+        heapq.heappush(self._heap, (due_at, next(self._counter), name))
+
+    def remove(self, name):
+        self._due_at.pop(name, None)
+        self._running.pop(name, None)
+
+    def pop_due(self, limit=None, now=None):
+        """
+        Returns up to limit queries whose next-due time has passed and marks them as running
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and (limit is None or len(due) < limit):
+            due_at, _, name = self._heap[0]
+            if due_at > now:
+                break
+            heapq.heappop(self._heap)
+            # Skip heap entries left behind by remove() or an earlier reschedule
+            if name not in self._due_at or self._due_at[name][0] != due_at:
+                continue
+            _, query = self._due_at.pop(name)
+            self._running[name] = query
+            due.append(query)
+        return due
+
+    def reschedule(self, query, delay=None):
+        """
+        Puts a running query back in the schedule, due again after delay seconds (the scheduler interval by default)
+        """
+        name = query[self.key]
+        if self._running.pop(name, None) is None:
+            logging.debug(f"{name} was removed while running, not rescheduling")
+            return
+        delay = self.interval if delay is None else delay
+        self.add(query, due_at=time.monotonic() + delay)
+
+    def seconds_until_due(self, now=None):
+        """
+        Seconds until the next query is due, None if nothing is scheduled
+        """
+        now = time.monotonic() if now is None else now
+        while self._heap:
+            due_at, _, name = self._heap[0]
+            if name in self._due_at and self._due_at[name][0] == due_at:
+                return max(due_at - now, 0)
+            heapq.heappop(self._heap)
+        return None
+
+    def running_count(self):
+        return len(self._running)
+
+    def scheduled_count(self):
+        return len(self._due_at)
@@ -0,0 +1,187 @@
+import datetime
+import logging
+import time
+
+from dateutil.relativedelta import relativedelta
+
+STRATEGIES = ('even', 'yield')
+
+
+class QuotaAllocator:
+    """
+    Shares the monthly tweet quota and scheduling slots between crawler queries.
+
+    'even' is the old behaviour: every query runs once per interval and gets an equal share of
+    the remaining quota. 'yield' keeps an exponentially weighted average of the new tweets each
+    query returns per run, halved for every idle_half_life since it last returned anything and
+    doubled while its runs are being cut off at max_results. Queries then run more or less often
+    than interval (between min_interval and max_interval) in proportion to that score, and the
+    remaining quota is split by score times expected runs, so it goes where the new tweets are.
+    """
+
+    def __init__(self, interval, strategy='yield', min_interval=None, max_interval=None, alpha=0.3,
+                 idle_half_life=3 * 24 * 60 * 60, refresh_seconds=60):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, not {strategy}")
+        self.interval = interval
+        self.strategy = strategy
+        self.min_interval = min_interval or interval / 4
+        self.max_interval = max_interval or interval * 8
+        self.alpha = alpha
+        self.idle_half_life = idle_half_life
+        self.refresh_seconds = refresh_seconds
+        self.queries = {}
+        self._totals = None
+        self._totals_at = 0
+
+    def _new_entry(self):
+        return {'yield': None, 'runs': 0, 'last_run': None, 'last_hit': None, 'first_run': None, 'truncated': False}
+
+    def _entry(self, name):
+        if name not in self.queries:
+            self.queries[name] = self._new_entry()
+        return self.queries[name]
+
+    def set_queries(self, names):
+        """
+        Sets the queries being scheduled. Known stats are kept, queries not in names are dropped
+        """
+        names = set(names)
+        for name in list(self.queries):
+            if name not in names:
+                del self.queries[name]
+        for name in names:
+            self._entry(name)
+        self._totals = None
+
+    def remove(self, name):
+        self.queries.pop(name, None)
+        self._totals = None
+
+    def record(self, name, tweets_count, max_results=None, at=None):
+        """
+        Records a run of name that returned tweets_count new tweets. at is a unix timestamp
+        """
+        self._update(self._entry(name), tweets_count, max_results, time.time() if at is None else at)
+        self._totals = None
+
+    def _update(self, entry, tweets_count, max_results, at):
+        entry['yield'] = tweets_count if entry['yield'] is None else self.alpha * tweets_count + (1 - self.alpha) * entry['yield']
+        entry['runs'] += 1
+        entry['last_run'] = at
+        entry['first_run'] = entry['first_run'] or at
+        if tweets_count:
+            entry['last_hit'] = at
+        entry['truncated'] = bool(max_results) and tweets_count >= max_results
+
+    def seed(self, history, packs=None):
+        """
+        Replays (query, finished_at ISO timestamp, tweets_count) runs, oldest first, for queries being scheduled.
+        packs maps each packed search to its member queries. The history has the members' runs, not
+        the pack's, since packs are regrouped on every start, so a pack starts from its members' summed yields
+        """
+        pack_of = {member: pack for pack, members in (packs or {}).items() for member in members}
+        member_entries = {}
+        seeded = 0
+        for name, finished_at, tweets_count in history:
+            at = datetime.datetime.fromisoformat(finished_at).timestamp()
+            if name in pack_of:
+                self._update(member_entries.setdefault(name, self._new_entry()), tweets_count, None, at)
+            elif name in self.queries:
+                self.record(name, tweets_count, at=at)
+            else:
+                continue
+            seeded += 1
+        for pack, members in (packs or {}).items():
+            entries = [member_entries[m] for m in members if m in member_entries]
+            if pack not in self.queries or not entries:
+                continue
+            hits = [e['last_hit'] for e in entries if e['last_hit']]
+            self.queries[pack].update({'yield': sum(e['yield'] for e in entries),
+                                       'runs': max(e['runs'] for e in entries),
+                                       'last_run': max(e['last_run'] for e in entries),
+                                       'first_run': min(e['first_run'] for e in entries),
+                                       'last_hit': max(hits) if hits else None,
+                                       'truncated': False})
+        self._totals = None
+        logging.info(f"Seeded query yields from {seeded} past runs")
+
+    def _prior(self):
+        yields = [e['yield'] for e in self.queries.values() if e['yield'] is not None]
+        return max(sum(yields) / len(yields), 1.0) if yields else 1.0
+
+    def score(self, name, now=None, prior=None):
+        """
+        Expected new tweets from the next run of name. Queries that haven't run yet get the average
+        """
+        now = time.time() if now is None else now
+        entry = self.queries.get(name)
+        if entry is None or entry['yield'] is None:
+            return self._prior() if prior is None else prior
+        score = entry['yield']
+        if entry['truncated']:
+            score *= 2
+        idle_since = entry['last_hit'] or entry['first_run']
+        return score * 0.5 ** ((now - idle_since) / self.idle_half_life)
+
+    def _refresh_totals(self, now):
+        if self._totals is not None and now - self._totals_at < self.refresh_seconds:
+            return self._totals
+        prior = self._prior()
+        scores = {name: self.score(name, now, prior) for name in self.queries}
+        mean_score = sum(scores.values()) / len(scores) if scores else 1.0
+        delays = {name: self._delay(score, mean_score) for name, score in scores.items()}
+        self._totals = {'scores': scores, 'delays': delays,
+                        'weight_per_second': sum(scores[n] / d for n, d in delays.items())}
+        self._totals_at = now
+        return self._totals
+
+    def _delay(self, score, mean_score):
+        if self.strategy == 'even':
+            return self.interval
+        if score <= 0:
+            return self.max_interval
+        return min(max(self.interval * mean_score / score, self.min_interval), self.max_interval)
+
+    def delay(self, name, now=None):
+        """
+        Seconds until name should run again
+        """
+        now = time.time() if now is None else now
+        return self._refresh_totals(now)['delays'].get(name, self.interval)
+
+    def max_results(self, name, quota, now=None):
+        """
+        The share of the remaining quota the next run of name should fetch
+        """
+        now = time.time() if now is None else now
+        remaining = max(quota['quota_max'] - quota['quota_used'], 0)
+        quota_end = datetime.datetime.fromisoformat(quota['quota_start_date']) + relativedelta(months=1)
+        seconds_left = max(quota_end.timestamp() - now, self.min_interval)
+        totals = self._refresh_totals(now)
+
+        if self.strategy == 'even' or not totals['weight_per_second']:
+            runs_left = max(int(seconds_left / self.interval) * max(len(self.queries), 1), 1)
+            return int(remaining / runs_left)
+        # Over the rest of the period every query gets score * runs in proportion to the quota
+        return int(remaining * totals['scores'].get(name, self._prior()) / (totals['weight_per_second'] * seconds_left))
+
+    def stats(self, now=None):
+        """
+        Per-query yield, score, next delay and share of the quota, highest score first
+        """
+        now = time.time() if now is None else now
+        totals = self._refresh_totals(now)
+        total_weight = totals['weight_per_second'] or 1
+        rows = []
+        for name, entry in self.queries.items():
+            delay = totals['delays'][name]
+            rows.append({'query': name,
+                         'runs': entry['runs'],
+                         'yield': round(entry['yield'], 2) if entry['yield'] is not None else None,
+                         'score': round(totals['scores'][name], 2),
+                         'truncated': entry['truncated'],
+                         'hours_since_hit': round((now - entry['last_hit']) / 3600, 1) if entry['last_hit'] else None,
+                         'delay_seconds': round(delay),
+                         'quota_share': round(totals['scores'][name] / delay / total_weight, 4)})
+        return {'strategy': self.strategy, 'queries': sorted(rows, key=lambda r: -r['score'])}
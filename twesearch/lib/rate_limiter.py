@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+
+from twesearch.lib.metrics import METRICS
+
+# (requests, window in seconds) per endpoint with app auth. Keys are the api names
+# passed to gen_request_parameters for v2, and the resource path for v1.1
+ENDPOINT_LIMITS = {
+    "search": (450, 15 * 60),
+    "timeline": (1500, 15 * 60),
+    "tweets": (300, 15 * 60),
+    "users": (300, 15 * 60),
+    "users_by_name": (300, 15 * 60),
+    "followers": (15, 15 * 60),
+    "following": (15, 15 * 60),
+    "retweeted_by": (75, 15 * 60),
+    "users/lookup": (300, 15 * 60),
+    "followers/ids": (15, 15 * 60),
+    "friends/ids": (15, 15 * 60),
+}
+DEFAULT_LIMIT = (15, 15 * 60)
+
+
+class RateLimiter:
+    """
+    Token bucket per endpoint, shared by every request a Twesearch instance makes.
+    Buckets start from ENDPOINT_LIMITS and refill continuously until a response carries
+    x-rate-limit-* headers; from then on the server's remaining count and reset time win.
+    Thread safe, so concurrent chunk fetches draw from the same buckets.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = dict(ENDPOINT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint, now):
+        if endpoint not in self._buckets:
+            limit, window = self.limits.get(endpoint, DEFAULT_LIMIT)
+            self._buckets[endpoint] = {'limit': limit, 'window': window, 'tokens': float(limit),
+                                       'updated': now, 'reset_at': None,
+                                       'requests': 0, 'waits': 0, 'wait_seconds': 0.0}
+        return self._buckets[endpoint]
+
+    def _refill(self, bucket, now):
+        if bucket['reset_at'] is not None:
+            # The server told us when the window resets, nothing comes back before then
+            if now >= bucket['reset_at']:
+                bucket['tokens'] = min(bucket['limit'], bucket['tokens'] + bucket['limit'])
+                bucket['reset_at'] = None
+        else:
+            rate = bucket['limit'] / bucket['window']
+            bucket['tokens'] = min(bucket['limit'], bucket['tokens'] + (now - bucket['updated']) * rate)
+        bucket['updated'] = now
+
+    def acquire(self, endpoint):
+        """
+        Takes a token for endpoint, sleeping only as long as it takes for one to be available.
+        Returns the number of seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(endpoint, now)
+            self._refill(bucket, now)
+            # Tokens go negative to reserve a place in line for concurrent callers
+            bucket['tokens'] -= 1
+            bucket['requests'] += 1
+            if bucket['tokens'] >= 0:
+                METRICS.observe('twesearch_rate_limit_wait_seconds', 0.0, endpoint=endpoint)
+                return 0.0
+            if bucket['reset_at'] is not None:
+                windows_behind = int((-bucket['tokens'] - 1) // bucket['limit'])
+                wait = bucket['reset_at'] - now + windows_behind * bucket['window']
+            else:
+                wait = -bucket['tokens'] * bucket['window'] / bucket['limit']
+            wait = max(wait, 0.0)
+            bucket['waits'] += 1
+            bucket['wait_seconds'] += wait
+
+        METRICS.observe('twesearch_rate_limit_wait_seconds', wait, endpoint=endpoint)
+        logging.info(f"Rate limit for {endpoint}: waiting {wait:.1f}s")
+        time.sleep(wait)
+        return wait
+
+    def update(self, endpoint, headers):
+        """
+        Resyncs endpoint's bucket from the x-rate-limit-limit/remaining/reset response headers
+        """
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None or reset is None:
+            return
+        limit = headers.get('x-rate-limit-limit')
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(endpoint, now)
+            if limit is not None:
+                bucket['limit'] = int(limit)
+            bucket['tokens'] = float(remaining)
+            bucket['reset_at'] = now + max(int(reset) - time.time(), 0)
+            bucket['updated'] = now
+        logging.debug(f"Rate limit for {endpoint}: {remaining} remaining, resets in {int(reset) - time.time():.0f}s")
+
+    def stats(self):
+        """
+        Returns per-endpoint request counts and time spent waiting, for tuning
+        """
+        with self._lock:
+            return {endpoint: {'requests': b['requests'], 'waits': b['waits'],
+                               'wait_seconds': round(b['wait_seconds'], 3),
+                               'tokens': round(b['tokens'], 3), 'limit': b['limit']}
+                    for endpoint, b in self._buckets.items()}
+
+    def total_wait_seconds(self):
+        with self._lock:
+            return sum(b['wait_seconds'] for b in self._buckets.values())
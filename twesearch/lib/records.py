@@ -0,0 +1,201 @@
+import sys
+from collections.abc import Mapping, MutableMapping
+
+# Keys tuples of the small fixed-shape dicts (public_metrics) are shared between records
+_SHAPES = {}
+
+
+def _encode_id(value):
+    # Leading zeros wouldn't survive the round trip
+    if isinstance(value, str) and value.isdigit() and (value == '0' or value[0] != '0'):
+        return int(value)
+    return value
+
+def _decode_id(value):
+    return str(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _encode_shape(value):
+    if not isinstance(value, dict):
+        return value
+    keys = tuple(value)
+    return (_SHAPES.setdefault(keys, keys), tuple(value.values()))
+
+def _decode_shape(value):
+    if not isinstance(value, tuple):
+        return value
+    return dict(zip(*value))
+
+def _encode_references(value):
+    if not isinstance(value, list) or not all(isinstance(r, dict) and set(r) == {'type', 'id'} for r in value):
+        return value
+    return tuple((sys.intern(r['type']), _encode_id(r['id'])) for r in value)
+
+def _decode_references(value):
+    if not isinstance(value, tuple):
+        return value
+    return [{'type': t, 'id': _decode_id(i)} for t, i in value]
+
+
+class _Record(MutableMapping):
+    """
+    Slotted stand-in for a v2 tweet or user dict. Known fields live in slots, with numeric
+    IDs stored as ints, repeated strings interned and metrics/references packed into tuples;
+    anything else goes in a small overflow dict. Reads decode back to exactly what the API
+    returned, so records can be used anywhere the dict was, and to_dict() rebuilds the dict.
+    """
+    __slots__ = ()
+    _FIELDS = ()
+    _ID_FIELDS = frozenset()
+    _INTERNED_FIELDS = frozenset()
+    _SHAPE_FIELDS = frozenset(['public_metrics'])
+    _REFERENCE_FIELDS = frozenset()
+
+    def __init__(self, item=()):
+        self._extra = None
+        for k, v in dict(item).items():
+            self[k] = v
+
+    def __setitem__(self, key, value):
+        if key not in self._FIELDS:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        elif key in self._ID_FIELDS:
+            setattr(self, key, _encode_id(value))
+        elif key in self._INTERNED_FIELDS:
+            setattr(self, key, _intern(value))
+        elif key in self._SHAPE_FIELDS:
+            setattr(self, key, _encode_shape(value))
+        elif key in self._REFERENCE_FIELDS:
+            setattr(self, key, _encode_references(value))
+        else:
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        if key not in self._FIELDS:
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra[key]
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        if key in self._ID_FIELDS:
+            return _decode_id(value)
+        if key in self._SHAPE_FIELDS:
+            return _decode_shape(value)
+        if key in self._REFERENCE_FIELDS:
+            return _decode_references(value)
+        return value
+
+    def __delitem__(self, key):
+        if key not in self._FIELDS:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+            return
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self._FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in self._FIELDS:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def to_dict(self):
+        return {k: self[k] for k in self}
+
+
+class TweetRecord(_Record):
+    _FIELDS = ('id', 'author_id', 'text', 'created_at', 'lang', 'source', 'conversation_id',
+               'in_reply_to_user_id', 'public_metrics', 'possibly_sensitive', 'referenced_tweets',
+               'entities', 'context_annotations', 'geo', 'withheld', 'fetched_timestamp', 'camp_id')
+    __slots__ = _FIELDS + ('_extra',)
+    _ID_FIELDS = frozenset(['id', 'author_id', 'conversation_id', 'in_reply_to_user_id'])
+    _INTERNED_FIELDS = frozenset(['lang', 'source', 'fetched_timestamp', 'camp_id'])
+    _REFERENCE_FIELDS = frozenset(['referenced_tweets'])
+
+
+class UserRecord(_Record):
+    _FIELDS = ('id', 'username', 'name', 'created_at', 'description', 'location', 'url',
+               'profile_image_url', 'pinned_tweet_id', 'protected', 'verified', 'public_metrics',
+               'entities', 'withheld', 'fetched_timestamp', 'camp_id')
+    __slots__ = _FIELDS + ('_extra',)
+    _ID_FIELDS = frozenset(['id', 'pinned_tweet_id'])
+    _INTERNED_FIELDS = frozenset(['username', 'location', 'fetched_timestamp', 'camp_id'])
+
+
+class Neo4jTweet(Mapping):
+    """
+    Read-only view of a tweet joined with its author, keyed the way format_tweets_for_neo4j
+    keys its dicts (tweet_<field>, tweet_author_<field>) without copying either of them
+    """
+    __slots__ = ('tweet', 'author')
+
+    def __init__(self, tweet, author):
+        self.tweet = tweet
+        self.author = author
+
+    def __getitem__(self, key):
+        # The author's fields shadow tweet fields with the same prefixed name (tweet_author_id)
+        if key.startswith('tweet_author_') and key[len('tweet_author_'):] in self.author:
+            return self.author[key[len('tweet_author_'):]]
+        if key.startswith('tweet_') and key[len('tweet_'):] in self.tweet:
+            return self.tweet[key[len('tweet_'):]]
+        raise KeyError(key)
+
+    def __iter__(self):
+        author_keys = ['tweet_author_' + k for k in self.author]
+        shadowed = set(author_keys)
+        for k in self.tweet:
+            if 'tweet_' + k not in shadowed:
+                yield 'tweet_' + k
+        yield from author_keys
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def compact_tweet(tweet):
+    return tweet if isinstance(tweet, TweetRecord) else TweetRecord(tweet)
+
+def compact_user(user):
+    return user if isinstance(user, UserRecord) else UserRecord(user)
+
+def to_dict(item):
+    """
+    Returns a plain dict for a record (or a Neo4jTweet view), anything else unchanged. Use at
+    sink boundaries that need real dicts (JSON encoding, database clients)
+    """
+    if isinstance(item, (_Record, Neo4jTweet)):
+        return {k: item[k] for k in item}
+    return item
+
+def to_dicts(items):
+    return [to_dict(item) for item in items]
+
+def json_default(value):
+    """
+    default= hook for json.dump(s) so records serialize as the dicts they stand in for
+    """
+    if isinstance(value, (_Record, Neo4jTweet)):
+        return to_dict(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
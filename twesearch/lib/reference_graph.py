@@ -0,0 +1,114 @@
+import logging
+
+from twesearch.lib.query_packer import pack_query_text, QUERY_MAX_LENGTH
+
+
+def referenced_ids(tweet):
+    """
+    IDs of the tweets tweet replies to, quotes or retweets, and of its conversation's root
+    """
+    ids = [r['id'] for r in tweet.get('referenced_tweets') or []]
+    conversation_id = tweet.get('conversation_id')
+    if conversation_id and conversation_id != tweet['id']:
+        ids.append(conversation_id)
+    return [str(i) for i in ids]
+
+def conversation_queries(conversation_ids, max_length=QUERY_MAX_LENGTH):
+    """
+    OR's conversation_id: operators together into as few search queries as fit in max_length
+    """
+    queries = []
+    terms = []
+    for conversation_id in conversation_ids:
+        term = f'conversation_id:{conversation_id}'
+        if terms and len(pack_query_text(terms + [term])) > max_length:
+            queries.append(pack_query_text(terms))
+            terms = []
+        terms.append(term)
+    if terms:
+        queries.append(pack_query_text(terms))
+    return queries
+
+def merge_results(results):
+    """
+    Combines message-format result dicts, deduping tweets, users and places by id and summing counts
+    """
+    merged = {'tweets': {}, 'users': {}, 'places': {}}
+    counts = {}
+    for result in results:
+        for key in merged:
+            merged[key].update((item['id'], item) for item in result.get(key, ()))
+        for name, value in result.get('counts', {}).items():
+            counts[name] = counts.get(name, 0) + value
+    merged = {key: list(items.values()) for key, items in merged.items()}
+    merged['counts'] = counts
+    return merged
+
+
+class ExpansionFrontier:
+    """
+    Breadth-first frontier over the reply/quote/retweet/conversation graph. Every tweet ID is
+    only ever queued once: add() takes a level's tweets (hydrated or seen in includes), marks
+    them seen and queues the IDs they reference that haven't been seen or queued yet. take()
+    hands out the whole next level, in discovery order.
+    """
+
+    def __init__(self, seed_ids=()):
+        self.seen = set()
+        self.queued = []
+        self.conversations = []
+        self._conversations_seen = set()
+        self.queue(seed_ids)
+
+    def __len__(self):
+        return len(self.queued)
+
+    def queue(self, tweet_ids):
+        for tweet_id in tweet_ids:
+            tweet_id = str(tweet_id)
+            if tweet_id not in self.seen:
+                self.seen.add(tweet_id)
+                self.queued.append(tweet_id)
+
+    def mark_seen(self, tweets):
+        self.seen.update(str(t['id']) for t in tweets)
+
+    def add(self, tweets):
+        """
+        Marks tweets as seen, then queues everything they reference. Their conversation IDs are
+        also collected for conversation searches. Returns the number of IDs queued
+        """
+        self.mark_seen(tweets)
+        before = len(self.queued)
+        for tweet in tweets:
+            self.queue(referenced_ids(tweet))
+            conversation_id = tweet.get('conversation_id')
+            if conversation_id and str(conversation_id) not in self._conversations_seen:
+                self._conversations_seen.add(str(conversation_id))
+                self.conversations.append(str(conversation_id))
+        return len(self.queued) - before
+
+    def take(self, limit=None):
+        """
+        Hands out everything queued as the next level, cut to limit. IDs past the limit are
+        dropped rather than kept for the next level, where they'd be labelled a level too deep
+        """
+        level, self.queued = self.queued, []
+        if limit is not None and len(level) > limit:
+            logging.info(f"Dropping {len(level) - limit} queued tweet IDs past the budget")
+            level = level[:limit]
+        return level
+
+    def take_conversations(self):
+        conversations, self.conversations = self.conversations, []
+        return conversations
+
+    def drop(self):
+        """
+        Empties the queue, for when the budget has run out. Returns how many IDs were dropped
+        """
+        dropped = len(self.queued)
+        if dropped:
+            logging.info(f"Dropping {dropped} queued tweet IDs")
+        self.queued = []
+        return dropped
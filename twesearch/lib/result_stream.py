@@ -0,0 +1,41 @@
+from searchtweets import ResultStream
+
+from twesearch.lib.tweet_util import record_response_metrics
+
+
+class RateLimitedResultStream(ResultStream):
+    """
+    ResultStream that takes a rate_limiter token before every request and resyncs the limiter
+    from each response's x-rate-limit headers, recording request metrics as it goes. With
+    single_page it stops after one request and leaves the next token in page_next_token, so the
+    caller can page (and pace) itself. With an http_pool (lib.http_pool.HTTPPool) its requests
+    go over the pool's keep-alive connections.
+    """
+
+    def __init__(self, rate_limiter, api, single_page=False, http_pool=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self.api = api
+        self.single_page = single_page
+        self.http_pool = http_pool
+        self.page_next_token = None
+
+    def init_session(self):
+        if self.http_pool is None:
+            super().init_session()
+        else:
+            if self.session:
+                self.session.close()
+            self.session = self.http_pool.session(getattr(self, 'extra_headers_dict', None))
+        self.session.hooks['response'].append(self._update_rate_limit)
+
+    def _update_rate_limit(self, resp, *args, **kwargs):
+        self.rate_limiter.update(self.api, resp.headers)
+        record_response_metrics(self.api, resp)
+
+    def execute_request(self):
+        self.rate_limiter.acquire(self.api)
+        super().execute_request()
+        if self.single_page:
+            self.page_next_token = self.next_token
+            self.next_token = None
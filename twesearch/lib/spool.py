@@ -0,0 +1,154 @@
+import fcntl
+import glob
+import gzip
+import json
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+
+from twesearch.lib.records import json_default
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl.gz'
+CHECKPOINT_FILE = 'checkpoint.json'
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+
+class Spool:
+    """
+    Append-only local spool between fetching and importing. Records are JSON lines in
+    gzip-compressed segment files; every append is written as its own gzip member and fsync'd,
+    so a crash can at worst lose the append in progress. Readers track their position in a
+    fsync'd checkpoint file, so anything not yet imported is replayed on the next run.
+    Writers in different processes are serialized with a lock file.
+    """
+
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}')
+
+    def segments(self):
+        paths = glob.glob(os.path.join(self.directory, f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}'))
+        return sorted(int(os.path.basename(p)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for p in paths)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, records):
+        """
+        Durably appends a list of JSON-serializable records. Returns the segment written to
+        """
+        payload = ''.join(json.dumps(r, separators=(',', ':'), default=json_default) + '\n' for r in records).encode()
+        with self._locked():
+            segments = self.segments()
+            segment = segments[-1] if segments else 1
+            path = self._segment_path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+                segment += 1
+                path = self._segment_path(segment)
+            with open(path, 'ab') as f:
+                f.write(gzip.compress(payload))
+                f.flush()
+                os.fsync(f.fileno())
+        logging.debug(f"Spooled {len(records)} records to segment {segment}")
+        return segment
+
+    def read_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return {'segment': 0, 'line': 0}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_checkpoint(self, checkpoint):
+        """
+        Atomically replaces the checkpoint: write, fsync, rename, fsync the directory
+        """
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def reset_checkpoint(self, segment=0):
+        """
+        Replays everything from segment onwards (the whole spool by default) on the next read
+        """
+        self.write_checkpoint({'segment': segment, 'line': 0})
+
+    def read(self, checkpoint=None):
+        """
+        Yields (checkpoint, record) for every complete record after checkpoint (the stored one
+        by default). Pass the yielded checkpoint to write_checkpoint once the record is imported.
+        An append still being written at the end of the last segment is left for the next read.
+        """
+        checkpoint = checkpoint or self.read_checkpoint()
+        for segment in self.segments():
+            if segment < checkpoint['segment']:
+                continue
+            skip = checkpoint['line'] if segment == checkpoint['segment'] else 0
+            line_num = 0
+            for line in _complete_lines(self._segment_path(segment)):
+                line_num += 1
+                if line_num <= skip:
+                    continue
+                yield {'segment': segment, 'line': line_num}, json.loads(line)
+
+    def prune(self, checkpoint=None):
+        """
+        Deletes segments that are entirely before checkpoint. Returns how many were removed
+        """
+        checkpoint = checkpoint or self.read_checkpoint()
+        removed = 0
+        with self._locked():
+            for segment in self.segments():
+                if segment < checkpoint['segment']:
+                    os.remove(self._segment_path(segment))
+                    removed += 1
+        return removed
+
+def _complete_lines(path):
+    """
+    Decompresses a segment member by member. A member that doesn't decompress is either still
+    being written (the last one) or was cut short by a crash; in the latter case reading picks
+    up again at the next gzip header, so later appends aren't lost behind it.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    position = 0
+    while position < len(data):
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            chunk = decompressor.decompress(data[position:])
+            complete = decompressor.eof
+        except zlib.error:
+            complete = False
+        if not complete:
+            next_member = data.find(GZIP_MAGIC, position + 1)
+            if next_member == -1:
+                return
+            logging.warning(f"Skipping {next_member - position} damaged bytes in {path}")
+            position = next_member
+            continue
+        for line in chunk.decode().splitlines():
+            if line:
+                yield line
+        position = len(data) - len(decompressor.unused_data)
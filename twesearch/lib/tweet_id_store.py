@@ -0,0 +1,119 @@
+import datetime
+import logging
+import sqlite3
+import threading
+
+TWEET_ID_STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS known_tweets (
+    id INTEGER PRIMARY KEY,
+    referenced_ids TEXT,
+    conversation_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS missing_tweets (
+    id INTEGER PRIMARY KEY,
+    first_missing_at TEXT NOT NULL,
+    last_checked_at TEXT NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 1
+);
+'''
+
+# SQLite's default limit on ? parameters in one statement is 999
+LOOKUP_BATCH_SIZE = 900
+
+
+class TweetIdStore:
+    """
+    Persisted sets of tweet IDs for hydration: the ones already fetched, and the ones the API
+    didn't return when asked (deleted, protected or from suspended accounts). get_tweets_by_ids
+    only requests IDs in neither set, so re-running a hydration over the same ID list costs
+    no quota for tweets it already has or knows are gone. With retry_missing_after (seconds),
+    missing IDs are requested again once they haven't been checked for that long. Known tweets
+    keep the IDs they reference and their conversation ID, so Twesearch.iter_expansion can walk
+    past them without fetching them again.
+    """
+
+    def __init__(self, path, retry_missing_after=None):
+        self.retry_missing_after = retry_missing_after
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(TWEET_ID_STORE_SCHEMA)
+
+    def _present(self, table, ids, where='', params=()):
+        found = set()
+        for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[i:i + LOOKUP_BATCH_SIZE]
+            sql = f"SELECT id FROM {table} WHERE id IN ({','.join('?' * len(batch))}){where}"
+            found.update(row[0] for row in self.db.execute(sql, batch + list(params)))
+        return found
+
+    def partition(self, tweet_ids):
+        """
+        Splits tweet IDs into (IDs to fetch, known IDs, missing IDs), keeping their order
+        """
+        numeric = [int(i) for i in tweet_ids]
+        with self._lock:
+            known = self._present('known_tweets', numeric)
+            if self.retry_missing_after is None:
+                missing = self._present('missing_tweets', numeric)
+            else:
+                checked_since = (datetime.datetime.now() - datetime.timedelta(seconds=self.retry_missing_after)).isoformat()
+                missing = self._present('missing_tweets', numeric, ' AND last_checked_at >= ?', (checked_since,))
+        to_fetch, known_ids, missing_ids = [], [], []
+        for tweet_id, number in zip(tweet_ids, numeric):
+            if number in known:
+                known_ids.append(tweet_id)
+            elif number in missing:
+                missing_ids.append(tweet_id)
+            else:
+                to_fetch.append(tweet_id)
+        logging.info(f"Tweet ID store: {len(known_ids)} known, {len(missing_ids)} missing, {len(to_fetch)} to fetch")
+        return to_fetch, known_ids, missing_ids
+
+    def add_known(self, tweets):
+        """
+        Records tweets as fetched, with what they reference. Call it once the tweets are imported or
+        spooled, not when they are fetched, or a failed import leaves them skipped for good
+        """
+        rows = [(int(t['id']), ' '.join(str(r['id']) for r in t.get('referenced_tweets') or []),
+                 int(t['conversation_id']) if t.get('conversation_id') else None) for t in tweets]
+        with self._lock:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO known_tweets (id, referenced_ids, conversation_id) VALUES (?, ?, ?)', rows)
+                # A tweet that comes back (a protected account made public) is no longer missing
+                self.db.executemany('DELETE FROM missing_tweets WHERE id = ?', [row[:1] for row in rows])
+
+    def known_references(self, tweet_ids):
+        """
+        Returns the known tweets among tweet_ids as {'id', 'referenced_tweets', 'conversation_id'}
+        dicts, enough for an ExpansionFrontier to queue what they reference
+        """
+        numeric = [int(i) for i in tweet_ids]
+        tweets = []
+        with self._lock:
+            for i in range(0, len(numeric), LOOKUP_BATCH_SIZE):
+                batch = numeric[i:i + LOOKUP_BATCH_SIZE]
+                sql = f"SELECT id, referenced_ids, conversation_id FROM known_tweets WHERE id IN ({','.join('?' * len(batch))})"
+                for tweet_id, referenced, conversation_id in self.db.execute(sql, batch):
+                    tweets.append({'id': str(tweet_id),
+                                   'referenced_tweets': [{'id': r} for r in (referenced or '').split()],
+                                   'conversation_id': str(conversation_id) if conversation_id else None})
+        return tweets
+
+    def add_missing(self, tweet_ids):
+        now = datetime.datetime.now().isoformat()
+        with self._lock:
+            with self.db:
+                self.db.executemany('''INSERT INTO missing_tweets (id, first_missing_at, last_checked_at) VALUES (?, ?, ?)
+                                       ON CONFLICT (id) DO UPDATE SET last_checked_at = excluded.last_checked_at,
+                                                                      checks = checks + 1''',
+                                    [(int(i), now, now) for i in tweet_ids])
+
+    def missing(self):
+        with self._lock:
+            return [str(row[0]) for row in self.db.execute('SELECT id FROM missing_tweets ORDER BY id')]
+
+    def stats(self):
+        with self._lock:
+            return {'known': self.db.execute('SELECT COUNT(*) FROM known_tweets').fetchone()[0],
+                    'missing': self.db.execute('SELECT COUNT(*) FROM missing_tweets').fetchone()[0]}
@@ -1,9 +1,19 @@
 import logging
 import datetime
 import json
+import time
 from decimal import Decimal
-from searchtweets import gen_request_parameters
+from twesearch.lib.records import compact_tweet, compact_user
+from twesearch.lib.metrics import METRICS
 
+def record_response_metrics(endpoint, resp):
+    """
+    Counts a requests/tweepy response (status, bytes, latency) against endpoint
+    """
+    METRICS.inc('twesearch_api_requests_total', endpoint=endpoint, status=resp.status_code)
+    METRICS.inc('twesearch_api_response_bytes_total', len(resp.content or b''), endpoint=endpoint)
+    if resp.elapsed is not None:
+        METRICS.observe('twesearch_api_request_seconds', resp.elapsed.total_seconds(), endpoint=endpoint)
 
 def defloat(results):
     return json.loads(json.dumps(results), parse_float=Decimal)
@@ -38,34 +48,86 @@ def gen_request(**query_args):
         'results_per_call': 100
     }  
     qa.update(query_args)
+    from searchtweets import gen_request_parameters
     query = gen_request_parameters(**qa)
     return query
         
-def extract_expansions_and_tweets(results, dedupe=True):
-    logging.info("Separating tweets, users and places")
-    counts = {'total_tweets_count': 0, 'dedupe_tweets_count': 0}
+class ResultNormalizer:
+    """
+    Splits message-format results into tweets, users, places and counts in a single pass.
+    Pages can be added one at a time as they arrive; tweets and users are deduped by id as
+    they go (the last copy wins) and stamped with fetched_timestamp in place. With compact,
+    they are kept as TweetRecord/UserRecord instead of dicts, so each page's dicts can be
+    freed as soon as it has been added.
+    """
+
+    def __init__(self, dedupe=True, compact=False):
+        self.dedupe = dedupe
+        self.compact = compact
+        self.timestamp = datetime.datetime.now().isoformat()
+        self.tweets = {} if dedupe else []
+        self.users = {} if dedupe else []
+        self.places = {}
+        self.total_tweets_count = 0
+        self.items_seen = 0
 
-    tweets = [i for i in results if 'text' in i.keys()]
-    expanded_tweets = [t for i in [e['tweets'] for e in results if 'tweets' in e.keys()] for t in i if 'text' in t.keys() ]
-    logging.info(f"Fetched {len(tweets)} from outer list and {len(expanded_tweets)} from Tweet expansions object")
+    def _add_tweet(self, tweet):
+        tweet['fetched_timestamp'] = self.timestamp
+        if self.compact:
+            tweet = compact_tweet(tweet)
+        if self.dedupe:
+            self.tweets[tweet['id']] = tweet
+        else:
+            self.tweets.append(tweet)
 
-    users = [i for i in results if 'username' in i.keys()]
-    expanded_users = [t for i in [e['users'] for e in results if 'users' in e.keys()] for t in i]
-    logging.info(f"Fetched {len(users)} from outer list and {len(expanded_users)} from Users expansion object")
+    def _add_user(self, user):
+        user['fetched_timestamp'] = self.timestamp
+        if self.compact:
+            user = compact_user(user)
+        if self.dedupe:
+            self.users[user['id']] = user
+        else:
+            self.users.append(user)
 
-    tweets = tweets + expanded_tweets
-    if tweets:
-        counts['total_tweets_count'] = sum([x['result_count'] for x in results if 'result_count' in x.keys()])
-        tweets = add_timestamp_to_list_items(tweets)
-        if dedupe:
-            tweets = dedupe_tweets(tweets)
-            counts['dedupe_tweets_count'] = len(tweets)
-        #if defloat:
-        #    tweets = defloat(tweets)
+    def add(self, results):
+        start = time.perf_counter()
+        items_before = self.items_seen
+        for item in results:
+            self.items_seen += 1
+            if 'text' in item:
+                self._add_tweet(item)
+            elif 'username' in item:
+                self._add_user(item)
+            elif 'result_count' in item:
+                self.total_tweets_count += item['result_count']
+            else:
+                # includes object
+                for tweet in item.get('tweets', ()):
+                    if 'text' in tweet:
+                        self._add_tweet(tweet)
+                for user in item.get('users', ()):
+                    self._add_user(user)
+                for place in item.get('places', ()):
+                    self.places[place['id']] = place
+        elapsed = time.perf_counter() - start
+        items = self.items_seen - items_before
+        METRICS.inc('twesearch_extract_records_total', items)
+        METRICS.observe('twesearch_extract_seconds', elapsed)
+        if items and elapsed > 0:
+            METRICS.set('twesearch_extract_records_per_second', round(items / elapsed, 1))
+        return self
 
-    users = users + expanded_users
-    if users:
-        users = add_timestamp_to_list_items(users)
+    def result(self):
+        tweets = list(self.tweets.values()) if self.dedupe else self.tweets
+        users = list(self.users.values()) if self.dedupe else self.users
+        counts = {'total_tweets_count': 0, 'dedupe_tweets_count': 0}
+        if tweets:
+            counts['total_tweets_count'] = self.total_tweets_count
+            if self.dedupe:
+                counts['dedupe_tweets_count'] = len(tweets)
+        logging.info(f"Final stats: {len(tweets)} total tweets, {len(users)} total users, {len(self.places)} places from {self.items_seen} items")
+        return {'tweets': tweets, 'users': users, 'places': list(self.places.values()), 'counts': counts}
 
-    logging.info(f"Final stats: {len(tweets)} total tweets, {len(users)} total users")
-    return {'tweets': tweets, 'users': users, 'counts': counts}
\ No newline at end of file
+def extract_expansions_and_tweets(results, dedupe=True, compact=False):
+    logging.info("Separating tweets, users and places")
+    return ResultNormalizer(dedupe, compact).add(results).result()
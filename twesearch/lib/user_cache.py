@@ -0,0 +1,111 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from twesearch.lib.records import json_default
+
+USER_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    fetched_timestamp TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+'''
+
+
+class UserCache:
+    """
+    Persistent cache of v2 user objects keyed by both id and lowercase username. Backed by
+    SQLite, with an in-memory LRU in front of it. A user counts as fresh while its
+    fetched_timestamp is less than ttl_seconds old. Users are handed out as fresh copies,
+    so callers can modify them without touching the cache.
+    """
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 60 * 60, lru_size=10000):
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._username_ids = {}
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(USER_CACHE_SCHEMA)
+        self.counters = {'hits': 0, 'lru_hits': 0, 'misses': 0, 'stale': 0, 'writes': 0}
+
+    def _remember(self, user_id, username, fetched_timestamp, data):
+        self._lru[user_id] = (username, fetched_timestamp, data)
+        self._lru.move_to_end(user_id)
+        self._username_ids[username] = user_id
+        while len(self._lru) > self.lru_size:
+            _, (old_username, _, _) = self._lru.popitem(last=False)
+            self._username_ids.pop(old_username, None)
+
+    def _is_fresh(self, fetched_timestamp):
+        return datetime.datetime.fromisoformat(fetched_timestamp) > datetime.datetime.now() - self.ttl
+
+    def _lookup(self, identifier, by_username):
+        if by_username:
+            identifier = identifier.lower()
+            user_id = self._username_ids.get(identifier)
+        else:
+            user_id = identifier
+        if user_id in self._lru and (not by_username or self._lru[user_id][0] == identifier):
+            self._lru.move_to_end(user_id)
+            self.counters['lru_hits'] += 1
+            return self._lru[user_id][1:]
+
+        column = 'username' if by_username else 'id'
+        row = self.db.execute(f'SELECT id, username, fetched_timestamp, data FROM users WHERE {column} = ?',
+                              (identifier,)).fetchone()
+        if row is None:
+            return None
+        self._remember(*row)
+        return row[2:]
+
+    def get_many(self, identifiers, by_usernames=False):
+        """
+        Returns (fresh cached users, identifiers that need fetching)
+        """
+        found = []
+        misses = []
+        with self._lock:
+            for identifier in identifiers:
+                entry = self._lookup(identifier, by_usernames)
+                if entry is None:
+                    self.counters['misses'] += 1
+                    misses.append(identifier)
+                elif not self._is_fresh(entry[0]):
+                    self.counters['stale'] += 1
+                    misses.append(identifier)
+                else:
+                    self.counters['hits'] += 1
+                    found.append(json.loads(entry[1]))
+        logging.info(f"User cache: {len(found)} of {len(identifiers)} users fresh in cache")
+        return found, misses
+
+    def get(self, identifier, by_username=False):
+        found, _ = self.get_many([identifier], by_usernames=by_username)
+        return found[0] if found else None
+
+    def put_many(self, users):
+        rows = []
+        with self._lock:
+            for user in users:
+                fetched_timestamp = user.get('fetched_timestamp') or datetime.datetime.now().isoformat()
+                row = (user['id'], user['username'].lower(), fetched_timestamp, json.dumps(user, default=json_default))
+                self._remember(*row)
+                rows.append(row)
+            self.db.executemany('INSERT OR REPLACE INTO users (id, username, fetched_timestamp, data) VALUES (?, ?, ?, ?)', rows)
+            self.db.commit()
+            self.counters['writes'] += len(rows)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
@@ -1,20 +1,46 @@
 import logging
 import sys
 
-def format_tweets_for_neo4j(tweets, users):
+from twesearch.lib.records import Neo4jTweet, TweetRecord
+
+def format_tweets_for_neo4j(tweets, users, compact=None):
+    """
+    Joins each tweet with its author into the tweet_/tweet_author_ prefixed dicts the Neo4j
+    importer reads. With compact (the default when the tweets are TweetRecords) it returns
+    Neo4jTweet views over the tweet and author instead of copying every field
+    """
     print(f'Formatting {len(tweets)} for neo4j ingestion')
+    if compact is None:
+        compact = bool(tweets) and isinstance(tweets[0], TweetRecord)
+    users_by_id = index_by_id(users)
     neo4j_tweets = []
+    missing_author_ids = set()
     for t in tweets:
-        user = [u for u in users if u['id'] == t['author_id']][0]
+        user = users_by_id.get(t.get('author_id'))
+        if user is None:
+            missing_author_ids.add(t.get('author_id'))
+            user = {}
+        if compact:
+            neo4j_tweets.append(Neo4jTweet(t, user))
+            continue
         neo4j_tweet = {}
         for k,v in t.items():
           neo4j_tweet['tweet_' + k] = v
         for k,v in user.items():
           neo4j_tweet['tweet_author_' + k] = v
         neo4j_tweets.append(neo4j_tweet)
+    if missing_author_ids:
+        logging.warning(f"{len(missing_author_ids)} tweet authors were not in the users result set, importing their tweets without author fields: {missing_author_ids}")
     print(f'Formatted {len(neo4j_tweets)} for neo4j ingestion')
     return neo4j_tweets
 
+def index_by_id(items, key='id'):
+    """
+    Utility function to build a dict of items keyed on item[key], so joins against
+    a result set are a single lookup instead of a scan of the whole list
+    """
+    return {item[key]: item for item in items}
+
 def ghetto_split(list_, chunk_size=100):
     """
     Utility function to split a list into a list of lists of size chunk_size
@@ -1,10 +1,18 @@
-from searchtweets import gen_request_parameters, load_credentials, collect_results
-import tweepy
+from searchtweets import gen_request_parameters, load_credentials
 import logging
-from pprint import pprint
+import json
+import requests
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from twesearch.lib.util import ghetto_split, create_stdout_logger
-from twesearch.lib.tweet_util import extract_expansions_and_tweets, gen_request
+from twesearch.lib.util import ghetto_split, create_stdout_logger, index_by_id
+from twesearch.lib.tweet_util import extract_expansions_and_tweets, ResultNormalizer, add_timestamp_to_list_items, record_response_metrics
+from twesearch.lib.result_stream import RateLimitedResultStream
+from twesearch.lib.rate_limiter import RateLimiter
+from twesearch.lib.http_pool import HTTPPool
+from twesearch.lib.reference_graph import ExpansionFrontier, conversation_queries, merge_results
 
 EXPANSIONS = "entities.mentions.username,in_reply_to_user_id,author_id,geo.place_id,\
             referenced_tweets.id.author_id,referenced_tweets.id"
@@ -14,32 +22,164 @@ PLACE_FIELDS = "contained_within,country,country_code,full_name,geo,id,name,plac
 TWEET_FIELDS = "author_id,text,context_annotations,conversation_id,created_at,entities,geo,\
             in_reply_to_user_id,lang,public_metrics,possibly_sensitive,referenced_tweets,source,withheld"
 
+# Markers resolve_users returns in place of a user
+USER_NOT_FOUND = "not_found"
+USER_SUSPENDED = "suspended"
+
+def is_retriable(error):
+    """
+    Whether a failed request is worth repeating: transport errors, 429 and 5xx responses. searchtweets
+    raises a bare HTTPError, without a response, for the 4xx it gives up on, and those are permanent
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and (response.status_code == 429 or response.status_code >= 500)
+    return isinstance(error, requests.exceptions.RequestException)
+
 class Twesearch:
 
-    def __init__(self,log=False, log_level="info", output_format='m'):
+    def __init__(self,log=False, log_level="info", output_format='m', parallelism=1, chunk_retries=3, rate_limits=None, user_cache=None, compact=False, tweet_id_store=None):
         if log:
             self.logger = create_stdout_logger(log_level)
 
         self.output_format = output_format
+        self.parallelism = parallelism
+        self.chunk_retries = chunk_retries
+        self.rate_limiter = RateLimiter(rate_limits)
+        # Optional lib.user_cache.UserCache, consulted by get_users for full-field user lookups
+        self.user_cache = user_cache
+        # Keep message-format tweets and users as lib.records TweetRecord/UserRecord instead of dicts
+        self.compact = compact
+        # Optional lib.tweet_id_store.TweetIdStore, so get_tweets_by_ids skips tweets already fetched or known to be gone
+        self.tweet_id_store = tweet_id_store
 
         self.search_args = load_credentials("~/.twitter_keys.yaml",
                                        yaml_key="search_tweets_v2",
                                        env_overwrite=False)
         self.search_args['output_format'] = self.output_format
 
-        self.tweepy = tweepy.API(tweepy.AppAuthHandler(bearer_token=self.search_args['bearer_token']), 
-                                wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
+        # Every v2 request, and v1 where tweepy lets us, goes over one pool of keep-alive gzip connections.
+        # Create one Twesearch per process and reuse it rather than one per call
+        self.http_pool = HTTPPool(self.search_args['bearer_token'], pool_size=max(parallelism, 10))
+
+        # Created by the tweepy property on the first v1 call
+        self._tweepy = None
+        self._tweepy_lock = threading.Lock()
+
+    @property
+    def tweepy(self):
+        """
+        The tweepy API used for v1 calls. Built on first use, so v2-only runs never import tweepy
+        """
+        with self._tweepy_lock:
+            if self._tweepy is None:
+                import tweepy
+                # Pacing for v1 calls is done by self.rate_limiter through _v1_call, not by tweepy
+                self._tweepy = tweepy.API(tweepy.AppAuthHandler(bearer_token=self.search_args['bearer_token']))
+                if hasattr(self._tweepy, 'session'):
+                    # tweepy signs its own requests, so the pooled session goes without the bearer header
+                    self._tweepy.session = self.http_pool.session(auth=False)
+                else:
+                    logging.debug("This tweepy opens a session per call, v1 requests won't use the connection pool")
+            return self._tweepy
+
+    def close(self):
+        self.http_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def return_search_args(self):
         return self.search_args
 
     def return_tweepy_api(self):
         return self.tweepy
+
+    def rate_limit_stats(self):
+        return self.rate_limiter.stats()
+
+    def user_cache_stats(self):
+        return self.user_cache.stats() if self.user_cache is not None else None
     
+    def resolve_users(self, identifiers, by_usernames=None, parallelism=None):
+        """
+        Resolves any number of usernames or user IDs, packed 100 per users_by_name/users request.
+        Returns {identifier: user dict, USER_NOT_FOUND or USER_SUSPENDED}, keyed by the identifiers
+        as given. With by_usernames=None, all-digit identifiers are looked up as IDs and the rest as usernames.
+        """
+        identifiers = list(dict.fromkeys(identifiers))
+        if by_usernames is None:
+            user_ids = [i for i in identifiers if str(i).isdigit()]
+            usernames = [i for i in identifiers if not str(i).isdigit()]
+        elif by_usernames:
+            user_ids, usernames = [], identifiers
+        else:
+            user_ids, usernames = identifiers, []
+
+        resolved = {}
+        for lookup, api in [(usernames, "users_by_name"), (user_ids, "users")]:
+            if lookup:
+                resolved.update(self._resolve(lookup, api, parallelism))
+
+        not_found = sum(1 for v in resolved.values() if v == USER_NOT_FOUND)
+        suspended = sum(1 for v in resolved.values() if v == USER_SUSPENDED)
+        logging.info(f"Resolved {len(identifiers) - not_found - suspended} of {len(identifiers)} users. {not_found} not found, {suspended} suspended")
+        return resolved
+
+    def _resolve(self, identifiers, api, parallelism=None):
+        by_usernames = api == "users_by_name"
+        def key(identifier):
+            return identifier.lower() if by_usernames else str(identifier)
+
+        resolved = {}
+        requested = identifiers
+        if self.user_cache is not None:
+            cached_users, identifiers = self.user_cache.get_many(identifiers, by_usernames=by_usernames)
+            cached_by_key = {key(u['username'] if by_usernames else u['id']): u for u in cached_users}
+        else:
+            cached_by_key = {}
+
+        def fetch(split):
+            query = gen_request_parameters(
+                api=api,
+                ids=split,
+                expansions='',
+                tweet_fields='',
+                user_fields=USER_FIELDS)
+            # Raw responses, since the message format drops the per-user errors
+            return self._collect(query, api, max_results=len(split) + 100,
+                                 stream_args=dict(self.search_args, output_format='r'))
+
+        responses = self._fetch_chunks(fetch, ghetto_split(identifiers), api, parallelism) if identifiers else []
+        fetched_users = []
+        markers = {}
+        for response in responses:
+            fetched_users.extend(response.get('data') or [])
+            for error in response.get('errors') or []:
+                marker = USER_SUSPENDED if 'suspended' in error.get('detail', '').lower() else USER_NOT_FOUND
+                markers[key(error.get('value') or error.get('resource_id', ''))] = marker
+
+        if fetched_users:
+            fetched_users = add_timestamp_to_list_items(fetched_users)
+            if self.user_cache is not None:
+                self.user_cache.put_many(fetched_users)
+        fetched_by_key = index_by_id(fetched_users, key='username' if by_usernames else 'id')
+        fetched_by_key = {key(k): u for k, u in fetched_by_key.items()}
+
+        for identifier in requested:
+            k = key(identifier)
+            resolved[identifier] = cached_by_key.get(k) or fetched_by_key.get(k) or markers.get(k, USER_NOT_FOUND)
+        return resolved
+
     def username_to_id(self, username):
         logging.info(f"Translating {username} to user ID")
         self.search_args['output_format'] = 'm'
-        user = self.get_users([username], by_usernames=True, user_fields='', expansions='', tweet_fields='')['users']
+        # With a cache, ask for the full user so the answer can be cached and reused
+        user_fields = USER_FIELDS if self.user_cache is not None else ''
+        user = self.get_users([username], by_usernames=True, user_fields=user_fields, expansions='', tweet_fields='')['users']
         self.search_args['output_format'] = self.output_format
         if user:
             user_id = user[0]['id']
@@ -52,7 +192,8 @@ class Twesearch:
     
     def id_to_username(self, user_id):
         logging.info(f"Translating {user_id} to username")
-        username = self.get_users([user_id], by_usernames=False, user_fields='', expansions='', tweet_fields='')['users'][0]['username']
+        user_fields = USER_FIELDS if self.user_cache is not None else ''
+        username = self.get_users([user_id], by_usernames=False, user_fields=user_fields, expansions='', tweet_fields='')['users'][0]['username']
         logging.info(f"ID {user_id} has ID {username}")
         
         return username
@@ -70,10 +211,7 @@ class Twesearch:
             results_per_call=results_per_call,
             **other_query_args)
         logging.info(f"Performing search for {search_query}, returning {results_per_call} results per call. Max of {max_results} results")
-        results = collect_results(query, max_results=max_results, result_stream_args=self.search_args)
-        logging.debug(f"Returned {len(results)} results")
-        if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+        results = self._gather(self._iter_raw_pages(query, "search", results_per_call, max_results, pagination_param='next_token'))
         return results
 
     def get_users_timeline_tweets(self, user_id, user_fields=USER_FIELDS, expansions=EXPANSIONS,
@@ -87,20 +225,35 @@ class Twesearch:
             user_fields=user_fields,
             results_per_call=results_per_call)
         logging.info(f"Fetching timeline for user ID {user_id} returning {results_per_call} results per call")
-        results = collect_results(query, max_results=max_results, result_stream_args=self.search_args)
-        logging.debug(f"Returned {len(results)} results")
-        if self.search_args['output_format'] == 'm':
-                results = extract_expansions_and_tweets(results)
+        results = self._gather(self._iter_raw_pages(query, "timeline", results_per_call, max_results))
         return results
 
     def get_tweets_by_ids(self, tweet_ids, user_fields=USER_FIELDS, expansions=EXPANSIONS,
-                    place_fields=PLACE_FIELDS,tweet_fields=TWEET_FIELDS):
+                    place_fields=PLACE_FIELDS,tweet_fields=TWEET_FIELDS, parallelism=None, known_ids=None, refetch=False):
+        """
+        Hydrates tweet IDs. Duplicate IDs are requested once. Unless refetch is set, IDs in
+        self.tweet_id_store (already fetched, or missing last time) are skipped, and so are the
+        ones known_ids(ids) returns, a callable that checks a sink (Neo4jImporter.existing_tweet_ids
+        for instance). IDs requested but not returned are recorded as missing in the store. The
+        ones returned are not recorded as known here: the caller does that with
+        tweet_id_store.add_known once they are imported or spooled, so a failed write is fetched again.
+        """
+        unique_ids = list(dict.fromkeys(str(i) for i in tweet_ids))
+        to_fetch = unique_ids
+        skipped = 0
+        if not refetch:
+            if self.tweet_id_store is not None:
+                to_fetch, known, missing = self.tweet_id_store.partition(to_fetch)
+                skipped += len(known) + len(missing)
+            if known_ids is not None and to_fetch:
+                stored = set(known_ids(to_fetch))
+                remaining = [i for i in to_fetch if i not in stored]
+                skipped += len(to_fetch) - len(remaining)
+                to_fetch = remaining
+        logging.info(f"Fetching {len(to_fetch)} tweets: {len(tweet_ids)} requested, "
+                     f"{len(tweet_ids) - len(unique_ids)} duplicates, {skipped} already stored or missing")
 
-        logging.info(f"Fetching {len(tweet_ids)} tweets")
-        split_tweet_ids = ghetto_split(tweet_ids)
-        results = []
-        for split in split_tweet_ids:
-            logging.info(f"Requesting {len(split)} tweets of {len(tweet_ids)} tweets. {len(results)} total tweets fetched so far.")
+        def fetch(split):
             query = gen_request_parameters(
                 api="tweets",
                 ids=split,
@@ -108,18 +261,71 @@ class Twesearch:
                 place_fields=place_fields,
                 tweet_fields=tweet_fields,
                 user_fields=user_fields)
-            results.extend(collect_results(query, max_results=len(tweet_ids) + 100, result_stream_args=self.search_args))
+            return self._collect(query, "tweets", max_results=len(split) + 100)
 
-        results = collect_results(query, max_results=len(tweet_ids) + 100, result_stream_args=self.search_args)
-        result_tweet_ids = [i["id"] for i in results if "text" in i.keys()]
-        missing_tweet_ids = [i for i in tweet_ids if i not in result_tweet_ids]
+        results = self._fetch_chunks(fetch, ghetto_split(to_fetch), "tweets", parallelism) if to_fetch else []
+        result_tweet_ids = {i["id"] for i in results if "text" in i.keys()}
+        missing_tweet_ids = [i for i in to_fetch if i not in result_tweet_ids]
 
-        logging.debug(f"Returned {len(results)} tweets out of {len(tweet_ids)} requested tweets")
+        logging.debug(f"Returned {len(result_tweet_ids)} tweets out of {len(to_fetch)} requested tweets")
         logging.debug(f"{len(missing_tweet_ids)} Missing tweets: \n {missing_tweet_ids}")
+        if self.tweet_id_store is not None:
+            self.tweet_id_store.add_missing(missing_tweet_ids)
         if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+            results = extract_expansions_and_tweets(results, compact=self.compact)
+            results['counts'].update({'requested_ids_count': len(tweet_ids), 'skipped_ids_count': skipped,
+                                      'missing_ids_count': len(missing_tweet_ids)})
         return results
 
+    def iter_expansion(self, tweets=(), tweet_ids=(), max_depth=2, max_tweets=None, conversations=False,
+                    conversation_max_results=500, parallelism=None):
+        """
+        Breadth-first expansion of the reply/quote/retweet graph around tweets (already hydrated)
+        and tweet_ids. Each level hydrates the referenced tweets nobody has seen yet with
+        get_tweets_by_ids, 100 IDs per request. Tweets self.tweet_id_store already knows aren't
+        fetched again, the expansion carries on from the references the store kept for them.
+        With conversations it also searches the level's conversations, as many
+        conversation_id: operators OR'ed into each search as fit. Yields one result dict per
+        level, with its depth, so levels can be imported as they arrive. Stops after max_depth
+        levels, when nothing new is referenced, or once max_tweets tweets have been requested. Each
+        level is fetched whole at its own depth; one that doesn't fit in what is left of max_tweets
+        is cut to fit and the rest of it dropped.
+        """
+        if self.search_args['output_format'] != 'm':
+            raise ValueError("iter_expansion needs output_format='m'")
+        frontier = ExpansionFrontier(tweet_ids)
+        frontier.add(tweets)
+        budget = max_tweets
+        for depth in range(1, max_depth + 1):
+            if budget is not None and budget <= 0:
+                frontier.drop()
+                break
+            level_ids = frontier.take(budget)
+            if not level_ids and not (conversations and frontier.conversations):
+                break
+            level = []
+            known = self.tweet_id_store.known_references(level_ids) if self.tweet_id_store is not None and level_ids else []
+            if level_ids:
+                results = self.get_tweets_by_ids(level_ids, parallelism=parallelism)
+                if budget is not None:
+                    counts = results['counts']
+                    budget -= counts['requested_ids_count'] - counts['skipped_ids_count']
+                level.append(results)
+            if conversations:
+                for query in conversation_queries(frontier.take_conversations()):
+                    if budget is not None and budget <= 0:
+                        break
+                    max_results = conversation_max_results if budget is None else min(conversation_max_results, budget)
+                    results = self.search_tweets(query, max_results=max_results)
+                    if budget is not None:
+                        budget -= results['counts']['total_tweets_count']
+                    level.append(results)
+            results = merge_results(level)
+            results['depth'] = depth
+            queued = frontier.add(results['tweets']) + frontier.add(known)
+            logging.info(f"Expansion depth {depth}: {len(results['tweets'])} tweets, {queued} new references queued")
+            yield results
+
     def get_retweeted_by(self, tweet_id, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
                 tweet_fields=TWEET_FIELDS):
 
@@ -130,10 +336,10 @@ class Twesearch:
             expansions=expansions,
             tweet_fields=tweet_fields,
             user_fields=user_fields)
-        results = collect_results(query, result_stream_args=self.search_args)
+        results = self._collect(query, "retweeted_by")
 
         if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+            results = extract_expansions_and_tweets(results, compact=self.compact)
         return results
 
     def get_followers(self, user_id, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
@@ -146,10 +352,7 @@ class Twesearch:
             user_fields=user_fields,
             results_per_call=results_per_call)
         logging.info(f"Performing follower_lookup for {user_id}, returning {results_per_call} results per call. Max of {max_results} results")
-        results = collect_results(query, max_results=max_results, result_stream_args=self.search_args, sleep=sleep)
-        logging.debug(f"Returned {len(results)} results")
-        if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+        results = self._gather(self._iter_raw_pages(query, "followers", results_per_call, max_results, sleep=sleep))
         return results
 
     def get_following(self, user_id, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
@@ -162,14 +365,123 @@ class Twesearch:
             user_fields=user_fields,
             results_per_call=results_per_call)
         logging.info(f"Performing following lookup for {user_id}, returning {results_per_call} results per call. Max of {max_results} results")
-        results = collect_results(query, max_results=max_results, result_stream_args=self.search_args, sleep=sleep)
-        logging.debug(f"Returned {len(results)} results")
-        if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+        results = self._gather(self._iter_raw_pages(query, "following", results_per_call, max_results, sleep=sleep))
         return results
     
+    def iter_search(self, search_query, user_fields=USER_FIELDS, expansions=EXPANSIONS,
+                    place_fields=PLACE_FIELDS, tweet_fields=TWEET_FIELDS, other_query_args = {}, results_per_call=100, max_results=5000):
+        query = gen_request_parameters(
+            api="search",
+            query=search_query,
+            expansions=expansions,
+            place_fields=place_fields,
+            tweet_fields=tweet_fields,
+            user_fields=user_fields,
+            results_per_call=results_per_call,
+            **other_query_args)
+        logging.info(f"Streaming search for {search_query}, {results_per_call} results per page. Max of {max_results} results")
+        yield from self._iter_pages(query, "search", results_per_call, max_results, pagination_param='next_token')
+
+    def iter_timeline(self, user_id, user_fields=USER_FIELDS, expansions=EXPANSIONS,
+                    place_fields=PLACE_FIELDS, tweet_fields=TWEET_FIELDS, results_per_call=100, max_results=10000):
+        query = gen_request_parameters(
+            api="timeline",
+            id=user_id,
+            expansions=expansions,
+            place_fields=place_fields,
+            tweet_fields=tweet_fields,
+            user_fields=user_fields,
+            results_per_call=results_per_call)
+        logging.info(f"Streaming timeline for user ID {user_id}, {results_per_call} results per page. Max of {max_results} results")
+        yield from self._iter_pages(query, "timeline", results_per_call, max_results)
+
+    def iter_followers(self, user_id, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
+                    tweet_fields=TWEET_FIELDS, sleep=0, results_per_call=1000, max_results=5000):
+        query = gen_request_parameters(
+            api="followers",
+            id=user_id,
+            expansions=expansions,
+            tweet_fields=tweet_fields,
+            user_fields=user_fields,
+            results_per_call=results_per_call)
+        logging.info(f"Streaming followers for {user_id}, {results_per_call} results per page. Max of {max_results} results")
+        yield from self._iter_pages(query, "followers", results_per_call, max_results, sleep=sleep)
+
+    def iter_following(self, user_id, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
+                    tweet_fields=TWEET_FIELDS, sleep=0, results_per_call=1000, max_results=5000):
+        query = gen_request_parameters(
+            api="following",
+            id=user_id,
+            expansions=expansions,
+            tweet_fields=tweet_fields,
+            user_fields=user_fields,
+            results_per_call=results_per_call)
+        logging.info(f"Streaming following for {user_id}, {results_per_call} results per page. Max of {max_results} results")
+        yield from self._iter_pages(query, "following", results_per_call, max_results, sleep=sleep)
+
+    def _iter_pages(self, query, api, results_per_call, max_results, pagination_param='pagination_token', sleep=0):
+        """
+        Yields one page at a time, already split into tweets, users and counts, with the token of
+        the page after it in 'next_token' (None on the last page, so a caller can tell a complete
+        fetch from one cut off at max_results). Only the current page is ever held in memory,
+        however large max_results is.
+        """
+        page_args = dict(self.search_args, output_format='m')
+        for page, next_token in self._iter_raw_pages(query, api, results_per_call, max_results, pagination_param,
+                                                     sleep, page_args, with_next_token=True):
+            result = extract_expansions_and_tweets(page, compact=self.compact)
+            result['next_token'] = next_token
+            yield result
+
+    def _iter_raw_pages(self, query, api, results_per_call, max_results, pagination_param='pagination_token', sleep=0, stream_args=None,
+                        with_next_token=False):
+        """
+        Requests one page per stream and yields its results in the stream's output format, following
+        the next token until max_results is reached. Search pages with next_token, the user/timeline
+        endpoints with pagination_token. The rate limiter paces every page, sleep is only extra delay.
+        With with_next_token it yields (page, next token or None) instead.
+        """
+        request_parameters = json.loads(query) if isinstance(query, str) else dict(query)
+        stream_args = stream_args or self.search_args
+        fetched = 0
+        page_num = 0
+        while fetched < max_results:
+            stream = RateLimitedResultStream(self.rate_limiter, api, single_page=True, http_pool=self.http_pool,
+                                             request_parameters=json.dumps(request_parameters),
+                                             max_results=min(results_per_call, max_results - fetched),
+                                             **stream_args)
+            page = list(stream.stream())
+            result_count = (stream.meta or {}).get('result_count', 0)
+            page_num += 1
+            fetched += result_count
+            logging.info(f"Fetched page {page_num} with {result_count} results. {fetched} results fetched so far")
+            yield (page, stream.page_next_token) if with_next_token else page
+
+            if not stream.page_next_token:
+                break
+            request_parameters[pagination_param] = stream.page_next_token
+            if sleep:
+                time.sleep(sleep)
+
+    def _gather(self, pages):
+        """
+        Combines raw pages. In message format each page goes straight into one ResultNormalizer
+        as it arrives instead of all pages being concatenated and split afterwards.
+        """
+        if self.search_args['output_format'] == 'm':
+            normalizer = ResultNormalizer(compact=self.compact)
+            for page in pages:
+                normalizer.add(page)
+            return normalizer.result()
+        return [r for page in pages for r in page]
+
+    def _collect(self, query, api, max_results=1000, stream_args=None):
+        stream = RateLimitedResultStream(self.rate_limiter, api, request_parameters=query, http_pool=self.http_pool,
+                                         max_results=max_results, **(stream_args or self.search_args))
+        return list(stream.stream())
+
     def get_users(self, identifiers, by_usernames=False, user_fields=USER_FIELDS, expansions="pinned_tweet_id",
-                    tweet_fields=TWEET_FIELDS, results_per_call=100):
+                    tweet_fields=TWEET_FIELDS, results_per_call=100, parallelism=None):
         if by_usernames:
             api = "users_by_name"
             log_api_str = "user names"
@@ -178,33 +490,47 @@ class Twesearch:
             log_api_str = "user ids"
 
         logging.info(f"Fetching {len(identifiers)} users by {log_api_str}")
+        # Cached users were fetched with USER_FIELDS, so only serve them for the same fields.
+        # Their pinned tweets aren't cached, so only users fetched now bring those along.
+        use_cache = self.user_cache is not None and user_fields == USER_FIELDS and self.search_args['output_format'] == 'm'
+        cached_users = []
+        if use_cache:
+            cached_users, identifiers = self.user_cache.get_many(identifiers, by_usernames=by_usernames)
+            if not identifiers:
+                return {'tweets': [], 'users': cached_users, 'counts': {'total_tweets_count': 0, 'dedupe_tweets_count': 0}}
         split_identifiers = ghetto_split(identifiers)
-        results = []
-        for split in split_identifiers:
-            logging.info(f"Requesting {len(split)} users of {len(identifiers)} users. {len(results)} total users fetched so far.")
+
+        def fetch(split):
             query = gen_request_parameters(
                 api=api,
                 ids=split,
                 expansions=expansions,
                 tweet_fields=tweet_fields,
                 user_fields=user_fields)
-            results.extend(collect_results(query, max_results=len(identifiers) + 100, result_stream_args=self.search_args))
+            return self._collect(query, api, max_results=len(split) + 100)
+
+        results = self._fetch_chunks(fetch, split_identifiers, api, parallelism)
 
         logging.debug(f"Returned {len(results)} total results")
         if self.search_args['output_format'] == 'm':
-            results = extract_expansions_and_tweets(results)
+            results = extract_expansions_and_tweets(results, compact=self.compact)
+        if use_cache:
+            self.user_cache.put_many(results['users'])
+            results['users'] = cached_users + results['users']
         return results
 
-    def get_users_v1(self, identifiers, by_usernames=False, tweet_mode='extended'):
+    def get_users_v1(self, identifiers, by_usernames=False, tweet_mode='extended', parallelism=None):
         logging.info(f"Fetching {len(identifiers)} users by {'username' if by_usernames else 'user ids'}")
         split_identifiers = ghetto_split(identifiers)
-        results = []
-        for split in split_identifiers:
-            logging.info(f"Requesting {len(split)} users of {len(identifiers)} users. {len(results)} total users fetched so far.")
+
+        def fetch(split):
+            lookup_users = self._v1_call("users/lookup", self.tweepy.lookup_users)
             if by_usernames:
-                results.extend(self.tweepy.lookup_users(screen_names = split, tweet_mode=tweet_mode))
+                return lookup_users(screen_names = split, tweet_mode=tweet_mode)
             else:
-                results.extend(self.tweepy.lookup_users(user_ids = split, tweet_mode=tweet_mode))
+                return lookup_users(user_ids = split, tweet_mode=tweet_mode)
+
+        results = self._fetch_chunks(fetch, split_identifiers, "users/lookup", parallelism)
 
         logging.info(f"Returned {len(results)} users out of {len(identifiers)} requested users")
         return results
@@ -215,20 +541,28 @@ class Twesearch:
         users_v1 = self.get_users_v1(identifiers, by_usernames=by_usernames)
         if len(users_v2['users']) != len(users_v1):
             logging.warning(f"Result number mismatch - users V2 returned {len(users_v2['users'])} results and users V1 returned {len(users_v1)}")
+        users_v2_by_id = index_by_id(users_v2['users'])
         full_user_data = []
+        missing_user_ids = []
         for user_v1 in users_v1:
-            user_v2 = [u for u in users_v2['users'] if u['id'] == user_v1.id_str][0]
+            user_v2 = users_v2_by_id.get(user_v1.id_str)
+            if user_v2 is None:
+                missing_user_ids.append(user_v1.id_str)
+                continue
             user_v2['public_metrics']['likes_count'] = user_v1.favourites_count
             full_user_data.append(user_v2)
+        if missing_user_ids:
+            logging.warning(f"{len(missing_user_ids)} users returned by V1 were missing from the V2 results: {missing_user_ids}")
         results = {'users': full_user_data, 'tweets': users_v2['tweets']}
         logging.info(f"Returned {len(results['users'])} user IDs out of {len(identifiers)} request IDs")
         return results
 
     def get_follower_ids_v1(self, screen_name=None, user_id=None, max_results=None):
+        import tweepy
         logging.info(f"Getting v1 follower ids for {screen_name if screen_name else user_id}")
         follower_list = []
         if screen_name:
-            for page in tweepy.Cursor(self.tweepy.followers_ids, screen_name=screen_name, count=5000).pages():
+            for page in tweepy.Cursor(self._v1_call("followers/ids", self.tweepy.followers_ids), screen_name=screen_name, count=5000).pages():
                 if max_results and len(follower_list) >= max_results:
                     follower_list.extend(page)
                     logging.info(f"Fetched {len(page)} user ids. {len(follower_list)} total IDs have been fetched. Hit max results of {max_results} - breaking.")
@@ -237,16 +571,17 @@ class Twesearch:
                     follower_list.extend(page)
                     logging.info(f"Fetched {len(page)} user ids. {len(follower_list)} total IDs have been fetched.")
         else:
-            for page in tweepy.Cursor(self.tweepy.followers_ids, user_id=user_id, count=5000).pages():
+            for page in tweepy.Cursor(self._v1_call("followers/ids", self.tweepy.followers_ids), user_id=user_id, count=5000).pages():
                 follower_list.extend(page)
                 logging.info(f"Fetched {len(page)} user ids. {len(follower_list)} total IDs have been fetched.")
         return follower_list
 
     def get_following_ids_v1(self, screen_name=None, user_id=None, max_results=None):
+        import tweepy
         logging.info(f"Getting v1 following ids for {screen_name if screen_name else user_id}")
         friend_list = []
         if screen_name:
-            for page in tweepy.Cursor(self.tweepy.friends_ids, screen_name=screen_name, count=5000).pages():
+            for page in tweepy.Cursor(self._v1_call("friends/ids", self.tweepy.friends_ids), screen_name=screen_name, count=5000).pages():
                 if max_results and len(friend_list) >= max_results:
                     friend_list.extend(page)
                     logging.info(f"Fetched {len(page)} user ids. {len(friend_list)} total IDs have been fetched. Hit max results of {max_results} - breaking.")
@@ -255,7 +590,65 @@ class Twesearch:
                     friend_list.extend(page)
                     logging.info(f"Fetched {len(page)} user ids. {len(friend_list)} total IDs have been fetched.")
         else:
-            for page in tweepy.Cursor(self.tweepy.friends_ids, user_id=user_id, count=5000).pages():
+            for page in tweepy.Cursor(self._v1_call("friends/ids", self.tweepy.friends_ids), user_id=user_id, count=5000).pages():
                 friend_list.extend(page)
                 logging.info(f"Fetched {len(page)} user ids. {len(friend_list)} total IDs have been fetched.")
         return friend_list
+
+    def _fetch_chunks(self, fetch, chunks, endpoint, parallelism=None):
+        """
+        Calls fetch(chunk) for every chunk, up to parallelism requests in flight at once, and returns
+        the concatenated results in request order. A chunk that fails with a transport error, 429 or 5xx
+        is retried on its own, anything else (a 4xx, a bug) is raised straight away.
+        """
+        parallelism = parallelism or self.parallelism
+        logging.info(f"Fetching {len(chunks)} chunks from {endpoint}, {parallelism} at a time")
+
+        def fetch_with_retry(numbered_chunk):
+            chunk_num, chunk = numbered_chunk
+            for attempt in range(self.chunk_retries + 1):
+                try:
+                    logging.info(f"Requesting chunk {chunk_num + 1} of {len(chunks)} ({len(chunk)} items) from {endpoint}")
+                    return fetch(chunk)
+                except Exception as e:
+                    if not is_retriable(e):
+                        raise
+                    if attempt == self.chunk_retries:
+                        logging.error(f"Chunk {chunk_num + 1} from {endpoint} failed after {attempt + 1} attempts: {e}")
+                        raise
+                    logging.warning(f"Chunk {chunk_num + 1} from {endpoint} failed, retrying in {2 ** attempt}s: {e}")
+                    time.sleep(2 ** attempt)
+
+        if parallelism > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                chunk_results = list(executor.map(fetch_with_retry, enumerate(chunks)))
+        else:
+            chunk_results = [fetch_with_retry(numbered_chunk) for numbered_chunk in enumerate(chunks)]
+
+        return [r for chunk_result in chunk_results for r in chunk_result]
+
+    def _v1_call(self, resource, method):
+        """
+        Wraps a tweepy API method so every call takes a rate limiter token for resource,
+        resyncs the limiter from the response headers and records the response in the metrics.
+        Keeps tweepy's Cursor attributes.
+        """
+        import tweepy
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            while True:
+                previous_response = getattr(self.tweepy, 'last_response', None)
+                self.rate_limiter.acquire(resource)
+                try:
+                    return method(*args, **kwargs)
+                except tweepy.RateLimitError:
+                    # The headers below zero out the bucket, so the next acquire waits for the reset
+                    logging.warning(f"Rate limited on {resource}, retrying after the window resets")
+                finally:
+                    last_response = getattr(self.tweepy, 'last_response', None)
+                    # A call that never got a response leaves the previous one in place
+                    if last_response is not None and last_response is not previous_response:
+                        self.rate_limiter.update(resource, last_response.headers)
+                        record_response_metrics(resource, last_response)
+        return call